@@ -0,0 +1,330 @@
+"""A thin data-access layer over an asyncpg connection pool.
+
+Queries are written with `:named` parameters, which are rewritten to
+asyncpg's positional `$n` parameters once per distinct query string. As the
+rewritten text is stable, asyncpg's per-connection statement cache reuses
+the prepared statement on every later call.
+
+JSON & JSONB values are encoded & decoded by the driver, so repositories
+read & write them as plain python objects.
+
+Query observers may be given to observe every query's duration, attributed
+to the function which made it (e.g. a repository function).
+"""
+import contextvars
+import functools
+import re
+import sys
+import time
+from collections.abc import AsyncIterator
+from collections.abc import Callable
+from collections.abc import Generator
+from collections.abc import Iterable
+from collections.abc import Mapping
+from collections.abc import Sequence
+from contextlib import asynccontextmanager
+from types import CodeType
+from types import FrameType
+from typing import Any
+
+import asyncpg
+import orjson
+from asyncpg import Record
+
+# `:name`, but not the second half of a `::type` cast
+NAMED_PARAM_PATTERN = re.compile(r"(?<!:):([a-zA-Z_][a-zA-Z0-9_]*)")
+
+# called with the calling function's name, the query & its duration in seconds
+QueryObserver = Callable[[str, str, float], None]
+
+_function_names: dict[CodeType, str] = {}
+
+
+def get_function_name(frame: FrameType) -> str:
+    """The qualified name of the function a frame is executing, e.g.
+    `app.repositories.experiments.fetch_one`."""
+    code = frame.f_code
+    name = _function_names.get(code)
+    if name is None:
+        module = frame.f_globals.get("__name__", "")
+        name = _function_names[code] = f"{module}.{code.co_qualname}"
+    return name
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_query(query: str) -> tuple[str, tuple[str, ...]]:
+    """Rewrite `:named` parameters into positional ones.
+
+    Returns the rewritten query & the parameter names in positional order.
+    """
+    param_names: list[str] = []
+
+    def replace(match: re.Match[str]) -> str:
+        name = match.group(1)
+        if name not in param_names:
+            param_names.append(name)
+        return f"${param_names.index(name) + 1}"
+
+    return NAMED_PARAM_PATTERN.sub(replace, query), tuple(param_names)
+
+
+def _encode_json(value: Any) -> str:
+    return orjson.dumps(value).decode()
+
+
+async def _init_connection(connection: asyncpg.Connection) -> None:
+    for typename in ("json", "jsonb"):
+        await connection.set_type_codec(
+            typename,
+            encoder=_encode_json,
+            decoder=orjson.loads,
+            schema="pg_catalog",
+            format="text",
+        )
+
+
+class Transaction:
+    """A transaction bound to the current task until it completes.
+
+    Queries made through the `Database` by the same task (and any tasks it
+    spawns meanwhile) run within the transaction. May be used either as an
+    async context manager, or started with `await` & ended with an explicit
+    `commit` or `rollback`.
+    """
+
+    def __init__(self, database: "Database") -> None:
+        self._database = database
+        self._connection: asyncpg.Connection | None = None
+        self._transaction: Any = None
+        self._release_connection = False
+        self._token: contextvars.Token[asyncpg.Connection | None] | None = None
+
+    async def start(self) -> "Transaction":
+        connection = self._database._current_connection.get()
+        if connection is None:
+            connection = await self._database._get_pool().acquire()
+            self._release_connection = True
+
+        # asyncpg uses a savepoint if a transaction is already in progress
+        self._connection = connection
+        self._transaction = connection.transaction()
+        try:
+            await self._transaction.start()
+        except BaseException:
+            await self._end()
+            raise
+
+        self._token = self._database._current_connection.set(connection)
+        return self
+
+    async def commit(self) -> None:
+        try:
+            await self._transaction.commit()
+        finally:
+            await self._end()
+
+    async def rollback(self) -> None:
+        try:
+            await self._transaction.rollback()
+        finally:
+            await self._end()
+
+    async def _end(self) -> None:
+        if self._token is not None:
+            self._database._current_connection.reset(self._token)
+            self._token = None
+        if self._release_connection:
+            assert self._connection is not None
+            await self._database._get_pool().release(self._connection)
+            self._release_connection = False
+
+    def __await__(self) -> Generator[Any, None, "Transaction"]:
+        return self.start().__await__()
+
+    async def __aenter__(self) -> "Transaction":
+        return await self.start()
+
+    async def __aexit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        if exc_type is None:
+            await self.commit()
+        else:
+            await self.rollback()
+
+
+class Database:
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = 10,
+        max_size: int = 10,
+        statement_cache_size: int = 100,
+        query_observers: Sequence[QueryObserver] = (),
+    ) -> None:
+        self._dsn = dsn
+        self._min_size = min_size
+        self._max_size = max_size
+        self._statement_cache_size = statement_cache_size
+        self._query_observers = tuple(query_observers)
+        self._pool: asyncpg.Pool | None = None
+        self._current_connection: contextvars.ContextVar[
+            asyncpg.Connection | None
+        ] = contextvars.ContextVar("current_connection", default=None)
+
+    @property
+    def pool(self) -> asyncpg.Pool:
+        return self._get_pool()
+
+    def _get_pool(self) -> asyncpg.Pool:
+        if self._pool is None:
+            raise RuntimeError("Database is not connected")
+        return self._pool
+
+    async def connect(self) -> None:
+        self._pool = await asyncpg.create_pool(
+            self._dsn,
+            min_size=self._min_size,
+            max_size=self._max_size,
+            statement_cache_size=self._statement_cache_size,
+            init=_init_connection,
+        )
+
+    async def disconnect(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[asyncpg.Connection]:
+        """Use the current transaction's connection, or one from the pool."""
+        connection = self._current_connection.get()
+        if connection is not None:
+            yield connection
+        else:
+            async with self._get_pool().acquire() as connection:
+                yield connection
+
+    def transaction(self) -> Transaction:
+        return Transaction(self)
+
+    async def fetch_one(
+        self,
+        query: str,
+        values: Mapping[str, Any] | None = None,
+    ) -> Record | None:
+        caller = self._get_caller()
+        started_at = time.perf_counter()
+        prepared, args = self._prepare(query, values)
+        try:
+            async with self.connection() as connection:
+                return await connection.fetchrow(prepared, *args)
+        finally:
+            self._observe(caller, query, started_at)
+
+    async def fetch_all(
+        self,
+        query: str,
+        values: Mapping[str, Any] | None = None,
+    ) -> list[Record]:
+        caller = self._get_caller()
+        started_at = time.perf_counter()
+        prepared, args = self._prepare(query, values)
+        try:
+            async with self.connection() as connection:
+                return await connection.fetch(prepared, *args)
+        finally:
+            self._observe(caller, query, started_at)
+
+    async def fetch_val(
+        self,
+        query: str,
+        values: Mapping[str, Any] | None = None,
+    ) -> Any:
+        caller = self._get_caller()
+        started_at = time.perf_counter()
+        prepared, args = self._prepare(query, values)
+        try:
+            async with self.connection() as connection:
+                return await connection.fetchval(prepared, *args)
+        finally:
+            self._observe(caller, query, started_at)
+
+    async def fetch_chunks(
+        self,
+        query: str,
+        values: Mapping[str, Any] | None = None,
+        chunk_size: int = 1000,
+    ) -> AsyncIterator[list[Record]]:
+        """Stream a query's rows in chunks through a server-side cursor."""
+        caller = self._get_caller()
+        started_at = time.perf_counter()
+        prepared, args = self._prepare(query, values)
+        try:
+            async with self.connection() as connection:
+                # cursors only live as long as the transaction they're opened in
+                async with connection.transaction():
+                    cursor = await connection.cursor(prepared, *args)
+                    while records := await cursor.fetch(chunk_size):
+                        yield records
+        finally:
+            # including the time the consumer spends on each chunk
+            self._observe(caller, query, started_at)
+
+    async def execute(
+        self,
+        query: str,
+        values: Mapping[str, Any] | None = None,
+    ) -> str:
+        """Execute a query, returning its status (e.g. "INSERT 0 1")."""
+        caller = self._get_caller()
+        started_at = time.perf_counter()
+        prepared, args = self._prepare(query, values)
+        try:
+            async with self.connection() as connection:
+                return await connection.execute(prepared, *args)
+        finally:
+            self._observe(caller, query, started_at)
+
+    async def copy_records_to_table(
+        self,
+        table: str,
+        records: Iterable[Sequence[Any]],
+        columns: Sequence[str],
+    ) -> str:
+        """Bulk load records into a table with COPY, returning its status."""
+        caller = self._get_caller()
+        started_at = time.perf_counter()
+        try:
+            async with self.connection() as connection:
+                return await connection.copy_records_to_table(
+                    table,
+                    records=records,
+                    columns=columns,
+                )
+        finally:
+            self._observe(
+                caller,
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+                started_at,
+            )
+
+    def _get_caller(self) -> str:
+        if not self._query_observers:
+            return ""
+        # the caller of the public method calling this
+        return get_function_name(sys._getframe(2))
+
+    def _observe(self, caller: str, query: str, started_at: float) -> None:
+        if self._query_observers:
+            duration = time.perf_counter() - started_at
+            for observer in self._query_observers:
+                observer(caller, query, duration)
+
+    @staticmethod
+    def _prepare(
+        query: str,
+        values: Mapping[str, Any] | None,
+    ) -> tuple[str, list[Any]]:
+        query, param_names = compile_query(query)
+        if values is None:
+            values = {}
+        return query, [values[name] for name in param_names]
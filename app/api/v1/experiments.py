@@ -1,23 +1,53 @@
+import base64
 import logging
+from collections.abc import AsyncIterator
+from datetime import date
+from typing import Any
 from uuid import UUID
 
 from fastapi import APIRouter
 from fastapi import Depends
+from fastapi import Header
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
 from fastapi import status
+from pydantic import TypeAdapter
 
 from app.api.v1 import responses
 from app.api.v1.responses import Success
 from app.context import HTTPAPIRequestContext
 from app.errors import ServiceError
 from app.models import get_all_set_fields
+from app.models.experiments import EligibleExperimentsBatchInput
+from app.models.experiments import EligibleExperimentsInput
 from app.models.experiments import Experiment
 from app.models.experiments import ExperimentInput
+from app.models.experiments import ExperimentsBucketingSnapshot
+from app.models.experiments import ExperimentStatus
 from app.models.experiments import ExperimentUpdate
+from app.models.experiments import TotalCountMode
+from app.models.experiments import UserEligibleExperiments
 from app.models.experiments import UserExperimentBucketing
+from app.models.exposures import ExperimentExposureCounts
 from app.models.exposures import Exposure
+from app.models.exposures import ExposureBatchItem
+from app.models.exposures import ExposureBatchSummary
 from app.models.exposures import ExposureInput
+from app.models.holdouts import Holdout
+from app.models.holdouts import HoldoutInput
+from app.models.holdouts import HoldoutUpdate
+from app.models.layers import Layer
+from app.models.layers import LayerInput
+from app.models.metric_events import MetricEventBatchSummary
+from app.models.metric_events import MetricEventInput
+from app.models.results import ExperimentResults
 from app.usecases import experiments
 from app.usecases import exposures
+from app.usecases import holdouts
+from app.usecases import layers
+from app.usecases import metric_events
+from app.usecases import results
 
 router = APIRouter(tags=["Experimentation"])
 
@@ -34,8 +64,12 @@ def determine_status_code(error: ServiceError) -> int:
         return status.HTTP_500_INTERNAL_SERVER_ERROR
     elif error is ServiceError.EXPERIMENTS_DELETE_FAILED:
         return status.HTTP_500_INTERNAL_SERVER_ERROR
+    elif error is ServiceError.EXPERIMENTS_ARCHIVE_FAILED:
+        return status.HTTP_500_INTERNAL_SERVER_ERROR
     elif error is ServiceError.EXPERIMENTS_NEEDS_HYPOTHESIS:
         return status.HTTP_400_BAD_REQUEST
+    elif error is ServiceError.EXPERIMENTS_INVALID_HYPOTHESIS:
+        return status.HTTP_400_BAD_REQUEST
     elif error is ServiceError.EXPERIMENTS_NEEDS_EXPOSURE_EVENT:
         return status.HTTP_400_BAD_REQUEST
     elif error is ServiceError.EXPERIMENTS_NEEDS_VARIANTS:
@@ -44,6 +78,12 @@ def determine_status_code(error: ServiceError) -> int:
         return status.HTTP_400_BAD_REQUEST
     elif error is ServiceError.EXPERIMENTS_NEEDS_BUCKETING_SALT:
         return status.HTTP_400_BAD_REQUEST
+    elif error is ServiceError.EXPERIMENTS_NEEDS_LAYER:
+        return status.HTTP_400_BAD_REQUEST
+    elif error is ServiceError.EXPERIMENTS_NEEDS_TRAFFIC_SLICE:
+        return status.HTTP_400_BAD_REQUEST
+    elif error is ServiceError.EXPERIMENTS_TRAFFIC_SLICE_OVERLAP:
+        return status.HTTP_409_CONFLICT
     elif error is ServiceError.EXPERIMENTS_KEY_ALREADY_EXISTS:
         return status.HTTP_409_CONFLICT
     elif error is ServiceError.EXPERIMENTS_VARIANT_MISMATCH:
@@ -52,10 +92,48 @@ def determine_status_code(error: ServiceError) -> int:
         return status.HTTP_400_BAD_REQUEST
     elif error is ServiceError.EXPERIMENTS_INVALID_TRANSITION:
         return status.HTTP_400_BAD_REQUEST
+    elif error is ServiceError.EXPERIMENTS_INVALID_CURSOR:
+        return status.HTTP_400_BAD_REQUEST
+    elif error is ServiceError.EXPERIMENTS_NOT_COMPLETED:
+        return status.HTTP_400_BAD_REQUEST
+    elif error is ServiceError.ASSIGNMENTS_NOT_FOUND:
+        return status.HTTP_404_NOT_FOUND
     elif error is ServiceError.EXPOSURES_TRACK_FAILED:
         return status.HTTP_500_INTERNAL_SERVER_ERROR
     elif error is ServiceError.EXPOSURE_ALREADY_EXISTS:
         return status.HTTP_409_CONFLICT
+    elif error is ServiceError.EXPOSURES_INVALID_BATCH:
+        return status.HTTP_400_BAD_REQUEST
+    elif error is ServiceError.EXPOSURES_BATCH_TOO_LARGE:
+        return status.HTTP_413_CONTENT_TOO_LARGE
+    elif error is ServiceError.EXPOSURES_FETCH_FAILED:
+        return status.HTTP_500_INTERNAL_SERVER_ERROR
+    elif error is ServiceError.LAYERS_CREATE_FAILED:
+        return status.HTTP_500_INTERNAL_SERVER_ERROR
+    elif error is ServiceError.LAYERS_FETCH_FAILED:
+        return status.HTTP_500_INTERNAL_SERVER_ERROR
+    elif error is ServiceError.LAYERS_NOT_FOUND:
+        return status.HTTP_404_NOT_FOUND
+    elif error is ServiceError.LAYERS_KEY_ALREADY_EXISTS:
+        return status.HTTP_409_CONFLICT
+    elif error is ServiceError.HOLDOUTS_CREATE_FAILED:
+        return status.HTTP_500_INTERNAL_SERVER_ERROR
+    elif error is ServiceError.HOLDOUTS_FETCH_FAILED:
+        return status.HTTP_500_INTERNAL_SERVER_ERROR
+    elif error is ServiceError.HOLDOUTS_NOT_FOUND:
+        return status.HTTP_404_NOT_FOUND
+    elif error is ServiceError.HOLDOUTS_UPDATE_FAILED:
+        return status.HTTP_500_INTERNAL_SERVER_ERROR
+    elif error is ServiceError.HOLDOUTS_KEY_ALREADY_EXISTS:
+        return status.HTTP_409_CONFLICT
+    elif error is ServiceError.HOLDOUTS_INVALID_TRANSITION:
+        return status.HTTP_400_BAD_REQUEST
+    elif error is ServiceError.METRIC_EVENTS_TRACK_FAILED:
+        return status.HTTP_500_INTERNAL_SERVER_ERROR
+    elif error is ServiceError.RESULTS_FETCH_FAILED:
+        return status.HTTP_500_INTERNAL_SERVER_ERROR
+    elif error is ServiceError.RESULTS_EXPERIMENT_ARCHIVED:
+        return status.HTTP_400_BAD_REQUEST
     else:
         logging.warning(
             "Unhandled service error code",
@@ -87,19 +165,58 @@ async def create_experiment(
             message="Failed to create resource",
             status=determine_status_code(data),
         )
-    return responses.success(data.model_dump(mode="json"))
+    return responses.success(data)
 
 
 # Called by end users
 
 
+def encode_cursor(rec_id: int) -> str:
+    return base64.urlsafe_b64encode(str(rec_id).encode()).decode()
+
+
+# rec_ids are postgres INTs
+MAX_REC_ID = 2**31 - 1
+
+
+def decode_cursor(cursor: str) -> int | None:
+    try:
+        rec_id = int(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None
+    if not 0 < rec_id <= MAX_REC_ID:
+        return None
+    return rec_id
+
+
 @router.get("/v1/experiments")
 async def fetch_many_experiments(
-    page: int = 1,
-    page_size: int = 50,
+    page_size: int = Query(50, ge=1, le=500),
+    cursor: str | None = None,
+    experiment_status: ExperimentStatus | None = Query(None, alias="status"),
+    total: TotalCountMode = TotalCountMode.EXACT,
+    if_none_match: str | None = Header(None),
     ctx: HTTPAPIRequestContext = Depends(),
 ) -> Success[list[Experiment]]:
-    data = await experiments.fetch_many_experiments(ctx, page, page_size)
+    rec_id_cursor = None
+    if cursor is not None:
+        rec_id_cursor = decode_cursor(cursor)
+        if rec_id_cursor is None:
+            return responses.failure(
+                error=ServiceError.EXPERIMENTS_INVALID_CURSOR,
+                message="Failed to fetch resources",
+                status=determine_status_code(ServiceError.EXPERIMENTS_INVALID_CURSOR),
+            )
+
+    # the page & the collection's version are fetched in a single query,
+    # so a 304 saves serializing & sending the page, not the query
+    data = await experiments.fetch_experiments_page(
+        ctx,
+        page_size=page_size,
+        status=experiment_status,
+        cursor=rec_id_cursor,
+        total_count_mode=total,
+    )
     if isinstance(data, ServiceError):
         return responses.failure(
             error=data,
@@ -107,25 +224,78 @@ async def fetch_many_experiments(
             status=determine_status_code(data),
         )
 
-    count = await experiments.fetch_total_experiments_count(ctx)
-    if isinstance(count, ServiceError):
+    etag = responses.make_etag(
+        data.version,
+        page_size,
+        cursor,
+        experiment_status,
+        total.value,
+    )
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if responses.etag_matches(if_none_match, etag):
+        return responses.not_modified(headers)
+
+    return responses.success(
+        content=data.experiments,
+        headers=headers,
+        meta={
+            "page_size": page_size,
+            "next_cursor": (
+                encode_cursor(data.next_cursor)
+                if data.next_cursor is not None
+                else None
+            ),
+            "total": data.total,
+        },
+    )
+
+
+@router.get("/v1/experiments/snapshot")
+async def fetch_experiments_snapshot(
+    if_none_match: str | None = Header(None),
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[ExperimentsBucketingSnapshot]:
+    """Fetch the bucketing config of all running experiments.
+
+    Meant to be polled by clients that evaluate variants locally.
+    """
+    data = await experiments.fetch_experiments_snapshot(ctx)
+    if isinstance(data, ServiceError):
         return responses.failure(
-            error=count,
-            message="Failed to fetch resources",
-            status=determine_status_code(count),
+            error=data,
+            message="Failed to fetch resource",
+            status=determine_status_code(data),
         )
 
+    headers = {"ETag": data.etag, "Cache-Control": "no-cache"}
+    if responses.etag_matches(if_none_match, data.etag):
+        return responses.not_modified(headers)
+
     return responses.success(
-        content=[d.model_dump(mode="json") for d in data],
-        meta={"page": page, "page_size": page_size, "total": count},
+        data.bucketing_snapshot,
+        headers=headers,
     )
 
 
 @router.get("/v1/experiments/{experiment_id}")
 async def fetch_one_experiment(
     experiment_id: UUID,
+    if_none_match: str | None = Header(None),
     ctx: HTTPAPIRequestContext = Depends(),
 ) -> Success[Experiment]:
+    version = await experiments.fetch_experiment_version(ctx, experiment_id)
+    if isinstance(version, ServiceError):
+        return responses.failure(
+            error=version,
+            message="Failed to fetch resource",
+            status=determine_status_code(version),
+        )
+
+    etag = responses.make_etag(version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if responses.etag_matches(if_none_match, etag):
+        return responses.not_modified(headers)
+
     data = await experiments.fetch_one_experiment(ctx, experiment_id)
     if isinstance(data, ServiceError):
         return responses.failure(
@@ -133,7 +303,7 @@ async def fetch_one_experiment(
             message="Failed to fetch resource",
             status=determine_status_code(data),
         )
-    return responses.success(data.model_dump(mode="json"))
+    return responses.success(data, headers=headers)
 
 
 @router.get("/v1/eligible_experiments")
@@ -149,7 +319,67 @@ async def fetch_and_assign_eligible_experiments(
             status=determine_status_code(data),
         )
 
-    return responses.success([d.model_dump(mode="json") for d in data])
+    return responses.success(data)
+
+
+@router.post("/v1/eligible_experiments")
+async def fetch_and_assign_eligible_experiments_for_attributes(
+    args: EligibleExperimentsInput,
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[list[UserExperimentBucketing]]:
+    """Like `GET /v1/eligible_experiments`, but targeting the user by their
+    attributes."""
+    data = await experiments.fetch_and_assign_eligible_experiments(
+        ctx,
+        args.user_id,
+        args.attributes,
+    )
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to fetch resources",
+            status=determine_status_code(data),
+        )
+
+    return responses.success(data)
+
+
+@router.post("/v1/eligible_experiments:batch")
+async def fetch_and_assign_eligible_experiments_batch(
+    args: EligibleExperimentsBatchInput,
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Response:
+    """Stream a line of NDJSON per user, with the experiments they're in.
+
+    Users are assigned & streamed a chunk at a time. If a chunk fails after
+    the response has started, the stream ends with an error line.
+    """
+    chunks = experiments.stream_eligible_experiments_for_users(
+        ctx,
+        args.user_ids,
+        args.attributes,
+    )
+    # the first chunk is handled before responding, so that failures such
+    # as the experiments failing to load still get an error status
+    data = await anext(chunks, [])
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to fetch resources",
+            status=determine_status_code(data),
+        )
+
+    first_chunk: list[UserEligibleExperiments] = data
+
+    async def stream_chunks() -> AsyncIterator[list[Any]]:
+        yield first_chunk
+        async for chunk in chunks:
+            if isinstance(chunk, ServiceError):
+                yield [responses.failure_content(chunk, "Failed to fetch resources")]
+                return
+            yield chunk
+
+    return responses.stream(stream_chunks())
 
 
 @router.patch("/v1/experiments/{experiment_id}")
@@ -169,7 +399,122 @@ async def partial_update_experiment(
             message="Failed to update resource",
             status=determine_status_code(data),
         )
-    return responses.success(data.model_dump(mode="json"))
+    return responses.success(data)
+
+
+@router.post("/v1/experiments/{experiment_id}:archive")
+async def archive_experiment(
+    experiment_id: UUID,
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[Experiment]:
+    """Archive a completed experiment's assignments & exposures."""
+    data = await experiments.archive(ctx, experiment_id)
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to archive resource",
+            status=determine_status_code(data),
+        )
+
+    return responses.success(data)
+
+
+@router.post("/v1/layers")
+async def create_layer(
+    args: LayerInput,
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[Layer]:
+    data = await layers.create(ctx, args.layer_name, args.layer_key)
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to create resource",
+            status=determine_status_code(data),
+        )
+    return responses.success(data)
+
+
+@router.get("/v1/layers")
+async def fetch_many_layers(
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[list[Layer]]:
+    data = await layers.fetch_many(ctx)
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to fetch resources",
+            status=determine_status_code(data),
+        )
+    return responses.success(data)
+
+
+@router.get("/v1/layers/{layer_id}")
+async def fetch_one_layer(
+    layer_id: UUID,
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[Layer]:
+    data = await layers.fetch_one(ctx, layer_id)
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to fetch resource",
+            status=determine_status_code(data),
+        )
+    return responses.success(data)
+
+
+@router.post("/v1/holdouts")
+async def create_holdout(
+    args: HoldoutInput,
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[Holdout]:
+    data = await holdouts.create(
+        ctx,
+        args.holdout_name,
+        args.holdout_key,
+        args.traffic,
+    )
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to create resource",
+            status=determine_status_code(data),
+        )
+    return responses.success(data)
+
+
+@router.get("/v1/holdouts")
+async def fetch_many_holdouts(
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[list[Holdout]]:
+    data = await holdouts.fetch_many(ctx)
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to fetch resources",
+            status=determine_status_code(data),
+        )
+    return responses.success(data)
+
+
+@router.patch("/v1/holdouts/{holdout_id}")
+async def partial_update_holdout(
+    holdout_id: UUID,
+    args: HoldoutUpdate,
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[Holdout]:
+    data = await holdouts.partial_update(
+        ctx,
+        holdout_id,
+        **get_all_set_fields(args),
+    )
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to update resource",
+            status=determine_status_code(data),
+        )
+    return responses.success(data)
 
 
 @router.post("/v1/experiments/{experiment_id}/exposures")
@@ -190,4 +535,117 @@ async def track_exposure(
             status=determine_status_code(data),
         )
 
-    return responses.success(data.model_dump(mode="json"))
+    return responses.success(data)
+
+
+@router.get("/v1/experiments/{experiment_id}/exposure_counts")
+async def fetch_exposure_counts(
+    experiment_id: UUID,
+    since: date | None = None,
+    until: date | None = None,
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[ExperimentExposureCounts]:
+    """Fetch the number of users exposed to each variant, per (utc) day."""
+    data = await exposures.fetch_exposure_counts(ctx, experiment_id, since, until)
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to fetch resource",
+            status=determine_status_code(data),
+        )
+
+    return responses.success(data)
+
+
+exposure_batch_adapter = TypeAdapter(list[ExposureBatchItem])
+
+
+async def read_exposure_batch(request: Request) -> AsyncIterator[ExposureBatchItem]:
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        # parse each line as it arrives, so an oversized batch is rejected
+        # without reading the rest of the body
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield ExposureBatchItem.model_validate_json(line)
+        if buffer.strip():
+            yield ExposureBatchItem.model_validate_json(buffer)
+    else:
+        for item in exposure_batch_adapter.validate_json(await request.body()):
+            yield item
+
+
+@router.post("/v1/exposures:batch")
+async def track_exposures(
+    request: Request,
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[ExposureBatchSummary]:
+    """Track a JSON array or NDJSON stream of up to 50,000 exposures.
+
+    The whole batch is validated before any of it is tracked, & is tracked
+    in a single transaction.
+    """
+    data = await exposures.track_exposures(ctx, read_exposure_batch(request))
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to track exposures",
+            status=determine_status_code(data),
+        )
+
+    return responses.success(data)
+
+
+@router.post("/v1/metric_events:batch")
+async def track_metric_events(
+    args: list[MetricEventInput],
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[MetricEventBatchSummary]:
+    data = await metric_events.track_metric_events(ctx, args)
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to track metric events",
+            status=determine_status_code(data),
+        )
+
+    return responses.success(data)
+
+
+@router.get("/v1/experiments/{experiment_id}/results")
+async def fetch_experiment_results(
+    experiment_id: UUID,
+    confidence_level: float = Query(0.95, gt=0, lt=1),
+    recompute: bool = False,
+    ctx: HTTPAPIRequestContext = Depends(),
+) -> Success[ExperimentResults]:
+    """Compute the results of each of the experiment's metric effects.
+
+    Aggregates are persisted & only updated with what changed since they
+    were last computed; `recompute` rebuilds them from scratch.
+
+    When an event store is configured, results are computed by scanning it
+    on every request instead; the persisted aggregates & `recompute` are
+    ignored.
+
+    Archived experiments' exposures are detached, so their results can only
+    be served from the aggregates persisted before they were archived;
+    recomputing them is rejected.
+    """
+    data = await results.fetch_experiment_results(
+        ctx,
+        experiment_id,
+        confidence_level=confidence_level,
+        recompute=recompute,
+    )
+    if isinstance(data, ServiceError):
+        return responses.failure(
+            error=data,
+            message="Failed to fetch resource",
+            status=determine_status_code(data),
+        )
+
+    return responses.success(data)
@@ -1,17 +1,44 @@
+import hashlib
+from collections.abc import AsyncIterable
+from collections.abc import AsyncIterator
+from collections.abc import Iterable
 from typing import Any
 from typing import Generic
 from typing import Literal
 from typing import TypeVar
 
+import orjson
 from fastapi import status
 from fastapi.responses import JSONResponse
+from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
+from app import metrics
 from app.errors import ServiceError
 
 T = TypeVar("T")
 
 
+def _serialize_default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    # orjson natively handles the datetimes, uuids, enums & dataclasses
+    # that pydantic's python-mode dumps contain
+    return orjson.dumps(content, default=_serialize_default)
+
+
+class ORJSONResponse(JSONResponse):
+    """A JSON response which serializes pydantic models directly."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
 class Success(BaseModel, Generic[T]):
     status: Literal["success"]
     data: T
@@ -27,7 +54,42 @@ def success(
     if meta is None:
         meta = {}
     data = {"status": "success", "data": content, "meta": meta}
-    return JSONResponse(data, status, headers)
+    return ORJSONResponse(data, status, headers)
+
+
+def not_modified(headers: dict[str, str] | None = None) -> Any:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+def make_etag(*parts: object) -> str:
+    digest = hashlib.sha256(":".join(str(p) for p in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison, as specified for If-None-Match
+    return any(
+        candidate.strip().removeprefix("W/") == etag.removeprefix("W/")
+        for candidate in if_none_match.split(",")
+    )
+
+
+def stream(
+    chunks: AsyncIterable[Iterable[Any]],
+    status: int = status.HTTP_200_OK,
+    headers: dict[str, str] | None = None,
+) -> Any:
+    """Stream a line of NDJSON per item, sending each chunk once it's ready."""
+
+    async def lines() -> AsyncIterator[bytes]:
+        async for items in chunks:
+            yield b"".join(dumps(item) + b"\n" for item in items)
+
+    return StreamingResponse(lines(), status, headers, "application/x-ndjson")
 
 
 class Failure(BaseModel):
@@ -42,5 +104,9 @@ def failure(
     status: int = status.HTTP_400_BAD_REQUEST,
     headers: dict[str, str] | None = None,
 ) -> Any:
-    data = {"status": "error", "error": error.value, "message": message}
-    return JSONResponse(data, status, headers)
+    return ORJSONResponse(failure_content(error, message), status, headers)
+
+
+def failure_content(error: ServiceError, message: str) -> dict[str, Any]:
+    metrics.count_service_error(error)
+    return {"status": "error", "error": error.value, "message": message}
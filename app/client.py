@@ -0,0 +1,142 @@
+"""A client which evaluates experiment variants in-process.
+
+It polls `GET /v1/experiments/snapshot` (with conditional requests, so an
+unchanged snapshot costs a 304) and buckets users with the same
+`BucketingEvaluator` the server uses. Layers, holdouts & user segments are
+resolved with the server's `EligibilityIndex`, so users are only given
+variants of the experiments they're actually in; pass the user's attributes
+to be targeted by them.
+
+Only stateless experiments are evaluated locally; sticky experiments may
+hold a persisted variant that differs from the computed one, so those must
+still be fetched from `/v1/eligible_experiments`.
+
+    client = ExperimentationClient("http://experimentation:8000")
+    await client.start()
+    variant_name = client.get_variant(
+        "new_checkout_flow",
+        user_id,
+        attributes={"country": "de"},
+    )
+"""
+import asyncio
+import logging
+from uuid import UUID
+
+import httpx
+
+from app.distribution import BucketingEvaluator
+from app.distribution import EligibilityIndex
+from app.models.experiments import EvaluationMode
+from app.models.experiments import ExperimentsBucketingSnapshot
+from app.targeting import UserAttributes
+
+
+class ExperimentationClient:
+    def __init__(
+        self,
+        base_url: str,
+        poll_interval: float = 30.0,
+        http_client: httpx.AsyncClient | None = None,
+    ) -> None:
+        self._poll_interval = poll_interval
+        self._http_client = http_client or httpx.AsyncClient(base_url=base_url)
+        self._etag: str | None = None
+        self._evaluators: dict[str, BucketingEvaluator] = {}
+        self._experiment_ids: dict[str, UUID] = {}
+        self._eligibility_index: EligibilityIndex | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    async def start(self) -> None:
+        await self.refresh()
+        self._task = asyncio.create_task(self._poll())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        await self._http_client.aclose()
+
+    async def refresh(self) -> bool:
+        """Fetch the latest snapshot; returns whether it changed."""
+        headers = {}
+        if self._etag is not None:
+            headers["If-None-Match"] = self._etag
+
+        response = await self._http_client.get(
+            "/v1/experiments/snapshot",
+            headers=headers,
+        )
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+
+        snapshot = ExperimentsBucketingSnapshot.model_validate(response.json()["data"])
+        self._evaluators = {
+            experiment.key: BucketingEvaluator(
+                experiment.bucketing_salt,
+                experiment.variant_names,
+                experiment.cumulative_allocation,
+            )
+            for experiment in snapshot.experiments
+            if experiment.evaluation_mode is EvaluationMode.STATELESS
+        }
+        self._experiment_ids = {
+            experiment.key: experiment.experiment_id
+            for experiment in snapshot.experiments
+        }
+        self._eligibility_index = EligibilityIndex(snapshot)
+        self._etag = response.headers.get("ETag")
+        return True
+
+    def get_variant(
+        self,
+        experiment_key: str,
+        user_id: str,
+        attributes: UserAttributes | None = None,
+    ) -> str | None:
+        """Get the user's variant, if the experiment can be evaluated locally."""
+        evaluator = self._evaluators.get(experiment_key)
+        if evaluator is None or not self._is_user_eligible(
+            experiment_key,
+            user_id,
+            attributes,
+        ):
+            return None
+        return evaluator.get_user_variant(user_id)
+
+    def get_variants(
+        self,
+        user_id: str,
+        attributes: UserAttributes | None = None,
+    ) -> dict[str, str]:
+        return {
+            experiment_key: evaluator.get_user_variant(user_id)
+            for experiment_key, evaluator in self._evaluators.items()
+            if self._is_user_eligible(experiment_key, user_id, attributes)
+        }
+
+    def _is_user_eligible(
+        self,
+        experiment_key: str,
+        user_id: str,
+        attributes: UserAttributes | None,
+    ) -> bool:
+        assert self._eligibility_index is not None
+        return self._eligibility_index.is_user_eligible(
+            self._experiment_ids[experiment_key],
+            user_id,
+            # as on the server, users without attributes have none
+            attributes if attributes is not None else {},
+        )
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            try:
+                await self.refresh()
+            except Exception as exc:
+                # keep serving the last snapshot we successfully fetched
+                logging.warning(
+                    "Failed to refresh the experiments snapshot",
+                    exc_info=exc,
+                )
@@ -1,15 +1,32 @@
 from abc import ABC
 from abc import abstractproperty
 
-from databases import Database
+from fastapi import FastAPI
 from fastapi import Request
 
+from app.adapters.database import Database
+from app.event_store import EventStore
+from app.exposure_writer import ExposureWriter
+from app.snapshots import ExperimentsSnapshotCache
+
 
 class AbstractContext(ABC):
     @abstractproperty
     def database(self) -> Database:
         ...
 
+    @abstractproperty
+    def experiments_snapshot(self) -> ExperimentsSnapshotCache:
+        ...
+
+    @abstractproperty
+    def exposure_writer(self) -> ExposureWriter | None:
+        ...
+
+    @abstractproperty
+    def event_store(self) -> EventStore | None:
+        ...
+
 
 class HTTPAPIRequestContext(AbstractContext):
     def __init__(self, request: Request) -> None:
@@ -18,3 +35,36 @@ class HTTPAPIRequestContext(AbstractContext):
     @property
     def database(self) -> Database:
         return self._request.app.state.database
+
+    @property
+    def experiments_snapshot(self) -> ExperimentsSnapshotCache:
+        return self._request.app.state.experiments_snapshot
+
+    @property
+    def exposure_writer(self) -> ExposureWriter | None:
+        return self._request.app.state.exposure_writer
+
+    @property
+    def event_store(self) -> EventStore | None:
+        return self._request.app.state.event_store
+
+
+class BackgroundTaskContext(AbstractContext):
+    def __init__(self, app: FastAPI) -> None:
+        self._app = app
+
+    @property
+    def database(self) -> Database:
+        return self._app.state.database
+
+    @property
+    def experiments_snapshot(self) -> ExperimentsSnapshotCache:
+        return self._app.state.experiments_snapshot
+
+    @property
+    def exposure_writer(self) -> ExposureWriter | None:
+        return self._app.state.exposure_writer
+
+    @property
+    def event_store(self) -> EventStore | None:
+        return self._app.state.event_store
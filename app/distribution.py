@@ -1,6 +1,20 @@
+import bisect
+import functools
 import hashlib
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from uuid import UUID
+
+import numpy as np
+import numpy.typing as npt
 
 from app.models.experiments import Experiment
+from app.models.experiments import ExperimentsBucketingSnapshot
+from app.models.layers import LAYER_BUCKETS
+from app.targeting import TargetingIndex
+from app.targeting import UserAttributes
+
+BUCKET_SPACE = 2**128
 
 
 def normalize_value(value: str) -> float:
@@ -19,3 +33,284 @@ def get_user_variant(experiment: Experiment, user_id: str) -> str:
             return variant_name
 
     raise ValueError("Bucket weights do not sum to 1.0")
+
+
+def get_cumulative_allocation(variant_allocation: dict[str, float]) -> list[float]:
+    cumulative_allocation = []
+    cumulative_weight = 0.0
+    for weight in variant_allocation.values():
+        cumulative_weight += weight
+        cumulative_allocation.append(cumulative_weight)
+    return cumulative_allocation
+
+
+def get_bucket_boundary(cumulative_weight: float) -> int:
+    """Find the first bucket whose normalized value is not below the weight."""
+    # `normalize_value` rounds bucket / 2**128 to the nearest float, so the
+    # boundary isn't simply cumulative_weight * 2**128; search for it using
+    # the exact same comparison that `get_user_variant` makes.
+    low, high = 0, BUCKET_SPACE
+    while low < high:
+        middle = (low + high) // 2
+        if middle / BUCKET_SPACE < cumulative_weight:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class BucketingEvaluator:
+    """Buckets users into variants the same way as `get_user_variant`.
+
+    All of the per-experiment work (hashing the salt, accumulating weights)
+    is done once up front, leaving a hash & a binary search per user.
+    """
+
+    __slots__ = ("_salted_hash", "_variant_names", "_boundaries")
+
+    def __init__(
+        self,
+        bucketing_salt: str,
+        variant_names: Sequence[str],
+        cumulative_allocation: Sequence[float],
+    ) -> None:
+        self._salted_hash = hashlib.md5(f"{bucketing_salt}:".encode("utf-8"))
+        self._variant_names = tuple(variant_names)
+        self._boundaries = [get_bucket_boundary(w) for w in cumulative_allocation]
+
+    @property
+    def variant_names(self) -> tuple[str, ...]:
+        return self._variant_names
+
+    @property
+    def boundaries(self) -> list[int]:
+        return self._boundaries
+
+    def get_bucket(self, user_id: str) -> int:
+        user_hash = self._salted_hash.copy()
+        user_hash.update(user_id.encode("utf-8"))
+        return int.from_bytes(user_hash.digest(), "big")
+
+    def get_variant_index(self, bucket: int) -> int:
+        index = bisect.bisect_right(self._boundaries, bucket)
+        if index == len(self._boundaries):
+            raise ValueError("Bucket weights do not sum to 1.0")
+        return index
+
+    def get_user_variant(self, user_id: str) -> str:
+        return self._variant_names[self.get_variant_index(self.get_bucket(user_id))]
+
+    def get_variant_indices(self, user_ids: Sequence[str]) -> npt.NDArray[np.intp]:
+        """Bucket many users at once; equivalent to `get_variant_index`."""
+        salted_hash = self._salted_hash
+        digests = bytearray()
+        for user_id in user_ids:
+            user_hash = salted_hash.copy()
+            user_hash.update(user_id.encode("utf-8"))
+            digests += user_hash.digest()
+
+        # numpy has no 128-bit integers, so compare the high 64 bits of each
+        # bucket against the high 64 bits of the boundaries. that's exact
+        # unless the high bits are equal, which we fall back to python for.
+        buckets = np.frombuffer(digests, dtype=">u8").reshape(-1, 2)
+        high_bits = buckets[:, 0].astype(np.uint64)
+        boundary_high_bits = np.array(
+            [min(b >> 64, 2**64 - 1) for b in self._boundaries],
+            dtype=np.uint64,
+        )
+        indices = np.searchsorted(boundary_high_bits, high_bits, side="right")
+
+        for i in np.flatnonzero(np.isin(high_bits, boundary_high_bits)):
+            indices[i] = bisect.bisect_right(
+                self._boundaries,
+                int.from_bytes(digests[i * 16 : (i + 1) * 16], "big"),
+            )
+
+        if np.any(indices == len(self._boundaries)):
+            raise ValueError("Bucket weights do not sum to 1.0")
+        return indices
+
+
+def get_layer_bucket(bucketing_salt: str, user_id: str) -> int:
+    """Hash a user into one of a layer's (or holdout's) buckets."""
+    digest = hashlib.md5(f"{bucketing_salt}:{user_id}".encode("utf-8")).digest()
+    return int.from_bytes(digest, "big") % LAYER_BUCKETS
+
+
+class EligibilityIndex:
+    """Resolves which of a snapshot's experiments a user is in.
+
+    Each layer's buckets are mapped to the experiment whose traffic slice
+    covers them up front, so evaluating a user costs a hash per layer &
+    holdout, rather than a check of every running experiment. Only the
+    experiments left are checked against the user's attributes.
+    """
+
+    __slots__ = (
+        "_indices",
+        "_holdouts",
+        "_unlayered",
+        "_layers",
+        "_experiment_layers",
+        "_targeting",
+    )
+
+    def __init__(self, snapshot: ExperimentsBucketingSnapshot) -> None:
+        self._indices = {
+            experiment.experiment_id: index
+            for index, experiment in enumerate(snapshot.experiments)
+        }
+        self._holdouts = [
+            (holdout.bucketing_salt, holdout.traffic)
+            for holdout in snapshot.holdouts
+            if holdout.traffic > 0
+        ]
+        self._unlayered = [
+            index
+            for index, experiment in enumerate(snapshot.experiments)
+            if experiment.layer_id is None
+        ]
+
+        # the index of the experiment which owns each bucket, or -1
+        bucket_owners = {
+            layer.layer_id: [-1] * LAYER_BUCKETS for layer in snapshot.layers
+        }
+        for index, experiment in enumerate(snapshot.experiments):
+            if experiment.layer_id is None or experiment.traffic_slice is None:
+                continue
+            owners = bucket_owners.get(experiment.layer_id)
+            if owners is None:
+                continue
+            # slices are validated to be disjoint; should they overlap
+            # anyway, the experiment listed first keeps the buckets
+            for bucket in range(
+                experiment.traffic_slice.start,
+                experiment.traffic_slice.end,
+            ):
+                if owners[bucket] == -1:
+                    owners[bucket] = index
+
+        self._layers = [
+            (layer.bucketing_salt, bucket_owners[layer.layer_id])
+            for layer in snapshot.layers
+        ]
+        # the position in `_layers` of each layered experiment's layer
+        layer_positions = {
+            layer.layer_id: position for position, layer in enumerate(snapshot.layers)
+        }
+        self._experiment_layers = {
+            index: layer_positions[experiment.layer_id]
+            for index, experiment in enumerate(snapshot.experiments)
+            if experiment.layer_id in layer_positions
+        }
+        self._targeting = TargetingIndex(
+            [experiment.user_segments for experiment in snapshot.experiments]
+        )
+
+    def _is_held_out(self, user_id: str) -> bool:
+        return any(
+            get_layer_bucket(bucketing_salt, user_id) < traffic
+            for bucketing_salt, traffic in self._holdouts
+        )
+
+    def get_experiment_indices(
+        self,
+        user_id: str,
+        attributes: UserAttributes,
+    ) -> list[int]:
+        """Get the indices of the snapshot's experiments the user is in."""
+        if self._is_held_out(user_id):
+            return []
+
+        indices = self._unlayered.copy()
+        for bucketing_salt, owners in self._layers:
+            index = owners[get_layer_bucket(bucketing_salt, user_id)]
+            if index != -1:
+                indices.append(index)
+
+        # in the same order as the snapshot's experiments
+        indices.sort()
+        return self._targeting.get_audience(indices, attributes)
+
+    def is_user_eligible(
+        self,
+        experiment_id: UUID,
+        user_id: str,
+        attributes: UserAttributes | None = None,
+    ) -> bool:
+        """Check whether the user is in one of the snapshot's experiments.
+
+        Targeting is only checked if the user's attributes are given.
+        """
+        index = self._indices.get(experiment_id)
+        if index is None or self._is_held_out(user_id):
+            return False
+
+        position = self._experiment_layers.get(index)
+        if position is not None:
+            bucketing_salt, owners = self._layers[position]
+            if owners[get_layer_bucket(bucketing_salt, user_id)] != index:
+                return False
+        elif index not in self._unlayered:
+            # layered experiments whose layer is missing get no traffic
+            return False
+
+        return attributes is None or self._targeting.is_in_audience(
+            index,
+            self._targeting.get_matched_filters(attributes),
+        )
+
+
+def compile_experiment(experiment: Experiment) -> BucketingEvaluator:
+    return BucketingEvaluator(
+        experiment.bucketing_salt,
+        list(experiment.variant_allocation),
+        get_cumulative_allocation(experiment.variant_allocation),
+    )
+
+
+def _get_variant_indices(
+    bucketing_salt: str,
+    variant_names: Sequence[str],
+    cumulative_allocation: Sequence[float],
+    user_ids: Sequence[str],
+) -> npt.NDArray[np.intp]:
+    evaluator = BucketingEvaluator(
+        bucketing_salt,
+        variant_names,
+        cumulative_allocation,
+    )
+    return evaluator.get_variant_indices(user_ids)
+
+
+def bucket_many(
+    experiment: Experiment,
+    user_ids: Sequence[str],
+    chunk_size: int = 100_000,
+    max_workers: int | None = 1,
+) -> list[str]:
+    """Assign many users to variants; equivalent to `get_user_variant`.
+
+    With `max_workers` other than 1, chunks are spread across a process
+    pool (`None` uses one process per cpu).
+    """
+    variant_names = list(experiment.variant_allocation)
+    get_variant_indices = functools.partial(
+        _get_variant_indices,
+        experiment.bucketing_salt,
+        variant_names,
+        get_cumulative_allocation(experiment.variant_allocation),
+    )
+    chunks = [user_ids[i : i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+
+    if max_workers == 1:
+        results = [get_variant_indices(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers) as executor:
+            results = list(executor.map(get_variant_indices, chunks))
+
+    if not results:
+        return []
+
+    names = np.array(variant_names, dtype=object)
+    return names[np.concatenate(results)].tolist()
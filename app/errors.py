@@ -7,12 +7,17 @@ class ServiceError(Enum):
     EXPERIMENTS_NOT_FOUND = "experiments.not_found"
     EXPERIMENTS_UPDATE_FAILED = "experiments.update_failed"
     EXPERIMENTS_DELETE_FAILED = "experiments.delete_failed"
+    EXPERIMENTS_ARCHIVE_FAILED = "experiments.archive_failed"
 
     EXPERIMENTS_NEEDS_HYPOTHESIS = "experiments.needs_hypothesis"
+    EXPERIMENTS_INVALID_HYPOTHESIS = "experiments.invalid_hypothesis"
     EXPERIMENTS_NEEDS_EXPOSURE_EVENT = "experiments.needs_exposure_event"
     EXPERIMENTS_NEEDS_VARIANTS = "experiments.needs_variants"
     EXPERIMENTS_NEEDS_VARIANT_ALLOCATION = "experiments.needs_variant_allocation"
     EXPERIMENTS_NEEDS_BUCKETING_SALT = "experiments.needs_bucketing_salt"
+    EXPERIMENTS_NEEDS_LAYER = "experiments.needs_layer"
+    EXPERIMENTS_NEEDS_TRAFFIC_SLICE = "experiments.needs_traffic_slice"
+    EXPERIMENTS_TRAFFIC_SLICE_OVERLAP = "experiments.traffic_slice_overlap"
 
     EXPERIMENTS_KEY_ALREADY_EXISTS = "experiments.key_already_exists"
     EXPERIMENTS_VARIANT_MISMATCH = (
@@ -21,8 +26,30 @@ class ServiceError(Enum):
     EXPERIMENTS_INVALID_VARIANT_ALLOCATION = "experiments.invalid_variant_allocation"
 
     EXPERIMENTS_INVALID_TRANSITION = "experiments.invalid_transition"
+    EXPERIMENTS_INVALID_CURSOR = "experiments.invalid_cursor"
+    EXPERIMENTS_NOT_COMPLETED = "experiments.not_completed"
 
     EXPOSURES_TRACK_FAILED = "exposures.track_failed"
     EXPOSURE_ALREADY_EXISTS = "exposures.already_exists"
+    EXPOSURES_INVALID_BATCH = "exposures.invalid_batch"
+    EXPOSURES_BATCH_TOO_LARGE = "exposures.batch_too_large"
+    EXPOSURES_FETCH_FAILED = "exposures.fetch_failed"
 
     ASSIGNMENTS_NOT_FOUND = "assignments.not_found"
+
+    LAYERS_CREATE_FAILED = "layers.create_failed"
+    LAYERS_FETCH_FAILED = "layers.fetch_failed"
+    LAYERS_NOT_FOUND = "layers.not_found"
+    LAYERS_KEY_ALREADY_EXISTS = "layers.key_already_exists"
+
+    HOLDOUTS_CREATE_FAILED = "holdouts.create_failed"
+    HOLDOUTS_FETCH_FAILED = "holdouts.fetch_failed"
+    HOLDOUTS_NOT_FOUND = "holdouts.not_found"
+    HOLDOUTS_UPDATE_FAILED = "holdouts.update_failed"
+    HOLDOUTS_KEY_ALREADY_EXISTS = "holdouts.key_already_exists"
+    HOLDOUTS_INVALID_TRANSITION = "holdouts.invalid_transition"
+
+    METRIC_EVENTS_TRACK_FAILED = "metric_events.track_failed"
+
+    RESULTS_FETCH_FAILED = "results.fetch_failed"
+    RESULTS_EXPERIMENT_ARCHIVED = "results.experiment_archived"
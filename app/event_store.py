@@ -0,0 +1,492 @@
+"""An append-only, columnar store of metric events on the local disk.
+
+Events are partitioned by event name & (utc) day, and each append writes a
+new immutable segment into the partitions it touches:
+
+    {root}/{event}/{yyyy-mm-dd}/{segment}/
+        metadata.json       row count, time range & property columns
+        timestamp.npy       int64 microseconds since the epoch
+        user_id.npy         int32 codes into user_id.dictionary.npy
+        user_id.dictionary.npy
+                            the sorted, distinct utf-8 user ids
+        p{n}.npy            int32 codes into p{n}.dictionary.npy; -1 if
+                            the event doesn't have the property
+        p{n}.dictionary.npy the sorted, distinct (json text) values
+        p{n}.number.npy     float64 values if numeric, otherwise nan
+
+Property values are stored as their json text, as postgres' `->>` returns
+them, and numeric values are additionally stored as floats, so filters &
+metrics behave the same as they do over the `metric_events` table.
+
+Columns are memory-mapped when scanned, and segments whose time range or
+numeric min/max can't match a query are skipped without being read.
+"""
+import fcntl
+import os
+import shutil
+import urllib.parse
+import uuid
+from collections.abc import Iterator
+from collections.abc import Sequence
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from pathlib import Path
+from typing import Any
+from typing import assert_never
+
+import numpy as np
+import numpy.typing as npt
+import orjson
+
+from app.models.experiments import EventSegmentationMetric
+from app.models.experiments import MetricType
+from app.models.experiments import NUMERIC_PROPERTY_FILTER_OPERATORS
+from app.models.experiments import PropertyFilter
+from app.models.experiments import PropertyFilterOperator
+from app.models.metric_events import MetricEvent
+
+EPOCH = datetime(1970, 1, 1)
+
+COMPACTION_RETRIES = 3
+
+# a dictionary encoded column: sorted distinct values & a code per row
+DictionaryColumn = tuple[npt.NDArray[np.bytes_], npt.NDArray[np.int32]]
+
+
+def to_timestamp(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def to_timestamps(values: Sequence[datetime]) -> npt.NDArray[np.int64]:
+    # numpy's own datetime conversion is several times slower than this
+    return np.fromiter(map(to_timestamp, values), dtype=np.int64, count=len(values))
+
+
+def to_json_text(value: Any) -> str:
+    return value if isinstance(value, str) else orjson.dumps(value).decode()
+
+
+def is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def encode_strings(values: Sequence[str]) -> npt.NDArray[np.bytes_]:
+    # utf-8 bytes sort in the same order as the strings they encode
+    return np.array([value.encode("utf-8") for value in values], dtype=np.bytes_)
+
+
+def encode_dictionary_column(values: Sequence[str | None]) -> DictionaryColumn:
+    is_present = np.array([value is not None for value in values], dtype=np.bool_)
+    dictionary, present_codes = np.unique(
+        encode_strings([value for value in values if value is not None]),
+        return_inverse=True,
+    )
+    codes = np.full(len(values), -1, dtype=np.int32)
+    codes[is_present] = present_codes
+    return dictionary, codes
+
+
+def find_codes(
+    dictionary: npt.NDArray[np.bytes_],
+    values: npt.NDArray[np.bytes_],
+) -> npt.NDArray[np.intp]:
+    """Find the codes of values in a sorted dictionary, or -1 if missing."""
+    if len(dictionary) == 0:
+        return np.full(len(values), -1, dtype=np.intp)
+
+    positions = np.minimum(np.searchsorted(dictionary, values), len(dictionary) - 1)
+    return np.where(dictionary[positions] == values, positions, -1)
+
+
+def merge_dictionary_columns(columns: Sequence[DictionaryColumn]) -> DictionaryColumn:
+    dictionary = np.unique(np.concatenate([d for d, _ in columns]))
+    merged_codes = []
+    for column_dictionary, codes in columns:
+        # translate each column's codes into codes of the merged dictionary;
+        # the appended -1 keeps missing values (code -1) missing
+        translation = np.append(find_codes(dictionary, column_dictionary), -1)
+        merged_codes.append(translation[codes].astype(np.int32))
+    return dictionary, np.concatenate(merged_codes)
+
+
+def new_segment_name() -> str:
+    # sorts by creation time
+    return f"{datetime.utcnow():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex}"
+
+
+class Segment:
+    """An immutable batch of events of one event name & day."""
+
+    __slots__ = ("_path", "_metadata")
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._metadata = orjson.loads((path / "metadata.json").read_bytes())
+
+    @classmethod
+    def write(
+        cls,
+        path: Path,
+        timestamps: npt.NDArray[np.int64],
+        user_ids: DictionaryColumn,
+        properties: dict[str, tuple[DictionaryColumn, npt.NDArray[np.float64]]],
+        replaces: Sequence[str] = (),
+    ) -> "Segment":
+        # written to a temporary directory & renamed into place, so readers
+        # never observe a partially written segment
+        temporary_path = path.with_name(f".{path.name}.tmp")
+        temporary_path.mkdir(parents=True)
+
+        def write_dictionary_column(name: str, column: DictionaryColumn) -> None:
+            dictionary, codes = column
+            np.save(temporary_path / f"{name}.npy", codes)
+            np.save(temporary_path / f"{name}.dictionary.npy", dictionary)
+
+        np.save(temporary_path / "timestamp.npy", timestamps)
+        write_dictionary_column("user_id", user_ids)
+
+        property_columns: dict[str, dict[str, Any]] = {}
+        for index, (name, (values, numbers)) in enumerate(sorted(properties.items())):
+            column = f"p{index}"
+            write_dictionary_column(column, values)
+            np.save(temporary_path / f"{column}.number.npy", numbers)
+
+            has_numbers = not np.all(np.isnan(numbers))
+            property_columns[name] = {
+                "column": column,
+                "min": float(np.nanmin(numbers)) if has_numbers else None,
+                "max": float(np.nanmax(numbers)) if has_numbers else None,
+            }
+
+        metadata = {
+            "rows": len(timestamps),
+            "min_timestamp": int(timestamps.min()),
+            "max_timestamp": int(timestamps.max()),
+            "properties": property_columns,
+            "replaces": list(replaces),
+        }
+        (temporary_path / "metadata.json").write_bytes(orjson.dumps(metadata))
+        os.rename(temporary_path, path)
+        return cls(path)
+
+    @classmethod
+    def write_events(cls, path: Path, events: Sequence[MetricEvent]) -> "Segment":
+        properties = {}
+        for name in {name for event in events for name in event.properties}:
+            values = [event.properties.get(name) for event in events]
+            properties[name] = (
+                encode_dictionary_column(
+                    [to_json_text(v) if v is not None else None for v in values]
+                ),
+                np.array(
+                    [float(v) if is_number(v) else np.nan for v in values],
+                    dtype=np.float64,
+                ),
+            )
+
+        return cls.write(
+            path,
+            timestamps=to_timestamps([event.created_at for event in events]),
+            user_ids=encode_dictionary_column([event.user_id for event in events]),
+            properties=properties,
+        )
+
+    @classmethod
+    def merge(cls, path: Path, segments: Sequence["Segment"]) -> "Segment":
+        properties = {}
+        names = {name for segment in segments for name in segment.property_names}
+        for name in names:
+            values: list[DictionaryColumn] = []
+            numbers = []
+            for segment in segments:
+                column = segment.get_property_column(name)
+                if column is not None:
+                    values.append(segment.load_dictionary_column(column["column"]))
+                    numbers.append(segment.load(f"{column['column']}.number"))
+                else:
+                    values.append(
+                        (
+                            np.array([], dtype=np.bytes_),
+                            np.full(segment.rows, -1, dtype=np.int32),
+                        )
+                    )
+                    numbers.append(np.full(segment.rows, np.nan))
+            properties[name] = (
+                merge_dictionary_columns(values),
+                np.concatenate(numbers),
+            )
+
+        return cls.write(
+            path,
+            timestamps=np.concatenate([s.load("timestamp") for s in segments]),
+            user_ids=merge_dictionary_columns(
+                [s.load_dictionary_column("user_id") for s in segments]
+            ),
+            properties=properties,
+            replaces=[segment.name for segment in segments],
+        )
+
+    @property
+    def name(self) -> str:
+        return self._path.name
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def rows(self) -> int:
+        return self._metadata["rows"]
+
+    @property
+    def max_timestamp(self) -> int:
+        return self._metadata["max_timestamp"]
+
+    @property
+    def property_names(self) -> list[str]:
+        return list(self._metadata["properties"])
+
+    @property
+    def replaces(self) -> list[str]:
+        return self._metadata["replaces"]
+
+    def load(self, column: str) -> npt.NDArray[Any]:
+        return np.load(self._path / f"{column}.npy", mmap_mode="r")
+
+    def load_dictionary(self, column: str) -> npt.NDArray[np.bytes_]:
+        return self.load(f"{column}.dictionary")
+
+    def load_dictionary_column(self, column: str) -> DictionaryColumn:
+        return self.load_dictionary(column), self.load(column)
+
+    def get_property_column(self, name: str) -> dict[str, Any] | None:
+        return self._metadata["properties"].get(name)
+
+    def may_match(self, property_filter: PropertyFilter) -> bool:
+        """Whether any row could match, judging by the segment's metadata."""
+        column = self.get_property_column(property_filter.property)
+        operator = property_filter.operator
+        if operator is PropertyFilterOperator.NOT_EQUALS:
+            return True
+        if column is None:
+            return False
+        if operator is PropertyFilterOperator.EQUALS:
+            return True
+        if column["min"] is None:
+            return False
+
+        value = float(property_filter.value)
+        if operator is PropertyFilterOperator.GREATER_THAN:
+            return column["max"] > value
+        elif operator is PropertyFilterOperator.GREATER_THAN_OR_EQUAL:
+            return column["max"] >= value
+        elif operator is PropertyFilterOperator.LESS_THAN:
+            return column["min"] < value
+        elif operator is PropertyFilterOperator.LESS_THAN_OR_EQUAL:
+            return column["min"] <= value
+        else:
+            assert_never(operator)
+
+    def filter(self, property_filter: PropertyFilter) -> npt.NDArray[np.bool_]:
+        column = self.get_property_column(property_filter.property)
+        operator = property_filter.operator
+        if column is None:
+            # (events without the property don't equal the value either)
+            return np.full(
+                self.rows,
+                operator is PropertyFilterOperator.NOT_EQUALS,
+            )
+
+        if operator in NUMERIC_PROPERTY_FILTER_OPERATORS:
+            numbers = self.load(f"{column['column']}.number")
+            value = float(property_filter.value)
+            if operator is PropertyFilterOperator.GREATER_THAN:
+                return numbers > value
+            elif operator is PropertyFilterOperator.GREATER_THAN_OR_EQUAL:
+                return numbers >= value
+            elif operator is PropertyFilterOperator.LESS_THAN:
+                return numbers < value
+            else:
+                return numbers <= value
+
+        # compare dictionary codes rather than the values themselves
+        [code] = find_codes(
+            self.load_dictionary(column["column"]),
+            encode_strings([property_filter.value]),
+        )
+        if code == -1:
+            code = -2  # matches no row, not even the ones missing the property
+        codes = self.load(column["column"])
+        if operator is PropertyFilterOperator.EQUALS:
+            return codes == code
+        else:
+            return codes != code
+
+
+class EventStore:
+    def __init__(self, path: str | Path) -> None:
+        self._path = Path(path)
+
+    def get_event_names(self) -> list[str]:
+        if not self._path.is_dir():
+            return []
+        return sorted(urllib.parse.unquote(path.name) for path in self._path.iterdir())
+
+    def get_event_path(self, event: str) -> Path:
+        return self._path / urllib.parse.quote(event, safe="")
+
+    def get_partition_path(self, event: str, day: date) -> Path:
+        return self.get_event_path(event) / day.isoformat()
+
+    def append(self, events: Sequence[MetricEvent]) -> int:
+        """Write events as new segments of their partitions."""
+        partitions: dict[tuple[str, date], list[MetricEvent]] = {}
+        for event in events:
+            key = (event.event, event.created_at.date())
+            partitions.setdefault(key, []).append(event)
+
+        for (event_name, day), partition_events in partitions.items():
+            Segment.write_events(
+                self.get_partition_path(event_name, day) / new_segment_name(),
+                partition_events,
+            )
+        return len(events)
+
+    def get_partitions(self, event: str, since: date | None = None) -> list[date]:
+        event_path = self.get_event_path(event)
+        if not event_path.is_dir():
+            return []
+
+        days = sorted(date.fromisoformat(path.name) for path in event_path.iterdir())
+        return [day for day in days if since is None or day >= since]
+
+    def get_segments(self, event: str, day: date) -> list[Segment]:
+        """Get the segments of a partition, excluding compacted ones."""
+        partition_path = self.get_partition_path(event, day)
+        segments = [
+            Segment(path)
+            for path in sorted(partition_path.iterdir())
+            if not path.name.startswith(".")
+        ]
+        # a compacted segment stays visible until it's been removed; the
+        # segment which replaced it takes its place
+        replaced = {name for segment in segments for name in segment.replaces}
+        return [segment for segment in segments if segment.name not in replaced]
+
+    def scan(self, event: str, since: date | None = None) -> Iterator[Segment]:
+        """Iterate over the segments of an event, optionally from a day on."""
+        for day in self.get_partitions(event, since):
+            yield from self.get_segments(event, day)
+
+    def compact(self, event: str, day: date, min_segments: int = 2) -> bool:
+        """Merge the segments of a partition into one.
+
+        Returns whether the partition had enough segments to merge. Partitions
+        are locked
+        while being compacted, so concurrent compactions (by any process)
+        of the same partition are serialized.
+        """
+        partition_path = self.get_partition_path(event, day)
+        with open(partition_path / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            segments = self.get_segments(event, day)
+            if len(segments) < max(min_segments, 2):
+                return False
+
+            Segment.merge(partition_path / new_segment_name(), segments)
+            for segment in segments:
+                shutil.rmtree(segment.path)
+            return True
+
+    def compute_user_values(
+        self,
+        metric: EventSegmentationMetric,
+        user_ids: Sequence[str],
+        exposed_at: Sequence[datetime],
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        """Compute each exposed user's metric value & denominator.
+
+        Only events since the user's exposure count, as in
+        `repositories.metric_events.fetch_user_value_changes`.
+        """
+        for attempt in range(COMPACTION_RETRIES):
+            try:
+                return self._compute_user_values(metric, user_ids, exposed_at)
+            except FileNotFoundError:
+                # a segment was compacted away mid-scan; scanning again will
+                # read the segment which replaced it instead
+                if attempt == COMPACTION_RETRIES - 1:
+                    raise
+        raise AssertionError("unreachable")
+
+    def _compute_user_values(
+        self,
+        metric: EventSegmentationMetric,
+        user_ids: Sequence[str],
+        exposed_at: Sequence[datetime],
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        events = np.zeros(len(user_ids), dtype=np.float64)
+        property_sums = np.zeros(len(user_ids), dtype=np.float64)
+        property_counts = np.zeros(len(user_ids), dtype=np.float64)
+        zeros = np.zeros(len(user_ids), dtype=np.float64)
+        if not user_ids:
+            return zeros, zeros
+
+        # exposed user ids sorted for lookups, & their original indices
+        encoded_user_ids = encode_strings(user_ids)
+        user_order = np.argsort(encoded_user_ids)
+        sorted_user_ids = encoded_user_ids[user_order]
+
+        exposure_timestamps = to_timestamps(exposed_at)
+        earliest_exposure = int(exposure_timestamps.min())
+        property_filters = metric.property_filters or []
+
+        for segment in self.scan(metric.event, since=min(exposed_at).date()):
+            if segment.max_timestamp < earliest_exposure or not all(
+                segment.may_match(f) for f in property_filters
+            ):
+                continue
+
+            # map the segment's user ids onto the exposed users, or -1
+            positions = find_codes(sorted_user_ids, segment.load_dictionary("user_id"))
+            segment_user_indices = np.where(positions >= 0, user_order[positions], -1)
+            indices = segment_user_indices[segment.load("user_id")]
+
+            mask = indices >= 0
+            mask &= segment.load("timestamp") >= exposure_timestamps[indices]
+            for property_filter in property_filters:
+                mask &= segment.filter(property_filter)
+
+            matched = indices[mask]
+            events += np.bincount(matched, minlength=len(user_ids))
+
+            if metric.property is None:
+                continue
+            column = segment.get_property_column(metric.property)
+            if column is None:
+                continue
+
+            numbers = segment.load(f"{column['column']}.number")[mask]
+            is_number = ~np.isnan(numbers)
+            property_sums += np.bincount(
+                matched[is_number],
+                weights=numbers[is_number],
+                minlength=len(user_ids),
+            )
+            property_counts += np.bincount(
+                matched[is_number],
+                minlength=len(user_ids),
+            )
+
+        if metric.type is MetricType.UNIQUES:
+            return (events > 0).astype(np.float64), zeros
+        elif metric.type is MetricType.EVENT_TOTALS:
+            return events, zeros
+        elif metric.type is MetricType.PROPERTY_SUM:
+            return property_sums, zeros
+        elif metric.type is MetricType.PROPERTY_AVERAGE:
+            return property_sums, property_counts
+        else:
+            assert_never(metric.type)
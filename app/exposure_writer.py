@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from collections.abc import Awaitable
+from collections.abc import Callable
+from uuid import UUID
+
+from app.models.exposures import Exposure
+
+FlushFunction = Callable[[list[Exposure]], Awaitable[int]]
+
+# failed flushes are retried, but a batch which can never be written (e.g.
+# one violating a constraint) mustn't block `submit` forever
+MAX_FLUSH_ATTEMPTS = 5
+
+
+class ExposureWriter:
+    """Buffers exposures in memory & writes them to the database in bulk.
+
+    Exposures are deduplicated by (experiment_id, user_id) while buffered,
+    and flushed once `max_batch_size` of them are pending or every
+    `flush_interval` seconds. Once `max_pending` exposures are buffered
+    (including any being flushed), `submit` waits for a flush to make room.
+    Exposures which fail to flush `max_flush_attempts` times are dropped.
+    """
+
+    def __init__(
+        self,
+        flush: FlushFunction,
+        max_batch_size: int,
+        flush_interval: float,
+        max_pending: int,
+        max_flush_attempts: int = MAX_FLUSH_ATTEMPTS,
+    ) -> None:
+        self._flush = flush
+        self._max_batch_size = max_batch_size
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._max_flush_attempts = max_flush_attempts
+
+        self._pending: dict[tuple[UUID, str], Exposure] = {}
+        self._failed_attempts: dict[tuple[UUID, str], int] = {}
+        self._in_flight_count = 0
+        self._flush_requested = asyncio.Event()
+        self._space_available = asyncio.Condition()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task[None] | None = None
+        self._closed = False
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop accepting exposures & drain everything that's buffered."""
+        self._closed = True
+        if self._task is not None:
+            # wake the flush loop, which exits after finishing its flush;
+            # cancelling it mid-flush would lose the batch in flight
+            self._flush_requested.set()
+            await self._task
+            self._task = None
+
+        while self._pending:
+            if not await self.flush():
+                logging.error(
+                    "Dropping buffered exposures after a failed final flush",
+                    extra={"exposures_count": len(self._pending)},
+                )
+                break
+
+    async def submit(self, exposure: Exposure) -> None:
+        if self._closed:
+            raise RuntimeError("Exposure writer is closed")
+
+        async with self._space_available:
+            await self._space_available.wait_for(
+                lambda: len(self._pending) + self._in_flight_count < self._max_pending
+            )
+            self._pending.setdefault(
+                (exposure.experiment_id, exposure.user_id), exposure
+            )
+
+        if len(self._pending) >= self._max_batch_size:
+            self._flush_requested.set()
+
+    async def flush(self) -> bool:
+        async with self._flush_lock:
+            if not self._pending:
+                return True
+
+            batch, self._pending = self._pending, {}
+            self._in_flight_count = len(batch)
+            try:
+                await self._flush(list(batch.values()))
+            except Exception as exc:
+                logging.error(
+                    "An unhandled error occurred while flushing exposures",
+                    exc_info=exc,
+                    extra={"exposures_count": len(batch)},
+                )
+                # keep the failed batch around for the next flush; as it was
+                # counted while in flight, this stays within `max_pending`
+                dropped_count = 0
+                for key, exposure in batch.items():
+                    attempts = self._failed_attempts.get(key, 0) + 1
+                    if attempts >= self._max_flush_attempts:
+                        self._failed_attempts.pop(key, None)
+                        dropped_count += 1
+                    else:
+                        self._failed_attempts[key] = attempts
+                        self._pending.setdefault(key, exposure)
+                if dropped_count:
+                    logging.error(
+                        "Dropping exposures which repeatedly failed to flush",
+                        extra={
+                            "exposures_count": dropped_count,
+                            "max_flush_attempts": self._max_flush_attempts,
+                        },
+                    )
+                return False
+            else:
+                if self._failed_attempts:
+                    for key in batch:
+                        self._failed_attempts.pop(key, None)
+            finally:
+                self._in_flight_count = 0
+                async with self._space_available:
+                    self._space_available.notify_all()
+
+        return True
+
+    async def _run(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(
+                    self._flush_requested.wait(),
+                    timeout=self._flush_interval,
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
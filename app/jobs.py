@@ -0,0 +1,52 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from app.context import AbstractContext
+from app.usecases import experiments
+
+# today's partitions are still being appended to, so they're only compacted
+# once enough small segments pile up, rather than rewritten every interval
+TODAY_COMPACTION_MIN_SEGMENTS = 64
+
+
+async def refresh_experiments_snapshot_periodically(
+    ctx: AbstractContext,
+    interval: float,
+) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await experiments.refresh_running_experiments_snapshot(ctx)
+        except Exception as exc:
+            logging.error(
+                "An unhandled error occurred while refreshing the experiments snapshot",
+                exc_info=exc,
+            )
+
+
+async def compact_event_store_periodically(
+    ctx: AbstractContext,
+    interval: float,
+) -> None:
+    """Merge the segments written to each of the event store's partitions."""
+    assert ctx.event_store is not None
+    event_store = ctx.event_store
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            today = datetime.utcnow().date()
+            for event in event_store.get_event_names():
+                for day in event_store.get_partitions(event):
+                    await asyncio.to_thread(
+                        event_store.compact,
+                        event,
+                        day,
+                        TODAY_COMPACTION_MIN_SEGMENTS if day >= today else 2,
+                    )
+        except Exception as exc:
+            logging.error(
+                "An unhandled error occurred while compacting the event store",
+                exc_info=exc,
+            )
@@ -0,0 +1,173 @@
+"""Prometheus metrics, served by the `/metrics` endpoint.
+
+Metrics are kept in the process' memory, so each worker process exposes
+its own; running several workers behind one port needs prometheus_client's
+multiprocess mode (`PROMETHEUS_MULTIPROC_DIR`) to aggregate them.
+
+Labelled children are cached, so recording on the hot path is only a
+dictionary lookup & a locked increment.
+"""
+import functools
+import time
+
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+from starlette.types import ASGIApp
+from starlette.types import Message
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
+
+from app.adapters.database import Database
+from app.errors import ServiceError
+
+# requests which didn't match a route are grouped, to bound the label's values
+UNMATCHED_ROUTE = "<unmatched>"
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time taken to respond to http requests, by route template",
+    ["method", "route", "status"],
+    buckets=(
+        0.001,
+        0.0025,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+    ),
+)
+SERVICE_ERRORS = Counter(
+    "service_errors",
+    "Errors responded with, by service error code",
+    ["error"],
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Time taken by database queries, including waiting for a connection, "
+    "by the function which made them",
+    ["function"],
+    buckets=(
+        0.0005,
+        0.001,
+        0.0025,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+    ),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections in the database pool, by state",
+    ["state"],
+)
+EXPERIMENTS_SNAPSHOT_LOOKUPS = Counter(
+    "experiments_snapshot_lookups",
+    "Lookups of the running experiments snapshot; misses rebuild it",
+    ["result"],
+)
+TARGETING_AUDIENCE_CACHE_LOOKUPS = Counter(
+    "targeting_audience_cache_lookups",
+    "Lookups of users' audiences by their matched targeting filters",
+    ["result"],
+)
+ELIGIBILITY_NEW_ASSIGNMENTS = Histogram(
+    "eligibility_new_assignments",
+    "Sticky assignments created per eligibility call",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+
+
+@functools.cache
+def _get_http_request_duration(method: str, route: str, status: int) -> Histogram:
+    return HTTP_REQUEST_DURATION.labels(method, route, str(status))
+
+
+@functools.cache
+def _get_db_query_duration(function: str) -> Histogram:
+    return DB_QUERY_DURATION.labels(function)
+
+
+@functools.cache
+def _get_service_errors(error: ServiceError) -> Counter:
+    return SERVICE_ERRORS.labels(error.value)
+
+
+EXPERIMENTS_SNAPSHOT_HITS = EXPERIMENTS_SNAPSHOT_LOOKUPS.labels("hit")
+EXPERIMENTS_SNAPSHOT_MISSES = EXPERIMENTS_SNAPSHOT_LOOKUPS.labels("miss")
+TARGETING_AUDIENCE_CACHE_HITS = TARGETING_AUDIENCE_CACHE_LOOKUPS.labels("hit")
+TARGETING_AUDIENCE_CACHE_MISSES = TARGETING_AUDIENCE_CACHE_LOOKUPS.labels("miss")
+
+
+def observe_query(function: str, query: str, duration: float) -> None:
+    _get_db_query_duration(function).observe(duration)
+
+
+def count_service_error(error: ServiceError) -> None:
+    _get_service_errors(error).inc()
+
+
+def track_database_pool(database: Database) -> None:
+    """Report the pool's connections whenever the metrics are collected."""
+    pool = database.pool
+    DB_POOL_CONNECTIONS.labels("idle").set_function(pool.get_idle_size)
+    DB_POOL_CONNECTIONS.labels("in_use").set_function(
+        lambda: pool.get_size() - pool.get_idle_size()
+    )
+    DB_POOL_CONNECTIONS.labels("max").set_function(pool.get_max_size)
+
+
+def get_route_template(scope: Scope) -> str:
+    """The path template of the route a request matched, e.g.
+    `/v1/experiments/{experiment_id}`."""
+    route = scope.get("route")
+    return route.path if route is not None else UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Time each http request, labelled by the route it matched.
+
+    Written as a plain ASGI middleware, as starlette's `BaseHTTPMiddleware`
+    adds noticeable overhead to every request.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started_at = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _get_http_request_duration(
+                scope["method"],
+                get_route_template(scope),
+                status,
+            ).observe(time.perf_counter() - started_at)
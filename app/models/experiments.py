@@ -3,7 +3,14 @@ from enum import Enum
 from typing import Any
 from uuid import UUID
 
+from pydantic import Field
+from pydantic import field_validator
+from pydantic import model_validator
+
 from app.models import BaseModel
+from app.models.holdouts import HoldoutBucketingConfig
+from app.models.layers import LayerBucketingConfig
+from app.models.layers import TrafficSlice
 
 
 class ExperimentType(Enum):
@@ -17,6 +24,21 @@ class ExperimentStatus(str, Enum):
     COMPLETED = "completed"
 
 
+class EvaluationMode(Enum):
+    # assignments are persisted; users keep their first variant even if the
+    # allocation or salt changes later
+    STICKY = "sticky"
+    # variants are computed from the salt & user id on every evaluation
+    STATELESS = "stateless"
+
+
+class TotalCountMode(str, Enum):
+    EXACT = "exact"
+    # the query planner's row estimate; cheap, but can be well off
+    ESTIMATE = "estimate"
+    NONE = "none"
+
+
 class Direction(Enum):
     INCREASE = "increase"
     DECREASE = "decrease"
@@ -35,11 +57,67 @@ class MetricType(Enum):
     # CONVERSION = "conversion"
 
 
+PROPERTY_METRIC_TYPES = frozenset(
+    {
+        MetricType.PROPERTY_SUM,
+        MetricType.PROPERTY_AVERAGE,
+    }
+)
+
+
+class PropertyFilterOperator(Enum):
+    EQUALS = "equals"
+    NOT_EQUALS = "not_equals"
+    # numeric comparisons
+    GREATER_THAN = "greater_than"
+    GREATER_THAN_OR_EQUAL = "greater_than_or_equal"
+    LESS_THAN = "less_than"
+    LESS_THAN_OR_EQUAL = "less_than_or_equal"
+
+
+NUMERIC_PROPERTY_FILTER_OPERATORS = frozenset(
+    {
+        PropertyFilterOperator.GREATER_THAN,
+        PropertyFilterOperator.GREATER_THAN_OR_EQUAL,
+        PropertyFilterOperator.LESS_THAN,
+        PropertyFilterOperator.LESS_THAN_OR_EQUAL,
+    }
+)
+
+
+# spellings of operators accepted before they were an enum
+LEGACY_PROPERTY_FILTER_OPERATORS = {
+    "=": PropertyFilterOperator.EQUALS,
+    "==": PropertyFilterOperator.EQUALS,
+    "!=": PropertyFilterOperator.NOT_EQUALS,
+    ">": PropertyFilterOperator.GREATER_THAN,
+    ">=": PropertyFilterOperator.GREATER_THAN_OR_EQUAL,
+    "<": PropertyFilterOperator.LESS_THAN,
+    "<=": PropertyFilterOperator.LESS_THAN_OR_EQUAL,
+}
+
+
 class PropertyFilter(BaseModel):
     property: str  # event or user property
-    operator: str  # TODO: enum
+    operator: PropertyFilterOperator
     value: str
 
+    @field_validator("operator", mode="before")
+    @classmethod
+    def parse_legacy_operator(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return LEGACY_PROPERTY_FILTER_OPERATORS.get(value, value)
+        return value
+
+    @model_validator(mode="after")
+    def check_numeric_value(self) -> "PropertyFilter":
+        if self.operator in NUMERIC_PROPERTY_FILTER_OPERATORS:
+            try:
+                float(self.value)
+            except ValueError:
+                raise ValueError(f"{self.operator.value} requires a numeric value")
+        return self
+
 
 class MetricBase(BaseModel):
     name: str
@@ -47,7 +125,9 @@ class MetricBase(BaseModel):
 
 
 class EventSegmentationMetric(MetricBase):
-    event: str
+    # metrics saved before their events were stored don't have one; they're
+    # readable, but skipped when computing results
+    event: str | None = None
     property_filters: list[PropertyFilter] | None = None
 
     # property is only used for PROPERTY_ metric types
@@ -55,7 +135,7 @@ class EventSegmentationMetric(MetricBase):
 
 
 class MetricEffect(BaseModel):
-    metric: MetricBase
+    metric: EventSegmentationMetric
     direction: Direction
     minimum_goal: float  # %
 
@@ -70,9 +150,10 @@ class Variant(BaseModel):
     payload: Any | None = None
 
 
-# class Segment(BaseModel):
-#     name: str
-#     filters: list[PropertyFilter]
+# users are in a segment if they match all of its filters
+class Segment(BaseModel):
+    name: str
+    filters: list[PropertyFilter]
 
 
 class Experiment(BaseModel):
@@ -85,13 +166,27 @@ class Experiment(BaseModel):
     exposure_event: str | None
     variants: list[Variant]
     variant_allocation: dict[str, float]  # 0.0 - 1.0
-    # user_segments: list[Segment]
+    # users must be in one of the segments; no segments targets everyone
+    user_segments: list[Segment]
     bucketing_salt: str
+    evaluation_mode: EvaluationMode
+    # experiments in a layer only receive the traffic in their slice of it
+    layer_id: UUID | None
+    traffic_slice: TrafficSlice | None
     status: ExperimentStatus
     created_at: datetime
     updated_at: datetime
 
 
+class ExperimentsPage(BaseModel):
+    experiments: list[Experiment]
+    # rec_id to continue after, if there are more experiments
+    next_cursor: int | None
+    total: int | None
+    # changes whenever any experiment is created or updated
+    version: str
+
+
 class ExperimentInput(BaseModel):
     experiment_name: str
     experiment_type: ExperimentType
@@ -107,10 +202,54 @@ class ExperimentUpdate(BaseModel):
     exposure_event: str | None = None
     variants: list[Variant] | None = None
     variant_allocation: dict[str, float] | None = None
+    user_segments: list[Segment] | None = None
     bucketing_salt: str | None = None
+    evaluation_mode: EvaluationMode | None = None
+    layer_id: UUID | None = None
+    traffic_slice: TrafficSlice | None = None
     status: ExperimentStatus | None = None
 
 
 class UserExperimentBucketing(BaseModel):
     experiment_id: UUID
     variant_name: str
+
+
+class UserEligibleExperiments(BaseModel):
+    user_id: str
+    experiments: list[UserExperimentBucketing]
+
+
+class EligibleExperimentsInput(BaseModel):
+    user_id: str
+    # evaluated against the experiments' user segments
+    attributes: dict[str, Any] = {}
+
+
+# users are assigned & responded to in chunks, but their ids (& attributes)
+# are held in memory for the whole batch
+MAX_ELIGIBILITY_BATCH_SIZE = 10_000
+
+
+class EligibleExperimentsBatchInput(BaseModel):
+    user_ids: list[str] = Field(max_length=MAX_ELIGIBILITY_BATCH_SIZE)
+    # by user id; users without any have none
+    attributes: dict[str, dict[str, Any]] = {}
+
+
+class ExperimentBucketingConfig(BaseModel):
+    experiment_id: UUID
+    key: str
+    bucketing_salt: str
+    evaluation_mode: EvaluationMode
+    variant_names: list[str]
+    cumulative_allocation: list[float]
+    layer_id: UUID | None = None
+    traffic_slice: TrafficSlice | None = None
+    user_segments: list[Segment] = []
+
+
+class ExperimentsBucketingSnapshot(BaseModel):
+    experiments: list[ExperimentBucketingConfig]
+    layers: list[LayerBucketingConfig] = []
+    holdouts: list[HoldoutBucketingConfig] = []
@@ -1,3 +1,4 @@
+from datetime import date
 from datetime import datetime
 from uuid import UUID
 
@@ -14,3 +15,35 @@ class Exposure(BaseModel):
 class ExposureInput(BaseModel):
     # TODO: Add some form of "authentication"
     user_id: str
+
+
+class ExposureBatchItem(BaseModel):
+    experiment_id: UUID
+    user_id: str
+
+
+class ExperimentExposuresSummary(BaseModel):
+    experiment_id: UUID
+    created: int
+    duplicate: int
+    unassigned: int
+
+
+class ExposureBatchSummary(BaseModel):
+    created: int
+    duplicate: int
+    unassigned: int
+    experiments: list[ExperimentExposuresSummary]
+
+
+class ExposureCount(BaseModel):
+    variant_name: str
+    bucket_date: date  # utc
+    count: int
+
+
+class ExperimentExposureCounts(BaseModel):
+    experiment_id: UUID
+    total: int
+    variants: dict[str, int]
+    daily: list[ExposureCount]
@@ -0,0 +1,45 @@
+from datetime import datetime
+from enum import Enum
+from uuid import UUID
+
+from pydantic import Field
+
+from app.models import BaseModel
+from app.models.layers import LAYER_BUCKETS
+
+
+class HoldoutStatus(str, Enum):
+    DRAFT = "draft"
+    RUNNING = "running"
+    COMPLETED = "completed"
+
+
+class Holdout(BaseModel):
+    """Users in a running holdout are excluded from every experiment."""
+
+    holdout_id: UUID
+    name: str
+    key: str
+    bucketing_salt: str
+    traffic: int  # buckets, out of LAYER_BUCKETS
+    status: HoldoutStatus
+    created_at: datetime
+    updated_at: datetime
+
+
+class HoldoutInput(BaseModel):
+    holdout_name: str
+    holdout_key: str
+    traffic: int = Field(ge=0, le=LAYER_BUCKETS)
+
+
+class HoldoutUpdate(BaseModel):
+    holdout_name: str | None = None
+    traffic: int | None = Field(None, ge=0, le=LAYER_BUCKETS)
+    status: HoldoutStatus | None = None
+
+
+class HoldoutBucketingConfig(BaseModel):
+    holdout_id: UUID
+    bucketing_salt: str
+    traffic: int
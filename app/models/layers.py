@@ -0,0 +1,48 @@
+from datetime import datetime
+from uuid import UUID
+
+from pydantic import Field
+from pydantic import model_validator
+
+from app.models import BaseModel
+
+# users are hashed into this many buckets of each layer (or holdout), so
+# traffic can be split in increments of 0.01%
+LAYER_BUCKETS = 10_000
+
+
+class TrafficSlice(BaseModel):
+    """The buckets [start, end) of a layer."""
+
+    start: int = Field(ge=0, le=LAYER_BUCKETS)
+    end: int = Field(ge=0, le=LAYER_BUCKETS)
+
+    @model_validator(mode="after")
+    def check_bounds(self) -> "TrafficSlice":
+        if self.start >= self.end:
+            raise ValueError("start must be less than end")
+        return self
+
+    def overlaps(self, other: "TrafficSlice") -> bool:
+        return self.start < other.end and other.start < self.end
+
+
+class Layer(BaseModel):
+    """Users are in at most one of the running experiments of a layer."""
+
+    layer_id: UUID
+    name: str
+    key: str
+    bucketing_salt: str
+    created_at: datetime
+    updated_at: datetime
+
+
+class LayerInput(BaseModel):
+    layer_name: str
+    layer_key: str
+
+
+class LayerBucketingConfig(BaseModel):
+    layer_id: UUID
+    bucketing_salt: str
@@ -0,0 +1,23 @@
+from datetime import datetime
+from typing import Any
+
+from app.models import BaseModel
+
+
+class MetricEvent(BaseModel):
+    user_id: str
+    event: str
+    properties: dict[str, Any]
+    created_at: datetime
+
+
+class MetricEventInput(BaseModel):
+    user_id: str
+    event: str
+    properties: dict[str, Any] = {}
+    # defaults to when the event is received
+    created_at: datetime | None = None
+
+
+class MetricEventBatchSummary(BaseModel):
+    created: int
@@ -0,0 +1,58 @@
+from datetime import datetime
+from uuid import UUID
+
+from app.models import BaseModel
+from app.models.experiments import Direction
+from app.models.experiments import EventSegmentationMetric
+
+
+class SufficientStatistics(BaseModel):
+    """Sums over a variant's exposed users of their per-user metric values."""
+
+    users: int
+    sum: float
+    sum_of_squares: float
+    # per-user denominators; only used by ratio metrics (property averages)
+    denominator_sum: float
+    denominator_sum_of_squares: float
+    cross_sum: float
+
+
+class MetricAggregates(BaseModel):
+    experiment_id: UUID
+    metric_hash: str
+    # the highest exposures & metric_events rec_ids which have been aggregated
+    exposure_watermark: int
+    event_watermark: int
+    variants: dict[str, SufficientStatistics]
+    updated_at: datetime
+
+
+class VariantResult(BaseModel):
+    variant_name: str
+    users: int
+    mean: float | None
+    standard_error: float | None
+
+
+class VariantComparison(BaseModel):
+    variant_name: str
+    lift: float | None  # %, relative to the control
+    confidence_interval: tuple[float, float] | None  # %
+    p_value: float | None
+    goal_met: bool
+
+
+class MetricEffectResult(BaseModel):
+    metric: EventSegmentationMetric
+    direction: Direction
+    minimum_goal: float  # %
+    control_variant_name: str
+    variants: list[VariantResult]
+    comparisons: list[VariantComparison]
+
+
+class ExperimentResults(BaseModel):
+    experiment_id: UUID
+    confidence_level: float
+    metric_effects: list[MetricEffectResult]
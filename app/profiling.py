@@ -0,0 +1,152 @@
+"""On-demand profiling of http requests with cProfile.
+
+A request is profiled when it carries the profiling token in its
+`X-Profile-Token` header, or is picked by the sampling rate. Its profile
+is saved to the output directory as a `.prof` file (readable with pstats
+or snakeviz), next to a `.json` file of the request's method, route,
+status, timings & database queries. The profile's id is returned in the
+`X-Profile-Id` response header.
+
+cProfile profiles the whole thread, so the event loop's other tasks are
+included while a request is profiled; only one request is profiled at a
+time, & others which ask to be are served without it. Requests which
+aren't profiled only pay for a header lookup & a random draw.
+"""
+import asyncio
+import cProfile
+import hmac
+import logging
+import random
+import re
+import secrets
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import orjson
+from starlette.types import ASGIApp
+from starlette.types import Message
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
+
+from app import tracing
+from app.metrics import get_route_template
+
+TOKEN_HEADER = b"x-profile-token"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+
+def get_header(scope: Scope, name: bytes) -> bytes | None:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+def save_profile(
+    output_dir: Path,
+    profile_id: str,
+    profiler: cProfile.Profile,
+    metadata: dict[str, Any],
+) -> None:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(output_dir / f"{profile_id}.prof")
+    with open(output_dir / f"{profile_id}.json", "wb") as f:
+        f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+
+
+class ProfilingMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        output_dir: str,
+        token: str = "",
+        sample_rate: float = 0.0,
+    ) -> None:
+        self.app = app
+        self.output_dir = Path(output_dir)
+        self.token = token.encode()
+        self.sample_rate = sample_rate
+        self._profiling = False
+
+    def _get_trigger(self, scope: Scope) -> str | None:
+        if self.token:
+            token = get_header(scope, TOKEN_HEADER)
+            if token is not None and hmac.compare_digest(token, self.token):
+                return "token"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self._profiling:
+            await self.app(scope, receive, send)
+            return
+
+        trigger = self._get_trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = "{}-{}".format(
+            datetime.now().strftime("%Y%m%dT%H%M%S"),
+            secrets.token_hex(4),
+        )
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (PROFILE_ID_HEADER, profile_id.encode()),
+                ]
+            await send(message)
+
+        self._profiling = True
+        profiler = cProfile.Profile()
+        started_at = datetime.now()
+        wall_started_at = time.perf_counter()
+        cpu_started_at = time.process_time()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            wall_time = time.perf_counter() - wall_started_at
+            cpu_time = time.process_time() - cpu_started_at
+            self._profiling = False
+
+            route = get_route_template(scope)
+            metadata: dict[str, Any] = {
+                "profile_id": profile_id,
+                "trigger": trigger,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route,
+                "status": status,
+                "started_at": started_at.isoformat(),
+                "duration_ms": round(wall_time * 1000, 3),
+                "cpu_time_ms": round(cpu_time * 1000, 3),
+            }
+            trace = tracing.get_current_trace()
+            if trace is not None:
+                metadata.update(trace.get_log_fields())
+
+            try:
+                await asyncio.to_thread(
+                    save_profile,
+                    self.output_dir / re.sub(r"[^a-zA-Z0-9]+", "_", route).strip("_"),
+                    profile_id,
+                    profiler,
+                    metadata,
+                )
+            except Exception as exc:
+                logging.error(
+                    "An unhandled error occurred while saving a profile",
+                    exc_info=exc,
+                    extra={"profile_id": profile_id, "route": route},
+                )
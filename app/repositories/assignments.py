@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import Any
 from uuid import UUID
 
-from databases.interfaces import Record
+from asyncpg import Record
 
 from app.context import AbstractContext
 from app.models.assignments import Assignment
@@ -55,7 +55,80 @@ async def create(
         values=serialize(assignment),
     )
     assert rec is not None
-    return Assignment.model_validate(deserialize(rec))
+    return deserialize(rec)
+
+
+async def create_many(
+    ctx: AbstractContext,
+    assignments: list[Assignment],
+) -> list[Assignment]:
+    """Persist many assignments in a single statement.
+
+    Rows which already exist (e.g. written by a concurrent request) are left
+    untouched; the stored rows are returned in their place, so the result
+    always reflects the winning assignment for each (experiment, user).
+    """
+    if not assignments:
+        return []
+
+    query = f"""\
+        WITH new_assignments (experiment_id, user_id, variant_name,
+                              created_at) AS (
+            SELECT *
+              FROM UNNEST(CAST(:experiment_ids AS TEXT[]),
+                          CAST(:user_ids AS TEXT[]),
+                          CAST(:variant_names AS TEXT[]),
+                          CAST(:created_ats AS TIMESTAMP[]))
+        ), inserted AS (
+            INSERT INTO assignments (experiment_id, user_id, variant_name,
+                                     created_at)
+                 SELECT experiment_id, user_id, variant_name, created_at
+                   FROM new_assignments
+            ON CONFLICT (experiment_id, user_id) DO NOTHING
+              RETURNING {READ_PARAMS}
+        )
+        SELECT {READ_PARAMS}
+          FROM inserted
+         UNION ALL
+        SELECT a.experiment_id, a.user_id, a.variant_name, a.created_at
+          FROM assignments a
+          JOIN new_assignments n
+            ON n.experiment_id = a.experiment_id
+           AND n.user_id = a.user_id
+    """
+    values = {
+        "experiment_ids": [str(a.experiment_id) for a in assignments],
+        "user_ids": [a.user_id for a in assignments],
+        "variant_names": [a.variant_name for a in assignments],
+        "created_ats": [a.created_at for a in assignments],
+    }
+    recs = await ctx.database.fetch_all(query, values)
+    persisted = [deserialize(rec) for rec in recs]
+
+    # a row committed by a concurrent transaction after this statement's
+    # snapshot was taken is skipped by the insert, but isn't visible to the
+    # select either; read those back together in a second statement.
+    found = {(a.experiment_id, a.user_id) for a in persisted}
+    missing = [a for a in assignments if (a.experiment_id, a.user_id) not in found]
+    if missing:
+        recs = await ctx.database.fetch_all(
+            f"""\
+            SELECT {READ_PARAMS}
+              FROM assignments
+             WHERE (experiment_id, user_id) IN (
+                SELECT *
+                  FROM UNNEST(CAST(:experiment_ids AS TEXT[]),
+                              CAST(:user_ids AS TEXT[]))
+             )
+            """,
+            {
+                "experiment_ids": [str(a.experiment_id) for a in missing],
+                "user_ids": [a.user_id for a in missing],
+            },
+        )
+        persisted.extend(deserialize(rec) for rec in recs)
+
+    return persisted
 
 
 async def fetch_one(
@@ -75,31 +148,44 @@ async def fetch_one(
             "user_id": user_id,
         },
     )
-    return Assignment.model_validate(deserialize(rec)) if rec is not None else None
+    return deserialize(rec) if rec is not None else None
 
 
 async def fetch_many(
     ctx: AbstractContext,
     experiment_id: UUID | None = None,
+    experiment_ids: list[UUID] | None = None,
     user_id: str | None = None,
+    user_ids: list[str] | None = None,
 ) -> list[Assignment]:
     query = f"""\
         SELECT {READ_PARAMS}
           FROM assignments
     """
-    values = {}
+    conditions = []
+    values: dict[str, Any] = {}
 
     if experiment_id is not None:
-        query += """\
-            WHERE experiment_id = :experiment_id
-        """
+        conditions.append("experiment_id = :experiment_id")
         values["experiment_id"] = str(experiment_id)
 
+    if experiment_ids is not None:
+        # lets postgres skip the partitions of every other experiment
+        conditions.append("experiment_id = ANY(:experiment_ids)")
+        values["experiment_ids"] = [str(e) for e in experiment_ids]
+
     if user_id is not None:
-        query += """\
-            WHERE user_id = :user_id
-        """
+        conditions.append("user_id = :user_id")
         values["user_id"] = user_id
 
+    if user_ids is not None:
+        conditions.append("user_id = ANY(:user_ids)")
+        values["user_ids"] = user_ids
+
+    if conditions:
+        query += f"""\
+            WHERE {" AND ".join(conditions)}
+        """
+
     recs = await ctx.database.fetch_all(query, values)
-    return [Assignment.model_validate(deserialize(rec)) for rec in recs]
+    return [deserialize(rec) for rec in recs]
@@ -1,24 +1,31 @@
-import json
+import logging
 import secrets
 from datetime import datetime
 from typing import Any
 from uuid import UUID
 from uuid import uuid4
 
-from databases.interfaces import Record
+from asyncpg import Record
+from pydantic import ValidationError
 
 from app._typing import UNSET
 from app._typing import Unset
 from app.context import AbstractContext
+from app.models.experiments import EvaluationMode
 from app.models.experiments import Experiment
+from app.models.experiments import ExperimentsPage
 from app.models.experiments import ExperimentStatus
 from app.models.experiments import ExperimentType
 from app.models.experiments import Hypothesis
+from app.models.experiments import Segment
+from app.models.experiments import TotalCountMode
 from app.models.experiments import Variant
+from app.models.layers import TrafficSlice
 
 READ_PARAMS = """\
     experiment_id, name, key, type, description, hypothesis, exposure_event,
-    variants, variant_allocation, bucketing_salt, status, created_at, updated_at
+    variants, variant_allocation, user_segments, bucketing_salt, evaluation_mode,
+    layer_id, traffic_slice, status, created_at, updated_at
 """
 
 
@@ -29,13 +36,21 @@ def serialize(experiment: Experiment) -> dict[str, Any]:
         "key": experiment.key,
         "type": experiment.type.value,
         "description": experiment.description,
-        "hypothesis": json.dumps(experiment.hypothesis.model_dump(mode="json")),
+        "hypothesis": experiment.hypothesis.model_dump(mode="json"),
         "exposure_event": experiment.exposure_event,
-        "variants": json.dumps(
-            [v.model_dump(mode="json") for v in experiment.variants]
-        ),
-        "variant_allocation": json.dumps(experiment.variant_allocation),
+        "variants": [v.model_dump(mode="json") for v in experiment.variants],
+        "variant_allocation": experiment.variant_allocation,
+        "user_segments": [s.model_dump(mode="json") for s in experiment.user_segments],
         "bucketing_salt": experiment.bucketing_salt,
+        "evaluation_mode": experiment.evaluation_mode.value,
+        "layer_id": (
+            str(experiment.layer_id) if experiment.layer_id is not None else None
+        ),
+        "traffic_slice": (
+            experiment.traffic_slice.model_dump(mode="json")
+            if experiment.traffic_slice is not None
+            else None
+        ),
         "status": experiment.status.value,
         "created_at": experiment.created_at,
         "updated_at": experiment.updated_at,
@@ -50,11 +65,15 @@ def deserialize(data: Record) -> Experiment:
             "key": data["key"],
             "type": ExperimentType(data["type"]),
             "description": data["description"],
-            "hypothesis": json.loads(data["hypothesis"]),
+            "hypothesis": data["hypothesis"],
             "exposure_event": data["exposure_event"],
-            "variants": json.loads(data["variants"]),
-            "variant_allocation": json.loads(data["variant_allocation"]),
+            "variants": data["variants"],
+            "variant_allocation": data["variant_allocation"],
+            "user_segments": data["user_segments"],
             "bucketing_salt": data["bucketing_salt"],
+            "evaluation_mode": EvaluationMode(data["evaluation_mode"]),
+            "layer_id": data["layer_id"],
+            "traffic_slice": data["traffic_slice"],
             "status": ExperimentStatus(data["status"]),
             "created_at": data["created_at"],
             "updated_at": data["updated_at"],
@@ -78,7 +97,11 @@ async def create(
         exposure_event=None,
         variants=[],
         variant_allocation={},
+        user_segments=[],
         bucketing_salt=secrets.token_hex(4),
+        evaluation_mode=EvaluationMode.STICKY,
+        layer_id=None,
+        traffic_slice=None,
         status=ExperimentStatus.DRAFT,
         created_at=datetime.now(),
         updated_at=datetime.now(),
@@ -87,18 +110,20 @@ async def create(
         query=f"""\
         INSERT INTO experiments (experiment_id, name, key, type, description,
                                  hypothesis, exposure_event, variants,
-                                 variant_allocation, bucketing_salt,
-                                 status, created_at, updated_at)
+                                 variant_allocation, user_segments,
+                                 bucketing_salt, evaluation_mode, layer_id,
+                                 traffic_slice, status, created_at, updated_at)
              VALUES (:experiment_id, :name, :key, :type, :description,
                      :hypothesis, :exposure_event, :variants,
-                     :variant_allocation, :bucketing_salt,
-                     :status, :created_at, :updated_at)
+                     :variant_allocation, :user_segments, :bucketing_salt,
+                     :evaluation_mode, :layer_id, :traffic_slice, :status,
+                     :created_at, :updated_at)
           RETURNING {READ_PARAMS}
         """,
         values=serialize(experiment),
     )
     assert rec is not None
-    return Experiment.model_validate(deserialize(rec))
+    return deserialize(rec)
 
 
 async def fetch_one(
@@ -118,21 +143,37 @@ async def fetch_one(
 async def fetch_many(
     ctx: AbstractContext,
     status: ExperimentStatus | None = None,
+    layer_id: UUID | None = None,
     page: int | None = None,
     page_size: int | None = None,
+    skip_invalid: bool = False,
 ) -> list[Experiment]:
+    """Fetch experiments, newest first.
+
+    With `skip_invalid`, experiments whose stored definitions no longer
+    validate (e.g. filters saved before operators were an enum) are logged
+    & skipped, rather than failing the whole fetch.
+    """
     query = f"""\
         SELECT {READ_PARAMS}
           FROM experiments
     """
-    values = {}
+    conditions = []
+    values: dict[str, Any] = {}
 
     if status is not None:
-        query += """\
-            WHERE status = :status
-            """
+        conditions.append("status = :status")
         values["status"] = status.value
 
+    if layer_id is not None:
+        conditions.append("layer_id = :layer_id")
+        values["layer_id"] = str(layer_id)
+
+    if conditions:
+        query += f"""\
+            WHERE {" AND ".join(conditions)}
+        """
+
     query += """\
         ORDER BY rec_id DESC
     """
@@ -146,7 +187,125 @@ async def fetch_many(
         values["offset"] = (page - 1) * page_size
 
     recs = await ctx.database.fetch_all(query, values)
-    return [deserialize(rec) for rec in recs]
+    if not skip_invalid:
+        return [deserialize(rec) for rec in recs]
+
+    experiments = []
+    for rec in recs:
+        try:
+            experiments.append(deserialize(rec))
+        except ValidationError as exc:
+            logging.error(
+                "An experiment failed validation & was skipped",
+                exc_info=exc,
+                extra={"experiment_id": rec["experiment_id"]},
+            )
+    return experiments
+
+
+async def fetch_page(
+    ctx: AbstractContext,
+    page_size: int,
+    status: ExperimentStatus | None = None,
+    cursor: int | None = None,
+    total_count_mode: TotalCountMode = TotalCountMode.EXACT,
+) -> ExperimentsPage:
+    """Fetch a page of experiments, newest first, using keyset pagination.
+
+    `cursor` is the `next_cursor` of the previous page. The collection's
+    version, & an exact total count if asked for, are fetched within the
+    same statement; a row is returned for them even if the page is empty.
+    """
+    values: dict[str, Any] = {"limit": page_size + 1}
+
+    # both maxima are read from the end of an index
+    summary_columns = [
+        "MAX(rec_id) AS version_rec_id",
+        "MAX(updated_at) AS version_updated_at",
+    ]
+    if total_count_mode is TotalCountMode.EXACT:
+        if status is not None:
+            summary_columns.append(
+                "(SELECT COUNT(*) FROM experiments WHERE status = :status)"
+                " AS total_count"
+            )
+        else:
+            summary_columns.append("COUNT(*) AS total_count")
+
+    conditions = []
+
+    if status is not None:
+        conditions.append("status = :status")
+        values["status"] = status.value
+
+    if cursor is not None:
+        conditions.append("rec_id < :cursor")
+        values["cursor"] = cursor
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""\
+        SELECT s.*, e.*
+          FROM (SELECT {", ".join(summary_columns)}
+                  FROM experiments) s
+     LEFT JOIN LATERAL (SELECT rec_id, {READ_PARAMS}
+                          FROM experiments
+                        {where}
+                      ORDER BY rec_id DESC
+                         LIMIT :limit) e
+            ON TRUE
+    """
+
+    recs = await ctx.database.fetch_all(query, values)
+    summary = recs[0]
+    if summary["rec_id"] is None:
+        recs = []
+
+    # one extra row was fetched to tell whether there's a next page
+    next_cursor = None
+    if len(recs) > page_size:
+        recs = recs[:page_size]
+        next_cursor = recs[-1]["rec_id"]
+
+    total = None
+    if total_count_mode is TotalCountMode.EXACT:
+        total = summary["total_count"]
+    elif total_count_mode is TotalCountMode.ESTIMATE:
+        total = await fetch_estimated_count(ctx, status)
+
+    version_updated_at = summary["version_updated_at"]
+    if version_updated_at is not None:
+        version = f"{summary['version_rec_id']}:{version_updated_at.isoformat()}"
+    else:
+        version = ""
+
+    return ExperimentsPage(
+        experiments=[deserialize(rec) for rec in recs],
+        next_cursor=next_cursor,
+        total=total,
+        version=version,
+    )
+
+
+async def fetch_estimated_count(
+    ctx: AbstractContext,
+    status: ExperimentStatus | None = None,
+) -> int:
+    query = """\
+        EXPLAIN (FORMAT JSON)
+         SELECT 1
+           FROM experiments
+    """
+    values = {}
+
+    if status is not None:
+        query += """\
+            WHERE status = :status
+            """
+        values["status"] = status.value
+
+    rec = await ctx.database.fetch_one(query, values)
+    assert rec is not None
+    return rec[0][0]["Plan"]["Plan Rows"]
 
 
 async def fetch_total_count(
@@ -170,6 +329,20 @@ async def fetch_total_count(
     return rec[0]
 
 
+async def fetch_updated_at(
+    ctx: AbstractContext,
+    experiment_id: UUID,
+) -> datetime | None:
+    query = """\
+        SELECT updated_at
+          FROM experiments
+         WHERE experiment_id = :experiment_id
+    """
+    values = {"experiment_id": str(experiment_id)}
+    rec = await ctx.database.fetch_one(query, values)
+    return rec["updated_at"] if rec is not None else None
+
+
 async def partial_update(
     ctx: AbstractContext,
     experiment_id: UUID,
@@ -181,7 +354,11 @@ async def partial_update(
     exposure_event: str | Unset = UNSET,
     variants: list[Variant] | Unset = UNSET,
     variant_allocation: dict[str, float] | Unset = UNSET,
+    user_segments: list[Segment] | Unset = UNSET,
     bucketing_salt: str | Unset = UNSET,
+    evaluation_mode: EvaluationMode | Unset = UNSET,
+    layer_id: UUID | None | Unset = UNSET,
+    traffic_slice: TrafficSlice | None | Unset = UNSET,
     status: ExperimentStatus | Unset = UNSET,
 ) -> Experiment | None:
     fields: dict[str, Any] = {}
@@ -194,15 +371,25 @@ async def partial_update(
     if not isinstance(description, Unset):
         fields["description"] = description
     if not isinstance(hypothesis, Unset):
-        fields["hypothesis"] = json.dumps(hypothesis.model_dump(mode="json"))
+        fields["hypothesis"] = hypothesis.model_dump(mode="json")
     if not isinstance(exposure_event, Unset):
         fields["exposure_event"] = exposure_event
     if not isinstance(variants, Unset):
-        fields["variants"] = json.dumps([v.model_dump(mode="json") for v in variants])
+        fields["variants"] = [v.model_dump(mode="json") for v in variants]
     if not isinstance(variant_allocation, Unset):
-        fields["variant_allocation"] = json.dumps(variant_allocation)
+        fields["variant_allocation"] = variant_allocation
+    if not isinstance(user_segments, Unset):
+        fields["user_segments"] = [s.model_dump(mode="json") for s in user_segments]
     if not isinstance(bucketing_salt, Unset):
         fields["bucketing_salt"] = bucketing_salt
+    if not isinstance(evaluation_mode, Unset):
+        fields["evaluation_mode"] = evaluation_mode.value
+    if not isinstance(layer_id, Unset):
+        fields["layer_id"] = str(layer_id) if layer_id is not None else None
+    if not isinstance(traffic_slice, Unset):
+        fields["traffic_slice"] = (
+            traffic_slice.model_dump(mode="json") if traffic_slice is not None else None
+        )
     if not isinstance(status, Unset):
         fields["status"] = status.value
 
@@ -0,0 +1,60 @@
+from datetime import date
+from typing import Any
+from uuid import UUID
+
+from asyncpg import Record
+
+from app.context import AbstractContext
+from app.models.exposures import ExposureCount
+
+READ_PARAMS = """\
+    variant_name, bucket_date, count
+"""
+
+
+def deserialize(data: Record) -> ExposureCount:
+    return ExposureCount.model_validate(
+        {
+            "variant_name": data["variant_name"],
+            "bucket_date": data["bucket_date"],
+            "count": data["count"],
+        }
+    )
+
+
+async def fetch_many(
+    ctx: AbstractContext,
+    experiment_id: UUID,
+    since: date | None = None,
+    until: date | None = None,
+) -> list[ExposureCount]:
+    """Fetch an experiment's daily exposure counts per variant.
+
+    The counts are maintained by the writes to `exposures`, so this reads
+    one row per variant per day rather than scanning the exposures.
+    """
+    query = f"""\
+        SELECT {READ_PARAMS}
+          FROM exposure_counts
+         WHERE experiment_id = :experiment_id
+    """
+    values: dict[str, Any] = {"experiment_id": str(experiment_id)}
+
+    if since is not None:
+        query += """\
+            AND bucket_date >= :since
+        """
+        values["since"] = since
+
+    if until is not None:
+        query += """\
+            AND bucket_date <= :until
+        """
+        values["until"] = until
+
+    query += """\
+        ORDER BY bucket_date, variant_name
+    """
+
+    recs = await ctx.database.fetch_all(query, values)
+    return [deserialize(rec) for rec in recs]
@@ -1,17 +1,36 @@
+from collections.abc import AsyncIterator
 from datetime import datetime
 from typing import Any
 from uuid import UUID
 
-from databases.interfaces import Record
+from asyncpg import Record
 
 from app.context import AbstractContext
+from app.models.exposures import ExperimentExposuresSummary
 from app.models.exposures import Exposure
+from app.models.exposures import ExposureBatchItem
 
 
 READ_PARAMS = """\
     experiment_id, user_id, variant_name, created_at
 """
 
+# Rolls the rows of an `inserted` CTE up into the daily per-variant counts.
+# Used as a CTE alongside every write to `exposures`, so that only rows
+# which were actually inserted are counted. Upserts are ordered so that
+# concurrent writers lock the counter rows in the same order.
+INCREMENT_EXPOSURE_COUNTS = """\
+    INSERT INTO exposure_counts (experiment_id, variant_name, bucket_date,
+                                 count)
+         SELECT experiment_id, variant_name, CAST(created_at AS DATE),
+                COUNT(*)
+           FROM inserted
+       GROUP BY 1, 2, 3
+       ORDER BY 1, 2, 3
+    ON CONFLICT (experiment_id, variant_name, bucket_date)
+      DO UPDATE SET count = exposure_counts.count + EXCLUDED.count
+"""
+
 
 def serialize(experiment: Exposure) -> dict[str, Any]:
     return {
@@ -47,13 +66,172 @@ async def create(
     )
     rec = await ctx.database.fetch_one(
         f"""\
-        INSERT INTO exposures (experiment_id, user_id, variant_name,
-                               created_at)
-             VALUES (:experiment_id, :user_id, :variant_name,
-                     :created_at)
-          RETURNING {READ_PARAMS}
+        WITH inserted AS (
+            INSERT INTO exposures (experiment_id, user_id, variant_name,
+                                   created_at)
+                 VALUES (:experiment_id, :user_id, :variant_name,
+                         :created_at)
+              RETURNING {READ_PARAMS}
+        ), counted AS (
+            {INCREMENT_EXPOSURE_COUNTS}
+        )
+        SELECT {READ_PARAMS}
+          FROM inserted
         """,
         values=serialize(exposure),
     )
     assert rec is not None
-    return Exposure.model_validate(deserialize(rec))
+    return deserialize(rec)
+
+
+async def copy_many(
+    ctx: AbstractContext,
+    exposures: list[Exposure],
+) -> int:
+    """Bulk load exposures, skipping any which already exist.
+
+    Rows are streamed into a staging table with COPY, then moved into
+    `exposures` with a single INSERT ... ON CONFLICT DO NOTHING.
+    """
+    async with ctx.database.transaction():
+        await ctx.database.execute(
+            """\
+            CREATE TEMPORARY TABLE exposures_staging (
+                experiment_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                variant_name TEXT NOT NULL,
+                created_at TIMESTAMP NOT NULL
+            ) ON COMMIT DROP
+            """
+        )
+        await ctx.database.copy_records_to_table(
+            "exposures_staging",
+            records=[
+                (
+                    str(exposure.experiment_id),
+                    exposure.user_id,
+                    exposure.variant_name,
+                    exposure.created_at,
+                )
+                for exposure in exposures
+            ],
+            columns=["experiment_id", "user_id", "variant_name", "created_at"],
+        )
+        return await ctx.database.fetch_val(
+            f"""\
+            WITH inserted AS (
+                INSERT INTO exposures (experiment_id, user_id,
+                                       variant_name, created_at)
+                     SELECT experiment_id, user_id, variant_name, created_at
+                       FROM exposures_staging
+                ON CONFLICT (experiment_id, user_id) DO NOTHING
+                  RETURNING experiment_id, variant_name, created_at
+            ), counted AS (
+                {INCREMENT_EXPOSURE_COUNTS}
+            )
+            SELECT COUNT(*)
+              FROM inserted
+            """
+        )
+
+
+async def fetch_experiment_exposures(
+    ctx: AbstractContext,
+    experiment_id: UUID,
+    chunk_size: int,
+) -> AsyncIterator[list[Record]]:
+    """Stream the (user_id, variant_name, created_at) of an experiment's
+    exposures."""
+    query = """\
+        SELECT user_id, variant_name, created_at
+          FROM exposures
+         WHERE experiment_id = :experiment_id
+    """
+    values = {"experiment_id": str(experiment_id)}
+    async for recs in ctx.database.fetch_chunks(query, values, chunk_size):
+        yield recs
+
+
+async def fetch_watermark(ctx: AbstractContext, experiment_id: UUID) -> int:
+    """Fetch the highest rec_id of an experiment's exposures."""
+    # (scoped to the experiment, so it's read from the end of the primary
+    # key of its partition alone)
+    query = """\
+        SELECT COALESCE(MAX(rec_id), 0)
+          FROM exposures
+         WHERE experiment_id = :experiment_id
+    """
+    values = {"experiment_id": str(experiment_id)}
+    return await ctx.database.fetch_val(query, values)
+
+
+async def create_many(
+    ctx: AbstractContext,
+    items: list[ExposureBatchItem],
+    variant_names: list[str | None],
+) -> list[ExperimentExposuresSummary]:
+    """Track exposures for many (experiment, user) pairs in a single statement.
+
+    Pairs without a variant name are checked against their assignment, which
+    provides the variant; pairs without a variant or with an existing
+    exposure are skipped. Counts are over the distinct pairs in `items`,
+    except that repeats of a pair with a variant count as duplicates.
+    """
+    if not items:
+        return []
+
+    query = f"""\
+        WITH new_exposures AS (
+            SELECT experiment_id, user_id, MAX(variant_name) AS variant_name,
+                   COUNT(*) AS occurrences
+              FROM UNNEST(CAST(:experiment_ids AS TEXT[]),
+                          CAST(:user_ids AS TEXT[]),
+                          CAST(:variant_names AS TEXT[]))
+                AS t (experiment_id, user_id, variant_name)
+          GROUP BY experiment_id, user_id
+        ), resolved_exposures AS (
+            SELECT n.experiment_id, n.user_id, n.occurrences,
+                   COALESCE(n.variant_name, a.variant_name) AS variant_name
+              FROM new_exposures n
+         LEFT JOIN assignments a
+                ON a.experiment_id = n.experiment_id
+               AND a.user_id = n.user_id
+        ), inserted AS (
+            INSERT INTO exposures (experiment_id, user_id, variant_name,
+                                   created_at)
+                 SELECT experiment_id, user_id, variant_name, :created_at
+                   FROM resolved_exposures
+                  WHERE variant_name IS NOT NULL
+            ON CONFLICT (experiment_id, user_id) DO NOTHING
+              RETURNING experiment_id, user_id, variant_name, created_at
+        ), counted AS (
+            {INCREMENT_EXPOSURE_COUNTS}
+        )
+        SELECT r.experiment_id,
+               COUNT(i.user_id) AS created,
+               CAST(COALESCE(SUM(r.occurrences)
+                             FILTER (WHERE r.variant_name IS NOT NULL), 0)
+                    AS BIGINT) - COUNT(i.user_id) AS duplicate,
+               COUNT(*) - COUNT(r.variant_name) AS unassigned
+          FROM resolved_exposures r
+     LEFT JOIN inserted i
+            ON i.experiment_id = r.experiment_id
+           AND i.user_id = r.user_id
+      GROUP BY r.experiment_id
+    """
+    values = {
+        "experiment_ids": [str(item.experiment_id) for item in items],
+        "user_ids": [item.user_id for item in items],
+        "variant_names": variant_names,
+        "created_at": datetime.utcnow(),
+    }
+    recs = await ctx.database.fetch_all(query, values)
+    return [
+        ExperimentExposuresSummary(
+            experiment_id=rec["experiment_id"],
+            created=rec["created"],
+            duplicate=rec["duplicate"],
+            unassigned=rec["unassigned"],
+        )
+        for rec in recs
+    ]
@@ -0,0 +1,138 @@
+import secrets
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+from uuid import uuid4
+
+from asyncpg import Record
+
+from app._typing import UNSET
+from app._typing import Unset
+from app.context import AbstractContext
+from app.models.holdouts import Holdout
+from app.models.holdouts import HoldoutStatus
+
+READ_PARAMS = """\
+    holdout_id, name, key, bucketing_salt, traffic, status, created_at,
+    updated_at
+"""
+
+
+def serialize(holdout: Holdout) -> dict[str, Any]:
+    return {
+        "holdout_id": str(holdout.holdout_id),
+        "name": holdout.name,
+        "key": holdout.key,
+        "bucketing_salt": holdout.bucketing_salt,
+        "traffic": holdout.traffic,
+        "status": holdout.status.value,
+        "created_at": holdout.created_at,
+        "updated_at": holdout.updated_at,
+    }
+
+
+def deserialize(data: Record) -> Holdout:
+    return Holdout.model_validate(
+        {
+            "holdout_id": data["holdout_id"],
+            "name": data["name"],
+            "key": data["key"],
+            "bucketing_salt": data["bucketing_salt"],
+            "traffic": data["traffic"],
+            "status": HoldoutStatus(data["status"]),
+            "created_at": data["created_at"],
+            "updated_at": data["updated_at"],
+        }
+    )
+
+
+async def create(
+    ctx: AbstractContext,
+    holdout_name: str,
+    holdout_key: str,
+    traffic: int,
+) -> Holdout:
+    holdout = Holdout(
+        holdout_id=uuid4(),
+        name=holdout_name,
+        key=holdout_key,
+        bucketing_salt=secrets.token_hex(4),
+        traffic=traffic,
+        status=HoldoutStatus.DRAFT,
+        created_at=datetime.now(),
+        updated_at=datetime.now(),
+    )
+    rec = await ctx.database.fetch_one(
+        f"""\
+        INSERT INTO holdouts (holdout_id, name, key, bucketing_salt, traffic,
+                              status, created_at, updated_at)
+             VALUES (:holdout_id, :name, :key, :bucketing_salt, :traffic,
+                     :status, :created_at, :updated_at)
+          RETURNING {READ_PARAMS}
+        """,
+        values=serialize(holdout),
+    )
+    assert rec is not None
+    return deserialize(rec)
+
+
+async def fetch_one(ctx: AbstractContext, holdout_id: UUID) -> Holdout | None:
+    query = f"""\
+        SELECT {READ_PARAMS}
+          FROM holdouts
+         WHERE holdout_id = :holdout_id
+    """
+    values = {"holdout_id": str(holdout_id)}
+    rec = await ctx.database.fetch_one(query, values)
+    return deserialize(rec) if rec is not None else None
+
+
+async def fetch_many(
+    ctx: AbstractContext,
+    status: HoldoutStatus | None = None,
+) -> list[Holdout]:
+    query = f"""\
+        SELECT {READ_PARAMS}
+          FROM holdouts
+    """
+    values: dict[str, Any] = {}
+
+    if status is not None:
+        query += """\
+            WHERE status = :status
+        """
+        values["status"] = status.value
+
+    query += """\
+        ORDER BY rec_id
+    """
+    recs = await ctx.database.fetch_all(query, values)
+    return [deserialize(rec) for rec in recs]
+
+
+async def partial_update(
+    ctx: AbstractContext,
+    holdout_id: UUID,
+    holdout_name: str | Unset = UNSET,
+    traffic: int | Unset = UNSET,
+    status: HoldoutStatus | Unset = UNSET,
+) -> Holdout | None:
+    fields: dict[str, Any] = {}
+    if not isinstance(holdout_name, Unset):
+        fields["name"] = holdout_name
+    if not isinstance(traffic, Unset):
+        fields["traffic"] = traffic
+    if not isinstance(status, Unset):
+        fields["status"] = status.value
+
+    fields["updated_at"] = datetime.now()
+
+    query = f"""\
+        UPDATE holdouts
+           SET {', '.join(f"{k} = :{k}" for k in fields)}
+         WHERE holdout_id = :holdout_id
+     RETURNING {READ_PARAMS}
+    """
+    values = {"holdout_id": str(holdout_id), **fields}
+    rec = await ctx.database.fetch_one(query, values)
+    return deserialize(rec) if rec is not None else None
@@ -0,0 +1,107 @@
+import secrets
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+from uuid import uuid4
+
+from asyncpg import Record
+
+from app.context import AbstractContext
+from app.models.layers import Layer
+
+READ_PARAMS = """\
+    layer_id, name, key, bucketing_salt, created_at, updated_at
+"""
+
+
+def serialize(layer: Layer) -> dict[str, Any]:
+    return {
+        "layer_id": str(layer.layer_id),
+        "name": layer.name,
+        "key": layer.key,
+        "bucketing_salt": layer.bucketing_salt,
+        "created_at": layer.created_at,
+        "updated_at": layer.updated_at,
+    }
+
+
+def deserialize(data: Record) -> Layer:
+    return Layer.model_validate(
+        {
+            "layer_id": data["layer_id"],
+            "name": data["name"],
+            "key": data["key"],
+            "bucketing_salt": data["bucketing_salt"],
+            "created_at": data["created_at"],
+            "updated_at": data["updated_at"],
+        }
+    )
+
+
+async def create(
+    ctx: AbstractContext,
+    layer_name: str,
+    layer_key: str,
+) -> Layer:
+    layer = Layer(
+        layer_id=uuid4(),
+        name=layer_name,
+        key=layer_key,
+        bucketing_salt=secrets.token_hex(4),
+        created_at=datetime.now(),
+        updated_at=datetime.now(),
+    )
+    rec = await ctx.database.fetch_one(
+        f"""\
+        INSERT INTO layers (layer_id, name, key, bucketing_salt, created_at,
+                            updated_at)
+             VALUES (:layer_id, :name, :key, :bucketing_salt, :created_at,
+                     :updated_at)
+          RETURNING {READ_PARAMS}
+        """,
+        values=serialize(layer),
+    )
+    assert rec is not None
+    return deserialize(rec)
+
+
+async def fetch_one(ctx: AbstractContext, layer_id: UUID) -> Layer | None:
+    query = f"""\
+        SELECT {READ_PARAMS}
+          FROM layers
+         WHERE layer_id = :layer_id
+    """
+    values = {"layer_id": str(layer_id)}
+    rec = await ctx.database.fetch_one(query, values)
+    return deserialize(rec) if rec is not None else None
+
+
+async def fetch_many(
+    ctx: AbstractContext,
+    layer_ids: list[UUID] | None = None,
+) -> list[Layer]:
+    query = f"""\
+        SELECT {READ_PARAMS}
+          FROM layers
+    """
+    values: dict[str, Any] = {}
+
+    if layer_ids is not None:
+        query += """\
+            WHERE layer_id = ANY(:layer_ids)
+        """
+        values["layer_ids"] = [str(layer_id) for layer_id in layer_ids]
+
+    query += """\
+        ORDER BY rec_id
+    """
+    recs = await ctx.database.fetch_all(query, values)
+    return [deserialize(rec) for rec in recs]
+
+
+async def lock(ctx: AbstractContext, layer_id: UUID) -> None:
+    """Serialize changes to a layer's traffic until the transaction ends."""
+    await ctx.database.execute(
+        "SELECT pg_advisory_xact_lock(hashtext(:layer_id))",
+        {"layer_id": str(layer_id)},
+    )
@@ -0,0 +1,75 @@
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+
+from asyncpg import Record
+
+from app.context import AbstractContext
+from app.models.results import MetricAggregates
+
+READ_PARAMS = """\
+    experiment_id, metric_hash, exposure_watermark, event_watermark, variants,
+    updated_at
+"""
+
+
+def serialize(aggregates: MetricAggregates) -> dict[str, Any]:
+    return {
+        "experiment_id": str(aggregates.experiment_id),
+        "metric_hash": aggregates.metric_hash,
+        "exposure_watermark": aggregates.exposure_watermark,
+        "event_watermark": aggregates.event_watermark,
+        "variants": {
+            variant_name: statistics.model_dump(mode="json")
+            for variant_name, statistics in aggregates.variants.items()
+        },
+        "updated_at": aggregates.updated_at,
+    }
+
+
+def deserialize(data: Record) -> MetricAggregates:
+    return MetricAggregates.model_validate(
+        {
+            "experiment_id": data["experiment_id"],
+            "metric_hash": data["metric_hash"],
+            "exposure_watermark": data["exposure_watermark"],
+            "event_watermark": data["event_watermark"],
+            "variants": data["variants"],
+            "updated_at": data["updated_at"],
+        }
+    )
+
+
+async def fetch_one(
+    ctx: AbstractContext,
+    experiment_id: UUID,
+    metric_hash: str,
+) -> MetricAggregates | None:
+    query = f"""\
+        SELECT {READ_PARAMS}
+          FROM metric_aggregates
+         WHERE experiment_id = :experiment_id
+           AND metric_hash = :metric_hash
+    """
+    values = {"experiment_id": str(experiment_id), "metric_hash": metric_hash}
+    rec = await ctx.database.fetch_one(query, values)
+    return deserialize(rec) if rec is not None else None
+
+
+async def upsert(ctx: AbstractContext, aggregates: MetricAggregates) -> None:
+    """Persist aggregates, unless newer ones were persisted concurrently."""
+    query = """\
+        INSERT INTO metric_aggregates (experiment_id, metric_hash,
+                                       exposure_watermark, event_watermark,
+                                       variants, updated_at)
+             VALUES (:experiment_id, :metric_hash, :exposure_watermark,
+                     :event_watermark, :variants, :updated_at)
+        ON CONFLICT (experiment_id, metric_hash) DO UPDATE
+                SET exposure_watermark = EXCLUDED.exposure_watermark,
+                    event_watermark = EXCLUDED.event_watermark,
+                    variants = EXCLUDED.variants,
+                    updated_at = EXCLUDED.updated_at
+              WHERE metric_aggregates.exposure_watermark <= EXCLUDED.exposure_watermark
+                AND metric_aggregates.event_watermark <= EXCLUDED.event_watermark
+    """
+    await ctx.database.execute(query, serialize(aggregates))
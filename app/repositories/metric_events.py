@@ -0,0 +1,200 @@
+from collections.abc import AsyncIterator
+from typing import Any
+from typing import assert_never
+from uuid import UUID
+
+from asyncpg import Record
+
+from app.context import AbstractContext
+from app.models.experiments import EventSegmentationMetric
+from app.models.experiments import MetricType
+from app.models.experiments import NUMERIC_PROPERTY_FILTER_OPERATORS
+from app.models.experiments import PropertyFilter
+from app.models.experiments import PropertyFilterOperator
+from app.models.metric_events import MetricEvent
+
+
+READ_PARAMS = """\
+    user_id, event, properties, created_at
+"""
+
+PROPERTY_FILTER_OPERATORS = {
+    PropertyFilterOperator.EQUALS: "=",
+    # events without the property don't equal the value either
+    PropertyFilterOperator.NOT_EQUALS: "IS DISTINCT FROM",
+    PropertyFilterOperator.GREATER_THAN: ">",
+    PropertyFilterOperator.GREATER_THAN_OR_EQUAL: ">=",
+    PropertyFilterOperator.LESS_THAN: "<",
+    PropertyFilterOperator.LESS_THAN_OR_EQUAL: "<=",
+}
+
+
+def serialize(event: MetricEvent) -> dict[str, Any]:
+    return {
+        "user_id": event.user_id,
+        "event": event.event,
+        "properties": event.properties,
+        "created_at": event.created_at,
+    }
+
+
+def deserialize(data: Record) -> MetricEvent:
+    return MetricEvent.model_validate(
+        {
+            "user_id": data["user_id"],
+            "event": data["event"],
+            "properties": data["properties"],
+            "created_at": data["created_at"],
+        }
+    )
+
+
+async def create_many(ctx: AbstractContext, events: list[MetricEvent]) -> int:
+    if not events:
+        return 0
+
+    query = """\
+        INSERT INTO metric_events (user_id, event, properties, created_at)
+             SELECT *
+               FROM UNNEST(CAST(:user_ids AS TEXT[]),
+                           CAST(:events AS TEXT[]),
+                           CAST(:properties AS JSONB[]),
+                           CAST(:created_ats AS TIMESTAMP[]))
+    """
+    values = {
+        "user_ids": [event.user_id for event in events],
+        "events": [event.event for event in events],
+        "properties": [event.properties for event in events],
+        "created_ats": [event.created_at for event in events],
+    }
+    status = await ctx.database.execute(query, values)
+    # asyncpg returns the command tag, e.g. "INSERT 0 42"
+    return int(status.split()[-1])
+
+
+async def fetch_watermark(ctx: AbstractContext) -> int:
+    """Fetch the highest rec_id of any metric event."""
+    query = """\
+        SELECT COALESCE(MAX(rec_id), 0)
+          FROM metric_events
+    """
+    return await ctx.database.fetch_val(query)
+
+
+def numeric_property(param_name: str) -> str:
+    # null for events where the property is missing or not a number
+    return f"""\
+        CASE WHEN jsonb_typeof(e.properties -> :{param_name}) = 'number'
+             THEN CAST(e.properties -> :{param_name} AS DOUBLE PRECISION)
+        END"""
+
+
+def compile_property_filters(
+    property_filters: list[PropertyFilter],
+    values: dict[str, Any],
+) -> list[str]:
+    conditions = []
+    for index, property_filter in enumerate(property_filters):
+        property_param = f"filter_{index}_property"
+        value_param = f"filter_{index}_value"
+        operator = PROPERTY_FILTER_OPERATORS[property_filter.operator]
+
+        values[property_param] = property_filter.property
+        if property_filter.operator in NUMERIC_PROPERTY_FILTER_OPERATORS:
+            values[value_param] = float(property_filter.value)
+            conditions.append(
+                f"{numeric_property(property_param)} {operator} :{value_param}"
+            )
+        else:
+            values[value_param] = property_filter.value
+            conditions.append(
+                f"e.properties ->> :{property_param} {operator} :{value_param}"
+            )
+    return conditions
+
+
+def compile_metric_values(metric: EventSegmentationMetric, where: str) -> str:
+    """Aggregate a user's joined events into their value & denominator."""
+    events = f"COUNT(e.rec_id){where}"
+    if metric.type is MetricType.UNIQUES:
+        return f"CAST({events} > 0 AS INT), 0"
+    elif metric.type is MetricType.EVENT_TOTALS:
+        return f"{events}, 0"
+
+    property_sum = f"COALESCE(SUM({numeric_property('metric_property')}){where}, 0)"
+    if metric.type is MetricType.PROPERTY_SUM:
+        return f"{property_sum}, 0"
+    elif metric.type is MetricType.PROPERTY_AVERAGE:
+        return f"{property_sum}, COUNT({numeric_property('metric_property')}){where}"
+    else:
+        assert_never(metric.type)
+
+
+async def fetch_user_value_changes(
+    ctx: AbstractContext,
+    experiment_id: UUID,
+    metric: EventSegmentationMetric,
+    old_exposure_watermark: int,
+    new_exposure_watermark: int,
+    old_event_watermark: int,
+    new_event_watermark: int,
+    chunk_size: int,
+) -> AsyncIterator[list[Record]]:
+    """Stream the metric values of exposed users which changed between the
+    old & new watermarks.
+
+    A user's value changes if they were exposed, or had a matching event,
+    after the old watermarks. Each row holds the user's variant, whether
+    they'd been exposed as of the old watermarks, and their value &
+    denominator as of both the old & new watermarks. Only events since the
+    user's exposure count towards their value.
+    """
+    values: dict[str, Any] = {
+        "experiment_id": str(experiment_id),
+        "event": metric.event,
+        "old_exposure_watermark": old_exposure_watermark,
+        "new_exposure_watermark": new_exposure_watermark,
+        "old_event_watermark": old_event_watermark,
+        "new_event_watermark": new_event_watermark,
+    }
+    if metric.property is not None:
+        values["metric_property"] = metric.property
+
+    conditions = compile_property_filters(metric.property_filters or [], values)
+    property_filters = "".join(f"\n           AND {c}" for c in conditions)
+
+    old_values = compile_metric_values(
+        metric,
+        where=" FILTER (WHERE e.rec_id <= :old_event_watermark)",
+    )
+    new_values = compile_metric_values(metric, where="")
+
+    query = f"""\
+        WITH changed_users AS (
+            SELECT x.user_id, x.variant_name, x.created_at AS exposed_at,
+                   x.rec_id <= :old_exposure_watermark AS was_exposed
+              FROM exposures x
+             WHERE x.experiment_id = :experiment_id
+               AND x.rec_id <= :new_exposure_watermark
+               AND (x.rec_id > :old_exposure_watermark
+                    OR x.user_id IN (
+                        SELECT user_id
+                          FROM metric_events
+                         WHERE event = :event
+                           AND rec_id > :old_event_watermark
+                           AND rec_id <= :new_event_watermark
+                    ))
+        )
+        SELECT u.variant_name, u.was_exposed,
+               {old_values},
+               {new_values}
+          FROM changed_users u
+     LEFT JOIN metric_events e
+            ON e.user_id = u.user_id
+           AND e.event = :event
+           AND e.created_at >= u.exposed_at
+           AND e.rec_id <= :new_event_watermark{property_filters}
+      GROUP BY u.user_id, u.variant_name, u.was_exposed, u.exposed_at
+    """
+    async for recs in ctx.database.fetch_chunks(query, values, chunk_size):
+        yield recs
@@ -0,0 +1,148 @@
+from datetime import datetime
+from uuid import UUID
+
+from app.context import AbstractContext
+
+# tables which are list partitioned by experiment_id
+PARTITIONED_TABLES = ("assignments", "exposures")
+
+# detached partitions of archived experiments are moved into this schema
+ARCHIVE_SCHEMA = "archive"
+
+# partitions are attached & detached while the tables are being written to;
+# give up rather than queue every other query behind a lock we can't get
+LOCK_TIMEOUT = "5s"
+
+
+def get_partition_name(table: str, experiment_id: UUID) -> str:
+    return f"{table}_{experiment_id.hex}"
+
+
+async def _is_attached(ctx: AbstractContext, table: str, partition: str) -> bool:
+    query = """\
+        SELECT EXISTS (
+            SELECT 1
+              FROM pg_inherits i
+              JOIN pg_class c ON c.oid = i.inhrelid
+             WHERE i.inhparent = CAST(:table AS REGCLASS)
+               AND c.relname = :partition
+        )
+    """
+    values = {"table": table, "partition": partition}
+    return await ctx.database.fetch_val(query, values)
+
+
+async def _drop_indexes(ctx: AbstractContext, table: str) -> None:
+    # archived tables aren't queried by the application, & their index
+    # names would clash with those of the experiment's later partitions
+    constraints = await ctx.database.fetch_all(
+        """\
+        SELECT conname
+          FROM pg_constraint
+         WHERE conrelid = CAST(:table AS REGCLASS)
+           AND contype IN ('p', 'u')
+        """,
+        {"table": table},
+    )
+    for rec in constraints:
+        await ctx.database.execute(
+            f'ALTER TABLE {table} DROP CONSTRAINT "{rec["conname"]}"'
+        )
+
+    indexes = await ctx.database.fetch_all(
+        """\
+        SELECT c.relname
+          FROM pg_index i
+          JOIN pg_class c ON c.oid = i.indexrelid
+         WHERE i.indrelid = CAST(:table AS REGCLASS)
+        """,
+        {"table": table},
+    )
+    for rec in indexes:
+        await ctx.database.execute(f'DROP INDEX "{rec["relname"]}"')
+
+
+async def is_archived(ctx: AbstractContext, experiment_id: UUID) -> bool:
+    """Whether a started experiment's exposures have been detached."""
+    table = "exposures"
+    return not await _is_attached(ctx, table, get_partition_name(table, experiment_id))
+
+
+async def create_experiment_partitions(
+    ctx: AbstractContext,
+    experiment_id: UUID,
+) -> None:
+    """Create an experiment's partitions of each partitioned table, unless
+    they already exist.
+
+    Partitions are created standalone & then attached. Attaching takes a
+    SHARE UPDATE EXCLUSIVE lock on the parent, which allows concurrent reads
+    & writes of it, but an ACCESS EXCLUSIVE lock on its default partition,
+    which is scanned for rows belonging to the new partition. It only holds
+    rows of experiments without a partition of their own (not yet started,
+    or archived), so it's expected to stay small & the scan brief; queries
+    which can't prune the default partition wait until the transaction
+    commits.
+    """
+    async with ctx.database.transaction():
+        await ctx.database.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        for table in PARTITIONED_TABLES:
+            partition = get_partition_name(table, experiment_id)
+            # serialize concurrent attempts to create the same partition
+            await ctx.database.execute(
+                "SELECT pg_advisory_xact_lock(hashtext(:partition))",
+                {"partition": partition},
+            )
+            if await _is_attached(ctx, table, partition):
+                continue
+
+            # identifiers & partition bounds can't be bound as parameters;
+            # both are derived from the experiment's uuid
+            await ctx.database.execute(
+                f"""\
+                CREATE TABLE {partition} (
+                    LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+                )
+                """
+            )
+            await ctx.database.execute(
+                f"""\
+                ALTER TABLE {table}
+                    ATTACH PARTITION {partition}
+                    FOR VALUES IN ('{experiment_id}')
+                """
+            )
+
+
+async def archive_experiment_partitions(
+    ctx: AbstractContext,
+    experiment_id: UUID,
+) -> None:
+    """Detach an experiment's partitions & move them into the archive schema.
+
+    Tables which are already detached are skipped. Detaching takes an ACCESS
+    EXCLUSIVE lock on the parent (`DETACH PARTITION ... CONCURRENTLY` isn't
+    allowed while a default partition exists), so reads & writes of the
+    table wait until the transaction commits.
+    """
+    archived_at = datetime.utcnow()
+
+    async with ctx.database.transaction():
+        await ctx.database.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        for table in PARTITIONED_TABLES:
+            partition = get_partition_name(table, experiment_id)
+            if not await _is_attached(ctx, table, partition):
+                continue
+
+            # an experiment may be archived, restarted & archived again
+            archived_name = f"{partition}_{archived_at:%Y%m%d%H%M%S}"
+            await ctx.database.execute(
+                f"ALTER TABLE {table} DETACH PARTITION {partition}"
+            )
+            await _drop_indexes(ctx, partition)
+            await ctx.database.execute(
+                f"ALTER TABLE {partition} RENAME TO {archived_name}"
+            )
+            await ctx.database.execute(
+                f"ALTER TABLE {archived_name} SET SCHEMA {ARCHIVE_SCHEMA}"
+            )
@@ -0,0 +1,257 @@
+import hashlib
+import math
+from collections.abc import Mapping
+from collections.abc import Sequence
+from statistics import NormalDist
+
+import numpy as np
+import numpy.typing as npt
+import orjson
+
+from app.models.experiments import Direction
+from app.models.experiments import EventSegmentationMetric
+from app.models.experiments import MetricEffect
+from app.models.experiments import MetricType
+from app.models.experiments import PROPERTY_METRIC_TYPES
+from app.models.results import MetricEffectResult
+from app.models.results import SufficientStatistics
+from app.models.results import VariantComparison
+from app.models.results import VariantResult
+
+# the columns of a StatisticsAccumulator's array
+USERS = 0
+SUM = 1
+SUM_OF_SQUARES = 2
+DENOMINATOR_SUM = 3
+DENOMINATOR_SUM_OF_SQUARES = 4
+CROSS_SUM = 5
+
+
+def get_metric_hash(metric: EventSegmentationMetric) -> str:
+    """Identify a metric by the parts of its definition that affect values."""
+    definition = metric.model_dump(mode="json", exclude={"name"})
+    return hashlib.sha256(
+        orjson.dumps(definition, option=orjson.OPT_SORT_KEYS)
+    ).hexdigest()
+
+
+def is_computable(metric: EventSegmentationMetric) -> bool:
+    """Whether a metric's definition is complete enough to compute."""
+    if metric.event is None:
+        return False
+    if metric.type in PROPERTY_METRIC_TYPES and metric.property is None:
+        return False
+    return True
+
+
+def is_ratio_metric(metric: EventSegmentationMetric) -> bool:
+    return metric.type is MetricType.PROPERTY_AVERAGE
+
+
+class StatisticsAccumulator:
+    """Sufficient statistics of a metric, per variant.
+
+    Updated with the change in users' values since the last update, so the
+    statistics can be maintained without rescanning users that are
+    unchanged.
+    """
+
+    __slots__ = ("_variant_names", "_statistics")
+
+    def __init__(
+        self,
+        variant_names: Sequence[str],
+        statistics: Mapping[str, SufficientStatistics] | None = None,
+    ) -> None:
+        self._variant_names = tuple(variant_names)
+        self._statistics = np.zeros((len(variant_names), 6), dtype=np.float64)
+        for index, variant_name in enumerate(self._variant_names):
+            if statistics is not None and variant_name in statistics:
+                s = statistics[variant_name]
+                self._statistics[index] = (
+                    s.users,
+                    s.sum,
+                    s.sum_of_squares,
+                    s.denominator_sum,
+                    s.denominator_sum_of_squares,
+                    s.cross_sum,
+                )
+
+    @property
+    def variant_names(self) -> tuple[str, ...]:
+        return self._variant_names
+
+    def update(
+        self,
+        variant_indices: npt.NDArray[np.intp],
+        was_exposed: npt.NDArray[np.bool_],
+        old_values: npt.NDArray[np.float64],
+        new_values: npt.NDArray[np.float64],
+        old_denominators: npt.NDArray[np.float64],
+        new_denominators: npt.NDArray[np.float64],
+    ) -> None:
+        """Replace users' old values with their new ones.
+
+        Users who weren't exposed at the time of the last update are added;
+        their old values are ignored.
+        """
+        was_exposed = was_exposed.astype(np.float64)
+        old_values = old_values * was_exposed
+        old_denominators = old_denominators * was_exposed
+
+        columns = {
+            USERS: 1.0 - was_exposed,
+            SUM: new_values - old_values,
+            SUM_OF_SQUARES: new_values**2 - old_values**2,
+            DENOMINATOR_SUM: new_denominators - old_denominators,
+            DENOMINATOR_SUM_OF_SQUARES: new_denominators**2 - old_denominators**2,
+            CROSS_SUM: new_values * new_denominators - old_values * old_denominators,
+        }
+        for column, weights in columns.items():
+            self._statistics[:, column] += np.bincount(
+                variant_indices,
+                weights=weights,
+                minlength=len(self._variant_names),
+            )
+
+    def get_statistics(self) -> dict[str, SufficientStatistics]:
+        return {
+            variant_name: SufficientStatistics(
+                users=round(row[USERS]),
+                sum=row[SUM],
+                sum_of_squares=row[SUM_OF_SQUARES],
+                denominator_sum=row[DENOMINATOR_SUM],
+                denominator_sum_of_squares=row[DENOMINATOR_SUM_OF_SQUARES],
+                cross_sum=row[CROSS_SUM],
+            )
+            for variant_name, row in zip(self._variant_names, self._statistics)
+        }
+
+
+def get_mean_and_variance(
+    statistics: SufficientStatistics,
+    ratio: bool,
+) -> tuple[float, float] | None:
+    """Estimate a variant's mean & the variance of that estimate.
+
+    Ratio metrics (sum of values / sum of denominators) use the delta method.
+    Returns None if there are too few users to estimate the variance.
+    """
+    n = statistics.users
+    if n < 2:
+        return None
+
+    x_mean = statistics.sum / n
+    x_variance = (statistics.sum_of_squares - n * x_mean**2) / (n - 1)
+    if not ratio:
+        return x_mean, max(x_variance, 0.0) / n
+
+    y_mean = statistics.denominator_sum / n
+    if y_mean == 0:
+        return None
+    y_variance = (statistics.denominator_sum_of_squares - n * y_mean**2) / (n - 1)
+    covariance = (statistics.cross_sum - n * x_mean * y_mean) / (n - 1)
+
+    mean = x_mean / y_mean
+    variance = (x_variance - 2 * mean * covariance + mean**2 * y_variance) / (
+        n * y_mean**2
+    )
+    return mean, max(variance, 0.0)
+
+
+def compare_variants(
+    variant_name: str,
+    control: tuple[float, float] | None,
+    treatment: tuple[float, float] | None,
+    direction: Direction,
+    minimum_goal: float,
+    confidence_level: float,
+) -> VariantComparison:
+    """Compare a treatment to the control by relative lift."""
+    if control is None or treatment is None or control[0] == 0:
+        return VariantComparison(
+            variant_name=variant_name,
+            lift=None,
+            confidence_interval=None,
+            p_value=None,
+            goal_met=False,
+        )
+
+    control_mean, control_variance = control
+    treatment_mean, treatment_variance = treatment
+
+    lift = (treatment_mean - control_mean) / control_mean
+    # delta method approximation of the variance of treatment / control
+    lift_variance = (
+        treatment_variance / control_mean**2
+        + treatment_mean**2 * control_variance / control_mean**4
+    )
+    z = NormalDist().inv_cdf(0.5 + confidence_level / 2)
+    margin = z * math.sqrt(lift_variance)
+    lower, upper = (lift - margin) * 100, (lift + margin) * 100
+
+    standard_error = math.sqrt(control_variance + treatment_variance)
+    if standard_error > 0:
+        z_score = (treatment_mean - control_mean) / standard_error
+        p_value = 2 * (1 - NormalDist().cdf(abs(z_score)))
+    else:
+        p_value = None
+
+    # the whole interval must clear the goal in the desired direction
+    if direction is Direction.INCREASE:
+        goal_met = lower >= minimum_goal
+    else:
+        goal_met = upper <= -minimum_goal
+
+    return VariantComparison(
+        variant_name=variant_name,
+        lift=lift * 100,
+        confidence_interval=(lower, upper),
+        p_value=p_value,
+        goal_met=goal_met,
+    )
+
+
+def get_metric_effect_result(
+    metric_effect: MetricEffect,
+    statistics: Mapping[str, SufficientStatistics],
+    variant_names: Sequence[str],
+    confidence_level: float,
+) -> MetricEffectResult:
+    """Compare each variant against the first (control) variant."""
+    ratio = is_ratio_metric(metric_effect.metric)
+
+    estimates = {
+        variant_name: get_mean_and_variance(statistics[variant_name], ratio)
+        for variant_name in variant_names
+    }
+    control_variant_name = variant_names[0]
+
+    return MetricEffectResult(
+        metric=metric_effect.metric,
+        direction=metric_effect.direction,
+        minimum_goal=metric_effect.minimum_goal,
+        control_variant_name=control_variant_name,
+        variants=[
+            VariantResult(
+                variant_name=variant_name,
+                users=statistics[variant_name].users,
+                mean=estimate[0] if estimate is not None else None,
+                standard_error=(
+                    math.sqrt(estimate[1]) if estimate is not None else None
+                ),
+            )
+            for variant_name, estimate in estimates.items()
+        ],
+        comparisons=[
+            compare_variants(
+                variant_name,
+                estimates[control_variant_name],
+                estimates[variant_name],
+                metric_effect.direction,
+                metric_effect.minimum_goal,
+                confidence_level,
+            )
+            for variant_name in variant_names[1:]
+        ],
+    )
@@ -9,3 +9,26 @@ DB_PASS = os.environ["DB_PASS"]
 DB_HOST = os.environ["DB_HOST"]
 DB_PORT = int(os.environ["DB_PORT"])
 DB_NAME = os.environ["DB_NAME"]
+DB_POOL_MIN_SIZE = int(os.environ["DB_POOL_MIN_SIZE"])
+DB_POOL_MAX_SIZE = int(os.environ["DB_POOL_MAX_SIZE"])
+DB_STATEMENT_CACHE_SIZE = int(os.environ["DB_STATEMENT_CACHE_SIZE"])
+DB_SLOW_QUERY_THRESHOLD = float(os.environ["DB_SLOW_QUERY_THRESHOLD"])
+
+EXPERIMENTS_SNAPSHOT_REFRESH_INTERVAL = float(
+    os.environ["EXPERIMENTS_SNAPSHOT_REFRESH_INTERVAL"]
+)
+
+EXPOSURES_WRITE_BEHIND_ENABLED = (
+    os.environ["EXPOSURES_WRITE_BEHIND_ENABLED"].lower() == "true"
+)
+EXPOSURES_FLUSH_BATCH_SIZE = int(os.environ["EXPOSURES_FLUSH_BATCH_SIZE"])
+EXPOSURES_FLUSH_INTERVAL = float(os.environ["EXPOSURES_FLUSH_INTERVAL"])
+EXPOSURES_MAX_PENDING = int(os.environ["EXPOSURES_MAX_PENDING"])
+
+EVENT_STORE_ENABLED = os.environ["EVENT_STORE_ENABLED"].lower() == "true"
+EVENT_STORE_PATH = os.environ["EVENT_STORE_PATH"]
+EVENT_STORE_COMPACTION_INTERVAL = float(os.environ["EVENT_STORE_COMPACTION_INTERVAL"])
+
+PROFILING_TOKEN = os.environ["PROFILING_TOKEN"]
+PROFILING_SAMPLE_RATE = float(os.environ["PROFILING_SAMPLE_RATE"])
+PROFILING_OUTPUT_DIR = os.environ["PROFILING_OUTPUT_DIR"]
@@ -0,0 +1,144 @@
+import hashlib
+import json
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime
+from uuid import UUID
+
+from app import distribution
+from app.distribution import BucketingEvaluator
+from app.distribution import EligibilityIndex
+from app.models.experiments import Experiment
+from app.models.experiments import ExperimentBucketingConfig
+from app.models.experiments import ExperimentsBucketingSnapshot
+from app.models.holdouts import Holdout
+from app.models.holdouts import HoldoutBucketingConfig
+from app.models.layers import Layer
+from app.models.layers import LayerBucketingConfig
+from app.targeting import UserAttributes
+
+
+@dataclass(frozen=True, slots=True)
+class ExperimentsSnapshot:
+    version: int
+    experiments: tuple[Experiment, ...]
+    experiments_by_id: dict[UUID, Experiment]
+    evaluators: dict[UUID, BucketingEvaluator]
+    eligibility_index: EligibilityIndex
+    bucketing_snapshot: ExperimentsBucketingSnapshot
+    # derived from the contents alone, so it's consistent across processes
+    etag: str
+    created_at: datetime
+
+    def get_user_experiments(
+        self,
+        user_id: str,
+        attributes: UserAttributes,
+    ) -> list[Experiment]:
+        """Get the experiments the user is in, given layers, holdouts & the
+        experiments' user segments."""
+        return [
+            self.experiments[index]
+            for index in self.eligibility_index.get_experiment_indices(
+                user_id,
+                attributes,
+            )
+        ]
+
+
+class ExperimentsSnapshotCache:
+    """An in-process cache of the RUNNING experiments.
+
+    Readers only ever see complete, immutable snapshots; refreshing builds a
+    new snapshot & swaps it in. Each worker process holds its own cache, so
+    invalidations made by one worker reach the others on their next periodic
+    refresh.
+    """
+
+    def __init__(self) -> None:
+        self._current: ExperimentsSnapshot | None = None
+        self._version = 0
+        self._generation = 0
+
+    @property
+    def current(self) -> ExperimentsSnapshot | None:
+        return self._current
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._current = None
+
+    def publish(
+        self,
+        experiments: Iterable[Experiment],
+        layers: Iterable[Layer],
+        holdouts: Iterable[Holdout],
+        generation: int,
+    ) -> ExperimentsSnapshot:
+        _experiments = tuple(experiments)
+        bucketing_snapshot = ExperimentsBucketingSnapshot(
+            experiments=[
+                ExperimentBucketingConfig(
+                    experiment_id=experiment.experiment_id,
+                    key=experiment.key,
+                    bucketing_salt=experiment.bucketing_salt,
+                    evaluation_mode=experiment.evaluation_mode,
+                    variant_names=list(experiment.variant_allocation),
+                    cumulative_allocation=distribution.get_cumulative_allocation(
+                        experiment.variant_allocation
+                    ),
+                    layer_id=experiment.layer_id,
+                    traffic_slice=experiment.traffic_slice,
+                    user_segments=experiment.user_segments,
+                )
+                for experiment in _experiments
+            ],
+            layers=[
+                LayerBucketingConfig(
+                    layer_id=layer.layer_id,
+                    bucketing_salt=layer.bucketing_salt,
+                )
+                for layer in layers
+            ],
+            holdouts=[
+                HoldoutBucketingConfig(
+                    holdout_id=holdout.holdout_id,
+                    bucketing_salt=holdout.bucketing_salt,
+                    traffic=holdout.traffic,
+                )
+                for holdout in holdouts
+            ],
+        )
+        etag = hashlib.sha256(
+            json.dumps(
+                bucketing_snapshot.model_dump(mode="json"),
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+
+        self._version += 1
+        snapshot = ExperimentsSnapshot(
+            version=self._version,
+            experiments=_experiments,
+            experiments_by_id={
+                experiment.experiment_id: experiment for experiment in _experiments
+            },
+            evaluators={
+                experiment.experiment_id: distribution.compile_experiment(experiment)
+                for experiment in _experiments
+            },
+            eligibility_index=EligibilityIndex(bucketing_snapshot),
+            bucketing_snapshot=bucketing_snapshot,
+            etag=f'"{etag}"',
+            created_at=datetime.now(),
+        )
+        # an invalidation happened while this snapshot was being loaded,
+        # so its contents may predate the change; hand it to the caller,
+        # but don't let it replace the cache.
+        if generation == self._generation:
+            self._current = snapshot
+        return snapshot
@@ -0,0 +1,221 @@
+"""Targeting experiments at segments of users, by their attributes.
+
+Users are in an experiment's audience if they're in any of its segments,
+& in a segment if they match all of its property filters. Attributes are
+compared the same way event properties are: equality on their json text,
+numeric comparisons only against numbers, & users without an attribute
+are "not equal" to any value of it.
+
+The segments of every experiment in a snapshot are compiled together.
+Each distinct filter is given a bit, & filters are indexed by property,
+so a user's attributes are each looked up once to find every filter they
+match. Checking an experiment's segments is then a mask test per segment.
+Users who match the same filters are in the same audiences, so audiences
+are cached by the matched filters, as a flag per experiment.
+"""
+import bisect
+import operator
+from collections.abc import Callable
+from collections.abc import Mapping
+from collections.abc import Sequence
+from typing import Any
+
+from app import metrics
+from app.event_store import is_number
+from app.event_store import to_json_text
+from app.models.experiments import PropertyFilter
+from app.models.experiments import PropertyFilterOperator
+from app.models.experiments import Segment
+
+UserAttributes = Mapping[str, Any]
+
+# how many distinct combinations of matched filters to cache audiences for
+AUDIENCE_CACHE_SIZE = 4096
+
+NUMERIC_COMPARISONS: dict[PropertyFilterOperator, Callable[[float, float], bool]] = {
+    PropertyFilterOperator.GREATER_THAN: operator.gt,
+    PropertyFilterOperator.GREATER_THAN_OR_EQUAL: operator.ge,
+    PropertyFilterOperator.LESS_THAN: operator.lt,
+    PropertyFilterOperator.LESS_THAN_OR_EQUAL: operator.le,
+}
+
+
+class NumericFilters:
+    """The numeric filters on a property, sorted by threshold.
+
+    A value satisfies a prefix (or suffix) of each operator's filters, so
+    they're all evaluated with a binary search per operator.
+    """
+
+    __slots__ = ("_filters", "_thresholds", "_masks")
+
+    def __init__(self) -> None:
+        self._filters: dict[PropertyFilterOperator, list[tuple[float, int]]] = {}
+        self._thresholds: dict[PropertyFilterOperator, list[float]] = {}
+        # the combined bits of the first (or last) n filters, for each n
+        self._masks: dict[PropertyFilterOperator, list[int]] = {}
+
+    def add(
+        self, filter_operator: PropertyFilterOperator, threshold: float, bit: int
+    ) -> None:
+        filters = self._filters.setdefault(filter_operator, [])
+        filters.append((threshold, bit))
+        filters.sort()
+
+        self._thresholds[filter_operator] = [threshold for threshold, _ in filters]
+        bits = [bit for _, bit in filters]
+        if filter_operator in (
+            PropertyFilterOperator.LESS_THAN,
+            PropertyFilterOperator.LESS_THAN_OR_EQUAL,
+        ):
+            bits.reverse()
+        masks = [0]
+        for bit in bits:
+            masks.append(masks[-1] | bit)
+        self._masks[filter_operator] = masks
+
+    def match(self, value: float) -> int:
+        matched = 0
+        for filter_operator, thresholds in self._thresholds.items():
+            masks = self._masks[filter_operator]
+            # the filters whose thresholds the value is above (or below)
+            if filter_operator is PropertyFilterOperator.GREATER_THAN:
+                matched |= masks[bisect.bisect_left(thresholds, value)]
+            elif filter_operator is PropertyFilterOperator.GREATER_THAN_OR_EQUAL:
+                matched |= masks[bisect.bisect_right(thresholds, value)]
+            elif filter_operator is PropertyFilterOperator.LESS_THAN:
+                matched |= masks[
+                    len(thresholds) - bisect.bisect_right(thresholds, value)
+                ]
+            else:
+                matched |= masks[
+                    len(thresholds) - bisect.bisect_left(thresholds, value)
+                ]
+        return matched
+
+
+class TargetingIndex:
+    """The compiled user segments of a sequence of experiments."""
+
+    __slots__ = (
+        "_filter_bits",
+        "_equals",
+        "_not_equals",
+        "_not_equals_bits",
+        "_comparisons",
+        "_segment_masks",
+        "_targets_everyone",
+        "_audiences",
+    )
+
+    def __init__(self, user_segments: Sequence[Sequence[Segment]]) -> None:
+        """Compile the user segments of each experiment, in order."""
+        self._filter_bits: dict[tuple[str, PropertyFilterOperator, str], int] = {}
+        # property -> value -> the filters it satisfies (or fails, for
+        # not_equals filters)
+        self._equals: dict[str, dict[str, int]] = {}
+        self._not_equals: dict[str, dict[str, int]] = {}
+        self._not_equals_bits = 0
+        self._comparisons: dict[str, NumericFilters] = {}
+        # the masks of each experiment's segments; None targets everyone
+        self._segment_masks: list[tuple[int, ...] | None] = []
+        # matched filters -> whether they're in each experiment's audience
+        self._audiences: dict[int, bytes] = {}
+
+        for segments in user_segments:
+            if not segments:
+                self._segment_masks.append(None)
+                continue
+
+            masks = []
+            for segment in segments:
+                mask = 0
+                for property_filter in segment.filters:
+                    mask |= self._compile_filter(property_filter)
+                masks.append(mask)
+            self._segment_masks.append(tuple(masks))
+
+        self._targets_everyone = all(masks is None for masks in self._segment_masks)
+
+    def _compile_filter(self, property_filter: PropertyFilter) -> int:
+        key = (
+            property_filter.property,
+            property_filter.operator,
+            property_filter.value,
+        )
+        bit = self._filter_bits.get(key)
+        if bit is not None:
+            return bit
+
+        bit = self._filter_bits[key] = 1 << len(self._filter_bits)
+        name, value = property_filter.property, property_filter.value
+        if property_filter.operator is PropertyFilterOperator.EQUALS:
+            values = self._equals.setdefault(name, {})
+            values[value] = values.get(value, 0) | bit
+        elif property_filter.operator is PropertyFilterOperator.NOT_EQUALS:
+            values = self._not_equals.setdefault(name, {})
+            values[value] = values.get(value, 0) | bit
+            self._not_equals_bits |= bit
+        else:
+            self._comparisons.setdefault(name, NumericFilters()).add(
+                property_filter.operator,
+                float(value),
+                bit,
+            )
+        return bit
+
+    def get_matched_filters(self, attributes: UserAttributes) -> int:
+        """Get the set of filters the user's attributes match, as a bitset."""
+        # not_equals filters match until the attribute is found to be equal
+        matched = self._not_equals_bits
+        for name, value in attributes.items():
+            if value is None:
+                continue
+
+            equals = self._equals.get(name)
+            not_equals = self._not_equals.get(name)
+            if equals is not None or not_equals is not None:
+                text = to_json_text(value)
+                if equals is not None:
+                    matched |= equals.get(text, 0)
+                if not_equals is not None:
+                    matched &= ~not_equals.get(text, 0)
+
+            comparisons = self._comparisons.get(name)
+            if comparisons is not None and is_number(value):
+                matched |= comparisons.match(float(value))
+        return matched
+
+    def is_in_audience(self, index: int, matched_filters: int) -> bool:
+        """Check whether a user with the given matched filters is in one of
+        the experiment's segments."""
+        masks = self._segment_masks[index]
+        return masks is None or any(mask & matched_filters == mask for mask in masks)
+
+    def _get_audiences(self, matched_filters: int) -> bytes:
+        audiences = self._audiences.get(matched_filters)
+        if audiences is not None:
+            metrics.TARGETING_AUDIENCE_CACHE_HITS.inc()
+            return audiences
+
+        metrics.TARGETING_AUDIENCE_CACHE_MISSES.inc()
+        audiences = bytes(
+            self.is_in_audience(index, matched_filters)
+            for index in range(len(self._segment_masks))
+        )
+        if len(self._audiences) >= AUDIENCE_CACHE_SIZE:
+            self._audiences.clear()
+        self._audiences[matched_filters] = audiences
+        return audiences
+
+    def get_audience(
+        self,
+        indices: Sequence[int],
+        attributes: UserAttributes,
+    ) -> list[int]:
+        """Filter experiments down to those the user is in the audience of."""
+        if self._targets_everyone:
+            return list(indices)
+
+        audiences = self._get_audiences(self.get_matched_filters(attributes))
+        return [index for index in indices if audiences[index]]
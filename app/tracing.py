@@ -0,0 +1,144 @@
+"""Tracing the database queries made while handling each request.
+
+Every query made through the `Database` is recorded in the trace of the
+request (or other unit of work) it was made for, which is found through a
+context variable, so it follows the request into any tasks it spawns.
+Once a request which queried the database completes, the number of
+queries, the total time spent on them & the slowest of them are logged as
+structured fields, which makes N+1 query patterns easy to spot.
+
+Queries slower than `DB_SLOW_QUERY_THRESHOLD` are logged on their own,
+whether or not they're made while handling a request.
+"""
+import contextvars
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from starlette.types import ASGIApp
+from starlette.types import Message
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
+
+from app import settings
+from app.metrics import get_route_template
+
+
+@dataclass(slots=True)
+class QueryTrace:
+    queries: int = 0
+    duration: float = 0.0
+    slow_queries: int = 0
+    slowest_function: str | None = None
+    slowest_query: str | None = None
+    slowest_duration: float = 0.0
+
+    def record(self, function: str, query: str, duration: float) -> None:
+        self.queries += 1
+        self.duration += duration
+        if duration >= settings.DB_SLOW_QUERY_THRESHOLD:
+            self.slow_queries += 1
+        if duration > self.slowest_duration:
+            self.slowest_function = function
+            self.slowest_query = query
+            self.slowest_duration = duration
+
+    def get_log_fields(self) -> dict[str, object]:
+        return {
+            "db_queries": self.queries,
+            "db_duration_ms": round(self.duration * 1000, 3),
+            "db_slow_queries": self.slow_queries,
+            "db_slowest_function": self.slowest_function,
+            "db_slowest_query": (
+                format_query(self.slowest_query)
+                if self.slowest_query is not None
+                else None
+            ),
+            "db_slowest_duration_ms": round(self.slowest_duration * 1000, 3),
+        }
+
+
+_current_trace: contextvars.ContextVar[QueryTrace | None] = contextvars.ContextVar(
+    "current_query_trace",
+    default=None,
+)
+
+
+def get_current_trace() -> QueryTrace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_queries() -> Iterator[QueryTrace]:
+    """Record the queries made within the block (& tasks it spawns)."""
+    trace = QueryTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def format_query(query: str) -> str:
+    # queries are written over many indented lines
+    return " ".join(query.split())
+
+
+def observe_query(function: str, query: str, duration: float) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(function, query, duration)
+
+    if duration >= settings.DB_SLOW_QUERY_THRESHOLD:
+        logging.warning(
+            "A database query exceeded the slow query threshold",
+            extra={
+                "function": function,
+                "query": format_query(query),
+                "duration_ms": round(duration * 1000, 3),
+                "threshold_ms": settings.DB_SLOW_QUERY_THRESHOLD * 1000,
+            },
+        )
+
+
+class QueryTracingMiddleware:
+    """Trace the queries made while handling each http request, & log a
+    summary of them once it completes."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started_at = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with trace_queries() as trace:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                if trace.queries:
+                    logging.info(
+                        "Handled a request which queried the database",
+                        extra={
+                            "method": scope["method"],
+                            "route": get_route_template(scope),
+                            "status": status,
+                            "duration_ms": round(
+                                (time.perf_counter() - started_at) * 1000, 3
+                            ),
+                            **trace.get_log_fields(),
+                        },
+                    )
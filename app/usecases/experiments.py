@@ -1,22 +1,42 @@
 import logging
+from collections.abc import AsyncIterator
+from collections.abc import Mapping
+from datetime import datetime
 from uuid import UUID
 
 import asyncpg.exceptions
 
-from app import distribution
+from app import metrics
 from app._typing import is_set
 from app._typing import UNSET
 from app._typing import Unset
 from app.context import AbstractContext
 from app.errors import ServiceError
+from app.models.assignments import Assignment
+from app.models.experiments import EvaluationMode
 from app.models.experiments import Experiment
+from app.models.experiments import ExperimentsPage
 from app.models.experiments import ExperimentStatus
 from app.models.experiments import ExperimentType
 from app.models.experiments import Hypothesis
+from app.models.experiments import Segment
+from app.models.experiments import TotalCountMode
+from app.models.experiments import UserEligibleExperiments
 from app.models.experiments import UserExperimentBucketing
 from app.models.experiments import Variant
+from app.models.holdouts import HoldoutStatus
+from app.models.layers import TrafficSlice
 from app.repositories import assignments
 from app.repositories import experiments
+from app.repositories import holdouts
+from app.repositories import layers
+from app.repositories import partitions
+from app.results import is_computable
+from app.snapshots import ExperimentsSnapshot
+from app.targeting import UserAttributes
+
+# users whose sticky assignments are written in a single transaction
+ELIGIBILITY_BATCH_CHUNK_SIZE = 1000
 
 
 async def create(
@@ -60,13 +80,24 @@ async def partial_update(
     exposure_event: str | Unset = UNSET,
     variants: list[Variant] | Unset = UNSET,
     variant_allocation: dict[str, float] | Unset = UNSET,
+    user_segments: list[Segment] | Unset = UNSET,
     bucketing_salt: str | Unset = UNSET,
+    evaluation_mode: EvaluationMode | Unset = UNSET,
+    layer_id: UUID | None | Unset = UNSET,
+    traffic_slice: TrafficSlice | None | Unset = UNSET,
     status: ExperimentStatus | Unset = UNSET,
 ) -> Experiment | ServiceError:
     experiment = await experiments.fetch_one(ctx, experiment_id)
     if experiment is None:
         return ServiceError.EXPERIMENTS_NOT_FOUND
 
+    # every metric must be computable once the experiment has results
+    if is_set(hypothesis) and not all(
+        is_computable(metric_effect.metric)
+        for metric_effect in hypothesis.metric_effects
+    ):
+        return ServiceError.EXPERIMENTS_INVALID_HYPOTHESIS
+
     # variant & variant allocations must match
     if [variants, variant_allocation].count(UNSET) == 1:
         return ServiceError.EXPERIMENTS_VARIANT_MISMATCH
@@ -112,21 +143,86 @@ async def partial_update(
             if experiment.status is not ExperimentStatus.RUNNING:
                 return ServiceError.EXPERIMENTS_INVALID_TRANSITION
 
+    # running experiments in a layer must each have their own slice of it
+    new_layer_id = layer_id if is_set(layer_id) else experiment.layer_id
+    new_traffic_slice = (
+        traffic_slice if is_set(traffic_slice) else experiment.traffic_slice
+    )
+    new_status = status if is_set(status) else experiment.status
+    check_traffic_slice = new_status is ExperimentStatus.RUNNING and (
+        is_set(status) or is_set(layer_id) or is_set(traffic_slice)
+    )
+    if check_traffic_slice:
+        if new_layer_id is None and new_traffic_slice is not None:
+            return ServiceError.EXPERIMENTS_NEEDS_LAYER
+        if new_layer_id is not None and new_traffic_slice is None:
+            return ServiceError.EXPERIMENTS_NEEDS_TRAFFIC_SLICE
+
+    if is_set(layer_id) and layer_id is not None:
+        try:
+            layer = await layers.fetch_one(ctx, layer_id)
+        except Exception as exc:
+            logging.error(
+                "An unhandled error occurred while fetching a layer",
+                exc_info=exc,
+                extra={"experiment_id": experiment_id, "layer_id": layer_id},
+            )
+            return ServiceError.EXPERIMENTS_UPDATE_FAILED
+
+        if layer is None:
+            return ServiceError.LAYERS_NOT_FOUND
+
+    # assignments & exposures are written as soon as the experiment is
+    # running, so its partitions must exist before then
+    if is_set(status) and status is ExperimentStatus.RUNNING:
+        try:
+            await partitions.create_experiment_partitions(ctx, experiment_id)
+        except Exception as exc:
+            logging.error(
+                "An unhandled error occurred while creating an experiment's partitions",
+                exc_info=exc,
+                extra={"experiment_id": experiment_id},
+            )
+            return ServiceError.EXPERIMENTS_UPDATE_FAILED
+
     try:
-        experiment = await experiments.partial_update(
-            ctx,
-            experiment_id=experiment_id,
-            experiment_name=experiment_name,
-            experiment_key=experiment_key,
-            experiment_type=experiment_type,
-            description=description,
-            hypothesis=hypothesis,
-            exposure_event=exposure_event,
-            variants=variants,
-            variant_allocation=variant_allocation,
-            bucketing_salt=bucketing_salt,
-            status=status,
-        )
+        async with ctx.database.transaction():
+            if check_traffic_slice and new_layer_id is not None:
+                assert new_traffic_slice is not None
+                # held until the update commits, so concurrent updates can't
+                # both claim the same buckets
+                await layers.lock(ctx, new_layer_id)
+                layer_experiments = await experiments.fetch_many(
+                    ctx,
+                    status=ExperimentStatus.RUNNING,
+                    layer_id=new_layer_id,
+                )
+                if any(
+                    other.experiment_id != experiment_id
+                    and other.traffic_slice is not None
+                    and other.traffic_slice.overlaps(new_traffic_slice)
+                    for other in layer_experiments
+                ):
+                    return ServiceError.EXPERIMENTS_TRAFFIC_SLICE_OVERLAP
+
+            experiment = await experiments.partial_update(
+                ctx,
+                experiment_id=experiment_id,
+                experiment_name=experiment_name,
+                experiment_key=experiment_key,
+                experiment_type=experiment_type,
+                description=description,
+                hypothesis=hypothesis,
+                exposure_event=exposure_event,
+                variants=variants,
+                variant_allocation=variant_allocation,
+                user_segments=user_segments,
+                bucketing_salt=bucketing_salt,
+                evaluation_mode=evaluation_mode,
+                layer_id=layer_id,
+                traffic_slice=traffic_slice,
+                status=status,
+            )
     except Exception as exc:
         logging.error(
             "An unhandled error occurred while updating an experiment",
@@ -141,7 +237,11 @@ async def partial_update(
                 "exposure_event": exposure_event,
                 "variants": variants,
                 "variant_allocation": variant_allocation,
+                "user_segments": user_segments,
                 "bucketing_salt": bucketing_salt,
+                "evaluation_mode": evaluation_mode,
+                "layer_id": layer_id,
+                "traffic_slice": traffic_slice,
                 "status": status,
             },
         )
@@ -150,9 +250,110 @@ async def partial_update(
     if experiment is None:
         return ServiceError.EXPERIMENTS_NOT_FOUND
 
+    # changes to these fields affect which variant users are bucketed into,
+    # so they must be visible to the eligibility endpoint right away.
+    if (
+        is_set(status)
+        or is_set(variant_allocation)
+        or is_set(user_segments)
+        or is_set(bucketing_salt)
+        or is_set(evaluation_mode)
+        or is_set(layer_id)
+        or is_set(traffic_slice)
+    ):
+        ctx.experiments_snapshot.invalidate()
+        try:
+            await refresh_running_experiments_snapshot(ctx)
+        except Exception as exc:
+            # the next eligibility request will retry the load
+            logging.error(
+                "An unhandled error occurred while refreshing the experiments snapshot",
+                exc_info=exc,
+                extra={"experiment_id": experiment_id},
+            )
+
     return experiment
 
 
+async def archive(
+    ctx: AbstractContext,
+    experiment_id: UUID,
+) -> Experiment | ServiceError:
+    """Move a completed experiment's assignments & exposures out of the
+    tables which are written to.
+
+    Its exposure counts & any computed results are kept, but results can
+    no longer be recomputed.
+    """
+    experiment = await fetch_one_experiment(ctx, experiment_id)
+    if isinstance(experiment, ServiceError):
+        return experiment
+
+    if experiment.status is not ExperimentStatus.COMPLETED:
+        return ServiceError.EXPERIMENTS_NOT_COMPLETED
+
+    try:
+        await partitions.archive_experiment_partitions(ctx, experiment_id)
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while archiving an experiment",
+            exc_info=exc,
+            extra={"experiment_id": experiment_id},
+        )
+        return ServiceError.EXPERIMENTS_ARCHIVE_FAILED
+
+    return experiment
+
+
+async def refresh_running_experiments_snapshot(
+    ctx: AbstractContext,
+) -> ExperimentsSnapshot:
+    generation = ctx.experiments_snapshot.generation
+    # one experiment which fails validation mustn't take down eligibility
+    # for every other experiment
+    _experiments = await experiments.fetch_many(
+        ctx,
+        status=ExperimentStatus.RUNNING,
+        skip_invalid=True,
+    )
+    layer_ids = list({e.layer_id for e in _experiments if e.layer_id is not None})
+    _layers = await layers.fetch_many(ctx, layer_ids=layer_ids) if layer_ids else []
+    _holdouts = await holdouts.fetch_many(ctx, status=HoldoutStatus.RUNNING)
+    return ctx.experiments_snapshot.publish(
+        _experiments,
+        _layers,
+        _holdouts,
+        generation,
+    )
+
+
+async def fetch_running_experiments_snapshot(
+    ctx: AbstractContext,
+) -> ExperimentsSnapshot:
+    snapshot = ctx.experiments_snapshot.current
+    if snapshot is None:
+        metrics.EXPERIMENTS_SNAPSHOT_MISSES.inc()
+        snapshot = await refresh_running_experiments_snapshot(ctx)
+    else:
+        metrics.EXPERIMENTS_SNAPSHOT_HITS.inc()
+    return snapshot
+
+
+async def fetch_experiments_snapshot(
+    ctx: AbstractContext,
+) -> ExperimentsSnapshot | ServiceError:
+    try:
+        snapshot = await fetch_running_experiments_snapshot(ctx)
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while fetching the experiments snapshot",
+            exc_info=exc,
+        )
+        return ServiceError.EXPERIMENTS_FETCH_FAILED
+
+    return snapshot
+
+
 async def fetch_one_experiment(
     ctx: AbstractContext,
     experiment_id: UUID,
@@ -173,95 +374,209 @@ async def fetch_one_experiment(
     return experiment
 
 
-async def fetch_many_experiments(
+async def fetch_experiment_version(
     ctx: AbstractContext,
-    page: int,
-    page_size: int,
-) -> list[Experiment] | ServiceError:
+    experiment_id: UUID,
+) -> str | ServiceError:
     try:
-        _experiments = await experiments.fetch_many(
-            ctx,
-            page=page,
-            page_size=page_size,
-        )
+        updated_at = await experiments.fetch_updated_at(ctx, experiment_id)
     except Exception as exc:
         logging.error(
-            "An unhandled error occurred while fetching experiments",
+            "An unhandled error occurred while fetching an experiment's version",
             exc_info=exc,
-            extra={"page": page, "page_size": page_size},
+            extra={"experiment_id": experiment_id},
         )
         return ServiceError.EXPERIMENTS_FETCH_FAILED
 
-    return _experiments
+    if updated_at is None:
+        return ServiceError.EXPERIMENTS_NOT_FOUND
+
+    return f"{experiment_id}:{updated_at.isoformat()}"
 
 
-async def fetch_total_experiments_count(
+async def fetch_experiments_page(
     ctx: AbstractContext,
-) -> int | ServiceError:
+    page_size: int,
+    status: ExperimentStatus | None,
+    cursor: int | None,
+    total_count_mode: TotalCountMode,
+) -> ExperimentsPage | ServiceError:
     try:
-        total = await experiments.fetch_total_count(ctx)
+        page = await experiments.fetch_page(
+            ctx,
+            page_size=page_size,
+            status=status,
+            cursor=cursor,
+            total_count_mode=total_count_mode,
+        )
     except Exception as exc:
         logging.error(
-            "An unhandled error occurred while fetching total experiments",
+            "An unhandled error occurred while fetching experiments",
             exc_info=exc,
+            extra={
+                "page_size": page_size,
+                "status": status,
+                "cursor": cursor,
+                "total_count_mode": total_count_mode,
+            },
         )
         return ServiceError.EXPERIMENTS_FETCH_FAILED
 
-    return total
+    return page
 
 
 async def fetch_and_assign_eligible_experiments(
     ctx: AbstractContext,
     user_id: str,
+    attributes: UserAttributes | None = None,
 ) -> list[UserExperimentBucketing] | ServiceError:
-    transaction = await ctx.database.transaction()
-    try:
-        _experiments = await experiments.fetch_many(
-            ctx, status=ExperimentStatus.RUNNING
-        )
-
-        # TODO: filter out experiments that the user is not qualified for
-        #       based on the user segments assigned to the experiment.
-        user_experiments: list[UserExperimentBucketing] = []
+    data = await fetch_and_assign_eligible_experiments_for_users(
+        ctx,
+        [user_id],
+        {user_id: attributes} if attributes is not None else None,
+    )
+    if isinstance(data, ServiceError):
+        return data
 
-        # Fetch existing experiment assignments
-        user_assignments = {
-            assign.experiment_id: assign.variant_name
-            for assign in await assignments.fetch_many(ctx, user_id=user_id)
-        }
+    return data[0].experiments
 
-        # Fetch the user's assignments to each experiment
-        for experiment in _experiments:
-            variant_name = user_assignments.get(experiment.experiment_id)
 
-            if variant_name is None:
-                # User has not been assigned to a variant for this experiment.
-                # Assign the user to a variant & persist to the db
-                variant_name = distribution.get_user_variant(experiment, user_id)
-
-                await assignments.create(
-                    ctx,
-                    experiment.experiment_id,
-                    user_id,
-                    variant_name,
-                )
-
-            user_experiments.append(
-                UserExperimentBucketing(
-                    experiment_id=experiment.experiment_id,
-                    variant_name=variant_name,
-                )
-            )
+async def fetch_and_assign_eligible_experiments_for_users(
+    ctx: AbstractContext,
+    user_ids: list[str],
+    attributes: Mapping[str, UserAttributes] | None = None,
+) -> list[UserEligibleExperiments] | ServiceError:
+    """Fetch the experiments each user is in & their variants, assigning
+    them to any sticky experiments they're new to.
+
+    Users are targeted by their attributes (by user id); those without any
+    are only in experiments which target everyone, or a segment they can
+    match without attributes.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
 
+    try:
+        snapshot = await fetch_running_experiments_snapshot(ctx)
     except Exception as exc:
-        await transaction.rollback()
         logging.error(
             "An unhandled error occurred while fetching experiments",
             exc_info=exc,
-            extra={"user_id": user_id},
+            extra={"user_ids": user_ids},
         )
         return ServiceError.EXPERIMENTS_FETCH_FAILED
-    else:
-        await transaction.commit()
 
-    return user_experiments
+    # Only the experiments each user is in, given the layers, holdouts &
+    # user segments, are evaluated for them
+    if attributes is None:
+        attributes = {}
+    user_experiments = {
+        user_id: snapshot.get_user_experiments(user_id, attributes.get(user_id, {}))
+        for user_id in user_ids
+    }
+    user_assignments: dict[str, dict[UUID, str]] = {user_id: {} for user_id in user_ids}
+
+    # Sticky experiments keep users in the variant they were first assigned,
+    # so their assignments must be read from & persisted to the database
+    sticky_experiment_ids = {
+        experiment.experiment_id
+        for user_id in user_ids
+        for experiment in user_experiments[user_id]
+        if experiment.evaluation_mode is EvaluationMode.STICKY
+    }
+    new_assignments: list[Assignment] = []
+    if sticky_experiment_ids:
+        transaction = await ctx.database.transaction()
+        try:
+            # Fetch existing experiment assignments for all of the users at once
+            for assign in await assignments.fetch_many(
+                ctx,
+                experiment_ids=list(sticky_experiment_ids),
+                user_ids=user_ids,
+            ):
+                user_assignments[assign.user_id][
+                    assign.experiment_id
+                ] = assign.variant_name
+
+            # Bucket the users into any experiments they haven't been assigned to
+            now = datetime.utcnow()
+            for user_id in user_ids:
+                for experiment in user_experiments[user_id]:
+                    if (
+                        experiment.evaluation_mode is EvaluationMode.STICKY
+                        and experiment.experiment_id not in user_assignments[user_id]
+                    ):
+                        evaluator = snapshot.evaluators[experiment.experiment_id]
+                        new_assignments.append(
+                            Assignment(
+                                experiment_id=experiment.experiment_id,
+                                user_id=user_id,
+                                variant_name=evaluator.get_user_variant(user_id),
+                                created_at=now,
+                            )
+                        )
+
+            # Persist all of the new assignments at once; if a concurrent
+            # request beat us to some of them, theirs are the ones that count
+            for assign in await assignments.create_many(ctx, new_assignments):
+                user_assignments[assign.user_id][
+                    assign.experiment_id
+                ] = assign.variant_name
+
+        except Exception as exc:
+            await transaction.rollback()
+            logging.error(
+                "An unhandled error occurred while fetching experiments",
+                exc_info=exc,
+                extra={"user_ids": user_ids},
+            )
+            return ServiceError.EXPERIMENTS_FETCH_FAILED
+        else:
+            await transaction.commit()
+
+    metrics.ELIGIBILITY_NEW_ASSIGNMENTS.observe(len(new_assignments))
+
+    # Stateless experiments are bucketed purely from the salt & user id
+    for user_id in user_ids:
+        for experiment in user_experiments[user_id]:
+            if experiment.evaluation_mode is EvaluationMode.STATELESS:
+                evaluator = snapshot.evaluators[experiment.experiment_id]
+                user_assignments[user_id][
+                    experiment.experiment_id
+                ] = evaluator.get_user_variant(user_id)
+
+    return [
+        UserEligibleExperiments(
+            user_id=user_id,
+            experiments=[
+                UserExperimentBucketing(
+                    experiment_id=experiment.experiment_id,
+                    variant_name=user_assignments[user_id][experiment.experiment_id],
+                )
+                for experiment in user_experiments[user_id]
+            ],
+        )
+        for user_id in user_ids
+    ]
+
+
+async def stream_eligible_experiments_for_users(
+    ctx: AbstractContext,
+    user_ids: list[str],
+    attributes: Mapping[str, UserAttributes] | None = None,
+) -> AsyncIterator[list[UserEligibleExperiments] | ServiceError]:
+    """Fetch & assign the eligible experiments of many users, a chunk of
+    users at a time.
+
+    Each chunk is assigned in its own transaction; a chunk which fails
+    yields its error & ends the stream.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    for start in range(0, len(user_ids), ELIGIBILITY_BATCH_CHUNK_SIZE):
+        data = await fetch_and_assign_eligible_experiments_for_users(
+            ctx,
+            user_ids[start : start + ELIGIBILITY_BATCH_CHUNK_SIZE],
+            attributes,
+        )
+        yield data
+        if isinstance(data, ServiceError):
+            return
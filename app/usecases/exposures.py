@@ -1,13 +1,28 @@
 import logging
+from collections.abc import AsyncIterable
+from datetime import date
+from datetime import datetime
 from uuid import UUID
 
 import asyncpg.exceptions
+from pydantic import ValidationError
 
 from app.context import AbstractContext
 from app.errors import ServiceError
+from app.models.experiments import EvaluationMode
+from app.models.exposures import ExperimentExposureCounts
+from app.models.exposures import ExperimentExposuresSummary
 from app.models.exposures import Exposure
+from app.models.exposures import ExposureBatchItem
+from app.models.exposures import ExposureBatchSummary
 from app.repositories import assignments
+from app.repositories import exposure_counts
 from app.repositories import exposures
+from app.usecases import experiments
+
+EXPOSURES_BATCH_CHUNK_SIZE = 10_000
+# batches are held in memory until they've been validated
+EXPOSURES_MAX_BATCH_SIZE = 50_000
 
 
 async def track_exposure(
@@ -16,17 +31,42 @@ async def track_exposure(
     user_id: str,
 ) -> Exposure | ServiceError:
     try:
-        assignment = await assignments.fetch_one(ctx, experiment_id, user_id)
-        if assignment is None:
-            # (this could also be experiment doesn't exist)
-            return ServiceError.ASSIGNMENTS_NOT_FOUND
-
-        exposure = await exposures.create(
-            ctx,
-            experiment_id=experiment_id,
-            user_id=user_id,
-            variant_name=assignment.variant_name,
-        )
+        snapshot = await experiments.fetch_running_experiments_snapshot(ctx)
+        experiment = snapshot.experiments_by_id.get(experiment_id)
+
+        if (
+            experiment is not None
+            and experiment.evaluation_mode is EvaluationMode.STATELESS
+        ):
+            # users outside of the experiment's traffic were never bucketed
+            if not snapshot.eligibility_index.is_user_eligible(experiment_id, user_id):
+                return ServiceError.ASSIGNMENTS_NOT_FOUND
+            evaluator = snapshot.evaluators[experiment_id]
+            variant_name = evaluator.get_user_variant(user_id)
+        else:
+            assignment = await assignments.fetch_one(ctx, experiment_id, user_id)
+            if assignment is None:
+                # (this could also be experiment doesn't exist)
+                return ServiceError.ASSIGNMENTS_NOT_FOUND
+            variant_name = assignment.variant_name
+
+        if ctx.exposure_writer is not None:
+            # the exposure is written in the background; duplicates are
+            # silently dropped rather than reported
+            exposure = Exposure(
+                experiment_id=experiment_id,
+                user_id=user_id,
+                variant_name=variant_name,
+                created_at=datetime.utcnow(),
+            )
+            await ctx.exposure_writer.submit(exposure)
+        else:
+            exposure = await exposures.create(
+                ctx,
+                experiment_id=experiment_id,
+                user_id=user_id,
+                variant_name=variant_name,
+            )
     except asyncpg.exceptions.UniqueViolationError as exc:
         return ServiceError.EXPOSURE_ALREADY_EXISTS
     except Exception as exc:
@@ -41,3 +81,110 @@ async def track_exposure(
         return ServiceError.EXPOSURES_TRACK_FAILED
 
     return exposure
+
+
+async def track_exposures(
+    ctx: AbstractContext,
+    items: AsyncIterable[ExposureBatchItem],
+) -> ExposureBatchSummary | ServiceError:
+    summaries: dict[UUID, ExperimentExposuresSummary] = {}
+
+    async def write_chunk(chunk: list[ExposureBatchItem]) -> None:
+        # variants of stateless experiments are computed here; the rest are
+        # read from the users' assignments
+        snapshot = await experiments.fetch_running_experiments_snapshot(ctx)
+        variant_names: list[str | None] = []
+        for item in chunk:
+            experiment = snapshot.experiments_by_id.get(item.experiment_id)
+            if (
+                experiment is not None
+                and experiment.evaluation_mode is EvaluationMode.STATELESS
+                and snapshot.eligibility_index.is_user_eligible(
+                    item.experiment_id,
+                    item.user_id,
+                )
+            ):
+                evaluator = snapshot.evaluators[item.experiment_id]
+                variant_names.append(evaluator.get_user_variant(item.user_id))
+            else:
+                variant_names.append(None)
+
+        for chunk_summary in await exposures.create_many(ctx, chunk, variant_names):
+            summary = summaries.setdefault(
+                chunk_summary.experiment_id,
+                ExperimentExposuresSummary(
+                    experiment_id=chunk_summary.experiment_id,
+                    created=0,
+                    duplicate=0,
+                    unassigned=0,
+                ),
+            )
+            summary.created += chunk_summary.created
+            summary.duplicate += chunk_summary.duplicate
+            summary.unassigned += chunk_summary.unassigned
+
+    try:
+        # the whole batch is validated before any of it is written; one past
+        # the limit is rejected without reading the rest of it
+        batch: list[ExposureBatchItem] = []
+        try:
+            async for item in items:
+                if len(batch) == EXPOSURES_MAX_BATCH_SIZE:
+                    return ServiceError.EXPOSURES_BATCH_TOO_LARGE
+                batch.append(item)
+        except ValidationError:
+            return ServiceError.EXPOSURES_INVALID_BATCH
+
+        # a batch is tracked entirely or not at all
+        async with ctx.database.transaction():
+            for start in range(0, len(batch), EXPOSURES_BATCH_CHUNK_SIZE):
+                await write_chunk(batch[start : start + EXPOSURES_BATCH_CHUNK_SIZE])
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while tracking exposures",
+            exc_info=exc,
+        )
+        return ServiceError.EXPOSURES_TRACK_FAILED
+
+    return ExposureBatchSummary(
+        created=sum(s.created for s in summaries.values()),
+        duplicate=sum(s.duplicate for s in summaries.values()),
+        unassigned=sum(s.unassigned for s in summaries.values()),
+        experiments=list(summaries.values()),
+    )
+
+
+async def fetch_exposure_counts(
+    ctx: AbstractContext,
+    experiment_id: UUID,
+    since: date | None = None,
+    until: date | None = None,
+) -> ExperimentExposureCounts | ServiceError:
+    experiment = await experiments.fetch_one_experiment(ctx, experiment_id)
+    if isinstance(experiment, ServiceError):
+        return experiment
+
+    try:
+        daily = await exposure_counts.fetch_many(ctx, experiment_id, since, until)
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while fetching exposure counts",
+            exc_info=exc,
+            extra={
+                "experiment_id": experiment_id,
+                "since": since,
+                "until": until,
+            },
+        )
+        return ServiceError.EXPOSURES_FETCH_FAILED
+
+    variants = dict.fromkeys(experiment.variant_allocation, 0)
+    for count in daily:
+        variants[count.variant_name] = variants.get(count.variant_name, 0) + count.count
+
+    return ExperimentExposureCounts(
+        experiment_id=experiment_id,
+        total=sum(variants.values()),
+        variants=variants,
+        daily=daily,
+    )
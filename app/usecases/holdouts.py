@@ -0,0 +1,121 @@
+import logging
+from uuid import UUID
+
+import asyncpg.exceptions
+
+from app._typing import is_set
+from app._typing import UNSET
+from app._typing import Unset
+from app.context import AbstractContext
+from app.errors import ServiceError
+from app.models.holdouts import Holdout
+from app.models.holdouts import HoldoutStatus
+from app.repositories import holdouts
+from app.usecases import experiments
+
+
+async def create(
+    ctx: AbstractContext,
+    holdout_name: str,
+    holdout_key: str,
+    traffic: int,
+) -> Holdout | ServiceError:
+    try:
+        holdout = await holdouts.create(
+            ctx,
+            holdout_name=holdout_name,
+            holdout_key=holdout_key,
+            traffic=traffic,
+        )
+    except asyncpg.exceptions.UniqueViolationError as exc:
+        return ServiceError.HOLDOUTS_KEY_ALREADY_EXISTS
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while creating a holdout",
+            exc_info=exc,
+            extra={
+                "holdout_name": holdout_name,
+                "holdout_key": holdout_key,
+                "traffic": traffic,
+            },
+        )
+        return ServiceError.HOLDOUTS_CREATE_FAILED
+
+    return holdout
+
+
+async def fetch_many(ctx: AbstractContext) -> list[Holdout] | ServiceError:
+    try:
+        _holdouts = await holdouts.fetch_many(ctx)
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while fetching holdouts",
+            exc_info=exc,
+        )
+        return ServiceError.HOLDOUTS_FETCH_FAILED
+
+    return _holdouts
+
+
+async def partial_update(
+    ctx: AbstractContext,
+    holdout_id: UUID,
+    holdout_name: str | Unset = UNSET,
+    traffic: int | Unset = UNSET,
+    status: HoldoutStatus | Unset = UNSET,
+) -> Holdout | ServiceError:
+    try:
+        holdout = await holdouts.fetch_one(ctx, holdout_id)
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while fetching a holdout",
+            exc_info=exc,
+            extra={"holdout_id": holdout_id},
+        )
+        return ServiceError.HOLDOUTS_FETCH_FAILED
+
+    if holdout is None:
+        return ServiceError.HOLDOUTS_NOT_FOUND
+
+    if is_set(status) and status is HoldoutStatus.COMPLETED:
+        if holdout.status is not HoldoutStatus.RUNNING:
+            return ServiceError.HOLDOUTS_INVALID_TRANSITION
+
+    try:
+        holdout = await holdouts.partial_update(
+            ctx,
+            holdout_id=holdout_id,
+            holdout_name=holdout_name,
+            traffic=traffic,
+            status=status,
+        )
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while updating a holdout",
+            exc_info=exc,
+            extra={
+                "holdout_id": holdout_id,
+                "holdout_name": holdout_name,
+                "traffic": traffic,
+                "status": status,
+            },
+        )
+        return ServiceError.HOLDOUTS_UPDATE_FAILED
+
+    if holdout is None:
+        return ServiceError.HOLDOUTS_NOT_FOUND
+
+    # running holdouts decide which users are in any experiment at all
+    if is_set(status) or is_set(traffic):
+        ctx.experiments_snapshot.invalidate()
+        try:
+            await experiments.refresh_running_experiments_snapshot(ctx)
+        except Exception as exc:
+            # the next eligibility request will retry the load
+            logging.error(
+                "An unhandled error occurred while refreshing the experiments snapshot",
+                exc_info=exc,
+                extra={"holdout_id": holdout_id},
+            )
+
+    return holdout
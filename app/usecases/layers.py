@@ -0,0 +1,59 @@
+import logging
+from uuid import UUID
+
+import asyncpg.exceptions
+
+from app.context import AbstractContext
+from app.errors import ServiceError
+from app.models.layers import Layer
+from app.repositories import layers
+
+
+async def create(
+    ctx: AbstractContext,
+    layer_name: str,
+    layer_key: str,
+) -> Layer | ServiceError:
+    try:
+        layer = await layers.create(ctx, layer_name=layer_name, layer_key=layer_key)
+    except asyncpg.exceptions.UniqueViolationError as exc:
+        return ServiceError.LAYERS_KEY_ALREADY_EXISTS
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while creating a layer",
+            exc_info=exc,
+            extra={"layer_name": layer_name, "layer_key": layer_key},
+        )
+        return ServiceError.LAYERS_CREATE_FAILED
+
+    return layer
+
+
+async def fetch_one(ctx: AbstractContext, layer_id: UUID) -> Layer | ServiceError:
+    try:
+        layer = await layers.fetch_one(ctx, layer_id)
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while fetching a layer",
+            exc_info=exc,
+            extra={"layer_id": layer_id},
+        )
+        return ServiceError.LAYERS_FETCH_FAILED
+
+    if layer is None:
+        return ServiceError.LAYERS_NOT_FOUND
+
+    return layer
+
+
+async def fetch_many(ctx: AbstractContext) -> list[Layer] | ServiceError:
+    try:
+        _layers = await layers.fetch_many(ctx)
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while fetching layers",
+            exc_info=exc,
+        )
+        return ServiceError.LAYERS_FETCH_FAILED
+
+    return _layers
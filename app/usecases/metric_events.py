@@ -0,0 +1,50 @@
+import asyncio
+import logging
+from datetime import datetime
+from datetime import timezone
+
+from app.context import AbstractContext
+from app.errors import ServiceError
+from app.models.metric_events import MetricEvent
+from app.models.metric_events import MetricEventBatchSummary
+from app.models.metric_events import MetricEventInput
+from app.repositories import metric_events
+
+
+async def track_metric_events(
+    ctx: AbstractContext,
+    events: list[MetricEventInput],
+) -> MetricEventBatchSummary | ServiceError:
+    now = datetime.utcnow()
+    metric_events_to_create = []
+    for event in events:
+        created_at = event.created_at or now
+        if created_at.tzinfo is not None:
+            # timestamps are stored as naive utc
+            created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+
+        metric_events_to_create.append(
+            MetricEvent(
+                user_id=event.user_id,
+                event=event.event,
+                properties=event.properties,
+                created_at=created_at,
+            )
+        )
+
+    try:
+        if ctx.event_store is not None:
+            created = await asyncio.to_thread(
+                ctx.event_store.append,
+                metric_events_to_create,
+            )
+        else:
+            created = await metric_events.create_many(ctx, metric_events_to_create)
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while tracking metric events",
+            exc_info=exc,
+        )
+        return ServiceError.METRIC_EVENTS_TRACK_FAILED
+
+    return MetricEventBatchSummary(created=created)
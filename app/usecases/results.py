@@ -0,0 +1,251 @@
+import asyncio
+import logging
+from datetime import datetime
+from uuid import UUID
+
+import numpy as np
+
+from app.context import AbstractContext
+from app.errors import ServiceError
+from app.models.experiments import EventSegmentationMetric
+from app.models.experiments import ExperimentStatus
+from app.models.results import ExperimentResults
+from app.models.results import MetricAggregates
+from app.models.results import SufficientStatistics
+from app.repositories import experiments
+from app.repositories import exposures
+from app.repositories import metric_aggregates
+from app.repositories import metric_events
+from app.repositories import partitions
+from app.results import get_metric_effect_result
+from app.results import get_metric_hash
+from app.results import is_computable
+from app.results import StatisticsAccumulator
+
+RESULTS_CHUNK_SIZE = 10_000
+
+
+async def compute_event_store_statistics(
+    ctx: AbstractContext,
+    experiment_id: UUID,
+    metrics: list[EventSegmentationMetric],
+    variant_names: list[str],
+) -> list[dict[str, SufficientStatistics]]:
+    """Compute metrics over the event store, for every exposed user.
+
+    Unlike the aggregates maintained over `metric_events`, these are
+    recomputed by scanning the store on every call.
+    """
+    assert ctx.event_store is not None
+
+    variant_indices = {name: index for index, name in enumerate(variant_names)}
+    user_ids: list[str] = []
+    user_variant_indices: list[int] = []
+    exposed_at: list[datetime] = []
+    async for recs in exposures.fetch_experiment_exposures(
+        ctx,
+        experiment_id,
+        chunk_size=RESULTS_CHUNK_SIZE,
+    ):
+        for user_id, variant_name, created_at in recs:
+            # (users exposed to variants which have since been removed are ignored)
+            if variant_name in variant_indices:
+                user_ids.append(user_id)
+                user_variant_indices.append(variant_indices[variant_name])
+                exposed_at.append(created_at)
+
+    statistics = []
+    zeros = np.zeros(len(user_ids), dtype=np.float64)
+    for metric in metrics:
+        values, denominators = await asyncio.to_thread(
+            ctx.event_store.compute_user_values,
+            metric,
+            user_ids,
+            exposed_at,
+        )
+        accumulator = StatisticsAccumulator(variant_names)
+        accumulator.update(
+            variant_indices=np.array(user_variant_indices, dtype=np.intp),
+            was_exposed=np.zeros(len(user_ids), dtype=np.bool_),
+            old_values=zeros,
+            new_values=values,
+            old_denominators=zeros,
+            new_denominators=denominators,
+        )
+        statistics.append(accumulator.get_statistics())
+    return statistics
+
+
+async def update_metric_aggregates(
+    ctx: AbstractContext,
+    experiment_id: UUID,
+    metric: EventSegmentationMetric,
+    variant_names: list[str],
+    exposure_watermark: int,
+    event_watermark: int,
+    recompute: bool = False,
+) -> dict[str, SufficientStatistics]:
+    """Bring a metric's aggregates up to date with the given watermarks.
+
+    Only users whose values changed since the aggregates were last updated
+    are read; `recompute` discards the aggregates & reads every user.
+    """
+    metric_hash = get_metric_hash(metric)
+    aggregates = None
+    if not recompute:
+        aggregates = await metric_aggregates.fetch_one(ctx, experiment_id, metric_hash)
+
+    accumulator = StatisticsAccumulator(
+        variant_names,
+        aggregates.variants if aggregates is not None else None,
+    )
+    if (
+        aggregates is not None
+        and aggregates.exposure_watermark >= exposure_watermark
+        and aggregates.event_watermark >= event_watermark
+    ):
+        return accumulator.get_statistics()
+
+    variant_indices = {name: index for index, name in enumerate(variant_names)}
+    async for recs in metric_events.fetch_user_value_changes(
+        ctx,
+        experiment_id,
+        metric,
+        old_exposure_watermark=(
+            aggregates.exposure_watermark if aggregates is not None else 0
+        ),
+        new_exposure_watermark=exposure_watermark,
+        old_event_watermark=aggregates.event_watermark if aggregates is not None else 0,
+        new_event_watermark=event_watermark,
+        chunk_size=RESULTS_CHUNK_SIZE,
+    ):
+        # (users exposed to variants which have since been removed are ignored)
+        recs = [rec for rec in recs if rec[0] in variant_indices]
+        if not recs:
+            continue
+
+        accumulator.update(
+            variant_indices=np.array([variant_indices[rec[0]] for rec in recs]),
+            was_exposed=np.array([rec[1] for rec in recs], dtype=np.bool_),
+            old_values=np.array([rec[2] for rec in recs], dtype=np.float64),
+            old_denominators=np.array([rec[3] for rec in recs], dtype=np.float64),
+            new_values=np.array([rec[4] for rec in recs], dtype=np.float64),
+            new_denominators=np.array([rec[5] for rec in recs], dtype=np.float64),
+        )
+
+    statistics = accumulator.get_statistics()
+    await metric_aggregates.upsert(
+        ctx,
+        MetricAggregates(
+            experiment_id=experiment_id,
+            metric_hash=metric_hash,
+            exposure_watermark=exposure_watermark,
+            event_watermark=event_watermark,
+            variants=statistics,
+            updated_at=datetime.utcnow(),
+        ),
+    )
+    return statistics
+
+
+async def fetch_experiment_results(
+    ctx: AbstractContext,
+    experiment_id: UUID,
+    confidence_level: float = 0.95,
+    recompute: bool = False,
+) -> ExperimentResults | ServiceError:
+    try:
+        experiment = await experiments.fetch_one(ctx, experiment_id)
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while fetching an experiment",
+            exc_info=exc,
+            extra={"experiment_id": experiment_id},
+        )
+        return ServiceError.EXPERIMENTS_FETCH_FAILED
+
+    if experiment is None:
+        return ServiceError.EXPERIMENTS_NOT_FOUND
+
+    # the first variant is the control
+    variant_names = [variant.name for variant in experiment.variants]
+    if not variant_names:
+        return ServiceError.EXPERIMENTS_NEEDS_VARIANTS
+
+    # archived experiments' exposures are detached, so only the aggregates
+    # persisted before they were archived are left to serve results from
+    if experiment.status is ExperimentStatus.COMPLETED and (
+        recompute or ctx.event_store is not None
+    ):
+        try:
+            is_archived = await partitions.is_archived(ctx, experiment_id)
+        except Exception as exc:
+            logging.error(
+                "An unhandled error occurred while fetching an experiment's partitions",
+                exc_info=exc,
+                extra={"experiment_id": experiment_id},
+            )
+            return ServiceError.RESULTS_FETCH_FAILED
+
+        if is_archived:
+            return ServiceError.RESULTS_EXPERIMENT_ARCHIVED
+
+    try:
+        # metrics saved before their definitions were complete can't be
+        # computed; newer ones are checked when the experiment is saved
+        metric_effects = [
+            metric_effect
+            for metric_effect in experiment.hypothesis.metric_effects
+            if is_computable(metric_effect.metric)
+        ]
+        if ctx.event_store is not None:
+            metric_statistics = await compute_event_store_statistics(
+                ctx,
+                experiment_id,
+                [metric_effect.metric for metric_effect in metric_effects],
+                variant_names,
+            )
+        else:
+            exposure_watermark = await exposures.fetch_watermark(ctx, experiment_id)
+            event_watermark = await metric_events.fetch_watermark(ctx)
+
+            metric_statistics = []
+            for metric_effect in metric_effects:
+                metric_statistics.append(
+                    await update_metric_aggregates(
+                        ctx,
+                        experiment_id,
+                        metric_effect.metric,
+                        variant_names,
+                        exposure_watermark,
+                        event_watermark,
+                        recompute,
+                    )
+                )
+
+        metric_effect_results = []
+        for metric_effect, statistics in zip(metric_effects, metric_statistics):
+            metric_effect_results.append(
+                get_metric_effect_result(
+                    metric_effect,
+                    statistics,
+                    variant_names,
+                    confidence_level,
+                )
+            )
+    except Exception as exc:
+        logging.error(
+            "An unhandled error occurred while computing experiment results",
+            exc_info=exc,
+            extra={
+                "experiment_id": experiment_id,
+                "recompute": recompute,
+            },
+        )
+        return ServiceError.RESULTS_FETCH_FAILED
+
+    return ExperimentResults(
+        experiment_id=experiment_id,
+        confidence_level=confidence_level,
+        metric_effects=metric_effect_results,
+    )
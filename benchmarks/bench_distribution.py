@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Compare `get_user_variant` against the compiled & vectorized bucketing paths.
+
+Usage: python -m benchmarks.bench_distribution [--users N] [--variants N]
+"""
+import argparse
+import secrets
+import timeit
+from datetime import datetime
+from uuid import uuid4
+
+from app import distribution
+from app.models.experiments import EvaluationMode
+from app.models.experiments import Experiment
+from app.models.experiments import ExperimentStatus
+from app.models.experiments import ExperimentType
+from app.models.experiments import Hypothesis
+from app.models.experiments import Variant
+
+
+def make_experiment(num_variants: int) -> Experiment:
+    return Experiment(
+        experiment_id=uuid4(),
+        name="benchmark",
+        key="benchmark",
+        type=ExperimentType.HYPOTHESIS_TESTING,
+        description=None,
+        hypothesis=Hypothesis(metric_effects=[]),
+        exposure_event="benchmark_exposure",
+        variants=[
+            Variant(name=f"variant_{i}", description="") for i in range(num_variants)
+        ],
+        variant_allocation={
+            f"variant_{i}": 1 / num_variants for i in range(num_variants)
+        },
+        user_segments=[],
+        bucketing_salt=secrets.token_hex(4),
+        evaluation_mode=EvaluationMode.STICKY,
+        layer_id=None,
+        traffic_slice=None,
+        status=ExperimentStatus.RUNNING,
+        created_at=datetime.now(),
+        updated_at=datetime.now(),
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--variants", type=int, default=4)
+    args = parser.parse_args()
+
+    experiment = make_experiment(args.variants)
+    evaluator = distribution.compile_experiment(experiment)
+    user_ids = [f"user-{i}" for i in range(args.users)]
+
+    for user_id in user_ids:
+        if distribution.get_user_variant(
+            experiment, user_id
+        ) != evaluator.get_user_variant(user_id):
+            raise RuntimeError(f"Assignments differ for {user_id!r}")
+    if distribution.bucket_many(experiment, user_ids) != [
+        evaluator.get_user_variant(u) for u in user_ids
+    ]:
+        raise RuntimeError("Bulk assignments differ")
+
+    baseline = min(
+        timeit.repeat(
+            lambda: [distribution.get_user_variant(experiment, u) for u in user_ids],
+            number=1,
+            repeat=5,
+        )
+    )
+    compiled = min(
+        timeit.repeat(
+            lambda: [evaluator.get_user_variant(u) for u in user_ids],
+            number=1,
+            repeat=5,
+        )
+    )
+    vectorized = min(
+        timeit.repeat(
+            lambda: distribution.bucket_many(experiment, user_ids),
+            number=1,
+            repeat=5,
+        )
+    )
+
+    print(f"get_user_variant:   {baseline / args.users * 1e9:8.1f} ns/user")
+    print(f"BucketingEvaluator: {compiled / args.users * 1e9:8.1f} ns/user")
+    print(f"bucket_many:        {vectorized / args.users * 1e9:8.1f} ns/user")
+    print(f"speedup (compiled): {baseline / compiled:8.2f}x")
+    print(f"speedup (bulk):     {baseline / vectorized:8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
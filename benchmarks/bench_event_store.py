@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Time computing a metric over the local event store.
+
+Segments are written straight from synthetic columns, as building that many
+events one by one would take far longer than the scan being measured.
+
+Usage: python -m benchmarks.bench_event_store [--events N] [--users N]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from datetime import timedelta
+
+import numpy as np
+
+from app.event_store import encode_strings
+from app.event_store import EventStore
+from app.event_store import new_segment_name
+from app.event_store import Segment
+from app.event_store import to_timestamp
+from app.models.experiments import EventSegmentationMetric
+from app.models.experiments import MetricType
+from app.models.experiments import PropertyFilter
+from app.models.experiments import PropertyFilterOperator
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=20_000_000)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--segment-size", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    user_ids = sorted(f"user-{i}" for i in range(args.users))
+    user_id_dictionary = encode_strings(user_ids)
+    start = datetime(2024, 1, 1)
+    countries = encode_strings(["de", "gb", "jp", "us"])
+
+    path = tempfile.mkdtemp()
+    try:
+        store = EventStore(path)
+
+        started_at = time.perf_counter()
+        events_per_day = args.events // args.days
+        for day in range(args.days):
+            partition_path = store.get_partition_path(
+                "purchase",
+                (start + timedelta(days=day)).date(),
+            )
+            for offset in range(0, events_per_day, args.segment_size):
+                rows = min(args.segment_size, events_per_day - offset)
+                day_start = to_timestamp(start + timedelta(days=day))
+                Segment.write(
+                    partition_path / new_segment_name(),
+                    timestamps=np.sort(
+                        rng.integers(day_start, day_start + 86_400_000_000, rows)
+                    ),
+                    user_ids=(
+                        user_id_dictionary,
+                        rng.integers(0, args.users, rows, dtype=np.int32),
+                    ),
+                    properties={
+                        "amount": (
+                            (
+                                np.array([], dtype=np.bytes_),
+                                np.full(rows, -1, dtype=np.int32),
+                            ),
+                            rng.exponential(30.0, rows).round(2),
+                        ),
+                        "country": (
+                            (countries, rng.integers(0, 4, rows, dtype=np.int32)),
+                            np.full(rows, np.nan),
+                        ),
+                    },
+                )
+        print(
+            f"wrote {args.events:,} events in {time.perf_counter() - started_at:.1f}s"
+        )
+
+        # half of the users are exposed, at some point over the first day
+        exposed_user_ids = user_ids[::2]
+        exposed_at = [
+            start + timedelta(seconds=int(s))
+            for s in rng.integers(0, 86_400, len(exposed_user_ids))
+        ]
+        metric = EventSegmentationMetric(
+            name="revenue per buyer",
+            type=MetricType.PROPERTY_AVERAGE,
+            event="purchase",
+            property="amount",
+            property_filters=[
+                PropertyFilter(
+                    property="country",
+                    operator=PropertyFilterOperator.NOT_EQUALS,
+                    value="jp",
+                ),
+                PropertyFilter(
+                    property="amount",
+                    operator=PropertyFilterOperator.GREATER_THAN,
+                    value="1",
+                ),
+            ],
+        )
+
+        for attempt in ("cold", "warm"):
+            started_at = time.perf_counter()
+            values, denominators = store.compute_user_values(
+                metric,
+                exposed_user_ids,
+                exposed_at,
+            )
+            elapsed = time.perf_counter() - started_at
+            print(
+                f"{attempt}: {metric.type.value} over {args.events:,} events for"
+                f" {len(exposed_user_ids):,} exposed users in {elapsed:.2f}s"
+                f" ({args.events / elapsed / 1e6:.0f}M events/s)"
+            )
+        print(f"mean: {values.sum() / denominators.sum():.3f}")
+    finally:
+        shutil.rmtree(path)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Compare ways of hydrating models from database rows.
+
+Usage: python -m benchmarks.bench_hydration [--rows N]
+"""
+import argparse
+import timeit
+import uuid
+from datetime import datetime
+from typing import Any
+
+from app.models.assignments import Assignment
+from app.models.experiments import Direction
+from app.models.experiments import EvaluationMode
+from app.models.experiments import EventSegmentationMetric
+from app.models.experiments import Experiment
+from app.models.experiments import ExperimentStatus
+from app.models.experiments import ExperimentType
+from app.models.experiments import Hypothesis
+from app.models.experiments import MetricEffect
+from app.models.experiments import MetricType
+from app.models.experiments import PropertyFilter
+from app.models.experiments import PropertyFilterOperator
+from app.models.experiments import Segment
+from app.models.experiments import Variant
+from app.models.layers import TrafficSlice
+from app.repositories import assignments
+from app.repositories import experiments
+from benchmarks.bench_distribution import make_experiment
+
+
+def make_assignment_row() -> dict[str, Any]:
+    return {
+        "experiment_id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "variant_name": "control",
+        "created_at": datetime.now(),
+    }
+
+
+def make_experiment_row() -> dict[str, Any]:
+    return experiments.serialize(make_experiment(4))
+
+
+def construct_property_filter(data: dict[str, Any]) -> PropertyFilter:
+    return PropertyFilter.model_construct(
+        property=data["property"],
+        operator=PropertyFilterOperator(data["operator"]),
+        value=data["value"],
+    )
+
+
+def construct_experiment(row: dict[str, Any]) -> Experiment:
+    # nested models must be constructed by hand, as construct doesn't recurse
+    hypothesis = row["hypothesis"]
+    return Experiment.model_construct(
+        experiment_id=uuid.UUID(row["experiment_id"]),
+        name=row["name"],
+        key=row["key"],
+        type=ExperimentType(row["type"]),
+        description=row["description"],
+        hypothesis=Hypothesis.model_construct(
+            metric_effects=[
+                MetricEffect.model_construct(
+                    metric=EventSegmentationMetric.model_construct(
+                        name=effect["metric"]["name"],
+                        type=MetricType(effect["metric"]["type"]),
+                        event=effect["metric"]["event"],
+                        property_filters=(
+                            [
+                                construct_property_filter(f)
+                                for f in effect["metric"]["property_filters"]
+                            ]
+                            if effect["metric"]["property_filters"] is not None
+                            else None
+                        ),
+                        property=effect["metric"]["property"],
+                    ),
+                    direction=Direction(effect["direction"]),
+                    minimum_goal=effect["minimum_goal"],
+                )
+                for effect in hypothesis["metric_effects"]
+            ]
+        ),
+        exposure_event=row["exposure_event"],
+        variants=[Variant.model_construct(**v) for v in row["variants"]],
+        variant_allocation=row["variant_allocation"],
+        user_segments=[
+            Segment.model_construct(
+                name=segment["name"],
+                filters=[construct_property_filter(f) for f in segment["filters"]],
+            )
+            for segment in row["user_segments"]
+        ],
+        bucketing_salt=row["bucketing_salt"],
+        evaluation_mode=EvaluationMode(row["evaluation_mode"]),
+        layer_id=(uuid.UUID(row["layer_id"]) if row["layer_id"] is not None else None),
+        traffic_slice=(
+            TrafficSlice.model_construct(**row["traffic_slice"])
+            if row["traffic_slice"] is not None
+            else None
+        ),
+        status=ExperimentStatus(row["status"]),
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000)
+    args = parser.parse_args()
+
+    assignment_rows = [make_assignment_row() for _ in range(args.rows)]
+    experiment_rows = [make_experiment_row() for _ in range(args.rows)]
+
+    cases = {
+        "assignments": {
+            # validating the deserialized model a second time, as before
+            "double validation": lambda: [
+                Assignment.model_validate(assignments.deserialize(row))
+                for row in assignment_rows
+            ],
+            "single validation": lambda: [
+                assignments.deserialize(row) for row in assignment_rows
+            ],
+            "model_construct": lambda: [
+                Assignment.model_construct(
+                    experiment_id=uuid.UUID(row["experiment_id"]),
+                    user_id=row["user_id"],
+                    variant_name=row["variant_name"],
+                    created_at=row["created_at"],
+                )
+                for row in assignment_rows
+            ],
+        },
+        "experiments": {
+            "double validation": lambda: [
+                Experiment.model_validate(experiments.deserialize(row))
+                for row in experiment_rows
+            ],
+            "single validation": lambda: [
+                experiments.deserialize(row) for row in experiment_rows
+            ],
+            "model_construct": lambda: [
+                construct_experiment(row) for row in experiment_rows
+            ],
+        },
+    }
+    for name, strategies in cases.items():
+        print(f"{name} ({args.rows} rows):")
+        for strategy, hydrate in strategies.items():
+            elapsed = min(timeit.repeat(hydrate, number=1, repeat=5))
+            print(f"  {strategy:<18} {elapsed / args.rows * 1e6:8.2f} us/row")
+
+    row = experiment_rows[0]
+    if construct_experiment(row) != experiments.deserialize(row):
+        raise RuntimeError("model_construct hydrated a different experiment")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
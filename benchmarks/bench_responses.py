@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Compare the per-request cost of encoding responses via stdlib json & orjson.
+
+Usage: python -m benchmarks.bench_responses [--experiments N]
+"""
+import argparse
+import json
+import timeit
+import uuid
+
+from fastapi.responses import JSONResponse
+
+from app.api.v1 import responses
+from app.models.experiments import UserExperimentBucketing
+from benchmarks.bench_distribution import make_experiment
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--experiments", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=2_000)
+    args = parser.parse_args()
+
+    experiments = [make_experiment(4) for _ in range(args.experiments)]
+    bucketings = [
+        UserExperimentBucketing(experiment_id=uuid.uuid4(), variant_name="control")
+        for _ in range(args.experiments)
+    ]
+
+    cases = {
+        "list experiments": experiments,
+        "eligible experiments": bucketings,
+    }
+    for name, models in cases.items():
+        # the encoding used before responses were orjson-backed
+        def stdlib() -> None:
+            JSONResponse(
+                {
+                    "status": "success",
+                    "data": [m.model_dump(mode="json") for m in models],
+                    "meta": {},
+                }
+            )
+
+        def fast() -> None:
+            responses.success(models)
+
+        if json.loads(responses.success(models).body) != json.loads(
+            JSONResponse(
+                {
+                    "status": "success",
+                    "data": [m.model_dump(mode="json") for m in models],
+                    "meta": {},
+                }
+            ).body
+        ):
+            raise RuntimeError(f"Encodings differ for {name!r}")
+
+        baseline = min(timeit.repeat(stdlib, number=args.iterations, repeat=5))
+        optimized = min(timeit.repeat(fast, number=args.iterations, repeat=5))
+        print(f"{name} ({args.experiments} items):")
+        print(f"  stdlib json: {baseline / args.iterations * 1e6:8.1f} us/request")
+        print(f"  orjson:      {optimized / args.iterations * 1e6:8.1f} us/request")
+        print(f"  speedup:     {baseline / optimized:8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Compare interpreting experiments' user segments against `TargetingIndex`.
+
+Usage: python -m benchmarks.bench_targeting [--experiments N] [--users N]
+"""
+import argparse
+import random
+import timeit
+from typing import Any
+
+from app.event_store import is_number
+from app.event_store import to_json_text
+from app.models.experiments import PropertyFilter
+from app.models.experiments import PropertyFilterOperator
+from app.models.experiments import Segment
+from app.targeting import NUMERIC_COMPARISONS
+from app.targeting import TargetingIndex
+from app.targeting import UserAttributes
+
+COUNTRIES = ["de", "gb", "jp", "us", "fr", "br", "in", "ca"]
+PLATFORMS = ["ios", "android", "web"]
+PLANS = ["free", "plus", "pro"]
+
+
+def matches(property_filter: PropertyFilter, attributes: UserAttributes) -> bool:
+    value = attributes.get(property_filter.property)
+    operator = property_filter.operator
+    if operator is PropertyFilterOperator.EQUALS:
+        return value is not None and to_json_text(value) == property_filter.value
+    elif operator is PropertyFilterOperator.NOT_EQUALS:
+        return value is None or to_json_text(value) != property_filter.value
+    else:
+        return is_number(value) and NUMERIC_COMPARISONS[operator](
+            float(value), float(property_filter.value)
+        )
+
+
+def is_in_audience(segments: list[Segment], attributes: UserAttributes) -> bool:
+    return not segments or any(
+        all(matches(f, attributes) for f in segment.filters) for segment in segments
+    )
+
+
+def get_audiences(
+    index: TargetingIndex,
+    indices: list[int],
+    users: list[dict[str, Any]],
+) -> list[list[int]]:
+    return [index.get_audience(indices, attributes) for attributes in users]
+
+
+def make_segments(rng: random.Random) -> list[Segment]:
+    # a quarter of experiments target everyone
+    if rng.random() < 0.25:
+        return []
+
+    segments = []
+    for i in range(rng.randint(1, 3)):
+        filters = [
+            PropertyFilter(
+                property="country",
+                operator=rng.choice(
+                    [PropertyFilterOperator.EQUALS, PropertyFilterOperator.NOT_EQUALS]
+                ),
+                value=rng.choice(COUNTRIES),
+            )
+        ]
+        if rng.random() < 0.5:
+            filters.append(
+                PropertyFilter(
+                    property="platform",
+                    operator=PropertyFilterOperator.EQUALS,
+                    value=rng.choice(PLATFORMS),
+                )
+            )
+        if rng.random() < 0.5:
+            filters.append(
+                PropertyFilter(
+                    property="age",
+                    operator=rng.choice(list(NUMERIC_COMPARISONS)),
+                    value=str(rng.randint(18, 65)),
+                )
+            )
+        segments.append(Segment(name=f"segment_{i}", filters=filters))
+    return segments
+
+
+def make_attributes(rng: random.Random) -> dict[str, Any]:
+    attributes: dict[str, Any] = {
+        "country": rng.choice(COUNTRIES),
+        "platform": rng.choice(PLATFORMS),
+        "plan": rng.choice(PLANS),
+    }
+    # some users' ages aren't known
+    if rng.random() < 0.8:
+        attributes["age"] = rng.randint(13, 80)
+    return attributes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--experiments", type=int, default=300)
+    parser.add_argument("--users", type=int, default=10_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    user_segments = [make_segments(rng) for _ in range(args.experiments)]
+    users = [make_attributes(rng) for _ in range(args.users)]
+    indices = list(range(args.experiments))
+
+    index = TargetingIndex(user_segments)
+    for attributes in users:
+        expected = [i for i in indices if is_in_audience(user_segments[i], attributes)]
+        if index.get_audience(indices, attributes) != expected:
+            raise RuntimeError(f"Audiences differ for {attributes!r}")
+
+    interpreted = min(
+        timeit.repeat(
+            lambda: [
+                [i for i in indices if is_in_audience(user_segments[i], attributes)]
+                for attributes in users
+            ],
+            number=1,
+            repeat=3,
+        )
+    )
+    # compiling a fresh index, so none of the users' audiences are cached
+    cold = min(
+        timeit.repeat(
+            lambda: get_audiences(TargetingIndex(user_segments), indices, users),
+            number=1,
+            repeat=3,
+        )
+    )
+    warm = min(
+        timeit.repeat(
+            lambda: get_audiences(index, indices, users),
+            number=1,
+            repeat=3,
+        )
+    )
+
+    filters = {
+        (f.property, f.operator, f.value)
+        for segments in user_segments
+        for segment in segments
+        for f in segment.filters
+    }
+    print(f"{args.experiments} experiments, {len(filters)} distinct filters")
+    print(f"interpreted:    {interpreted / args.users * 1e6:8.1f} us/user")
+    print(f"TargetingIndex: {cold / args.users * 1e6:8.1f} us/user (cold)")
+    print(f"TargetingIndex: {warm / args.users * 1e6:8.1f} us/user (warm)")
+    print(f"speedup (cold): {interpreted / cold:8.2f}x")
+    print(f"speedup (warm): {interpreted / warm:8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
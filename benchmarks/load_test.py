@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""Load test the API, reporting throughput & latency percentiles as json.
+
+Experiments are seeded through the API, so the server must be connected to
+a database which can be written to; use a dedicated one, as every running
+experiment is evaluated for each eligibility request. The experiments the
+load test starts are completed once it finishes, unless --keep is passed.
+
+Each scenario is driven by a fixed number of concurrent workers, which
+send requests back to back for the given duration. Scenarios are run once
+per experiment count, seeding more experiments in between, to show how
+latency scales with the number of running experiments.
+
+Usage: python -m benchmarks.load_test [--base-url URL | --serve]
+                                      [--experiments N[,N...]] [--users N]
+                                      [--assigned-users N] [--concurrency N]
+                                      [--duration S] [--output PATH]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import time
+from collections import Counter
+from collections.abc import AsyncIterator
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Iterator
+from collections.abc import Sequence
+from contextlib import asynccontextmanager
+from typing import Any
+from typing import TypeVar
+
+import httpx
+import numpy as np
+
+from app.models.experiments import EvaluationMode
+
+T = TypeVar("T")
+
+# sends one of a scenario's requests
+Scenario = Callable[[httpx.AsyncClient], Awaitable[httpx.Response]]
+
+
+def batched(items: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace) -> None:
+        self.client = client
+        self.args = args
+        self.run_id = secrets.token_hex(4)
+        self.rng = random.Random(args.seed)
+        self.user_ids = [f"load-{self.run_id}-user-{i}" for i in range(args.users)]
+        self.assigned_user_ids = self.user_ids[: args.assigned_users]
+        self.experiments: list[tuple[str, EvaluationMode]] = []
+        self.exposures: Iterator[tuple[str, str]] = iter(())
+        self.exposed: set[tuple[str, str]] = set()
+
+    async def _request(self, method: str, url: str, **kwargs: Any) -> Any:
+        response = await self.client.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def _create_experiment(self, number: int) -> None:
+        evaluation_mode = (
+            EvaluationMode.STATELESS
+            if self.rng.random() < self.args.stateless_ratio
+            else EvaluationMode.STICKY
+        )
+        key = f"load-{self.run_id}-{number}"
+        data = await self._request(
+            "POST",
+            "/v1/experiments",
+            json={
+                "experiment_name": key,
+                "experiment_type": "hypothesis_testing",
+                "experiment_key": key,
+            },
+        )
+        experiment_id = data["data"]["experiment_id"]
+        await self._request(
+            "PATCH",
+            f"/v1/experiments/{experiment_id}",
+            json={
+                "hypothesis": {"metric_effects": []},
+                "exposure_event": f"{key}_exposure",
+                "variants": [
+                    {"name": "control", "description": ""},
+                    {"name": "treatment", "description": ""},
+                ],
+                "variant_allocation": {"control": 0.5, "treatment": 0.5},
+                "evaluation_mode": evaluation_mode.value,
+            },
+        )
+        await self._request(
+            "PATCH",
+            f"/v1/experiments/{experiment_id}",
+            json={"status": "running"},
+        )
+        self.experiments.append((experiment_id, evaluation_mode))
+
+    async def seed(self, experiments: int) -> None:
+        """Start experiments until there are the given number of them, &
+        assign the assigned users to each of them."""
+        numbers = range(len(self.experiments), experiments)
+        for batch in batched(numbers, self.args.concurrency):
+            await asyncio.gather(*(self._create_experiment(n) for n in batch))
+
+        for batch in batched(self.assigned_user_ids, 500):
+            response = await self.client.post(
+                "/v1/eligible_experiments:batch",
+                json={"user_ids": batch},
+            )
+            response.raise_for_status()
+
+        # a unique (experiment, user) pair for each exposure; users must
+        # have been assigned to sticky experiments to be exposed to them
+        pairs = [
+            (experiment_id, user_id)
+            for experiment_id, evaluation_mode in self.experiments
+            for user_id in (
+                self.user_ids
+                if evaluation_mode is EvaluationMode.STATELESS
+                else self.assigned_user_ids
+            )
+            if (experiment_id, user_id) not in self.exposed
+        ]
+        self.rng.shuffle(pairs)
+        self.exposures = iter(pairs)
+
+    async def count_running_experiments(self) -> int:
+        # including any which were running before the load test
+        data = await self._request(
+            "GET",
+            "/v1/experiments",
+            params={"status": "running", "page_size": 1},
+        )
+        return data["meta"]["total"]
+
+    async def complete(self) -> None:
+        for batch in batched(self.experiments, self.args.concurrency):
+            await asyncio.gather(
+                *(
+                    self._request(
+                        "PATCH",
+                        f"/v1/experiments/{experiment_id}",
+                        json={"status": "completed"},
+                    )
+                    for experiment_id, _ in batch
+                )
+            )
+
+    def get_scenarios(self) -> dict[str, Scenario]:
+        async def eligible_experiments(client: httpx.AsyncClient) -> httpx.Response:
+            return await client.get(
+                "/v1/eligible_experiments",
+                params={"user_id": self.rng.choice(self.user_ids)},
+            )
+
+        async def experiments(client: httpx.AsyncClient) -> httpx.Response:
+            return await client.get(
+                "/v1/experiments",
+                params={"status": "running", "page_size": 50},
+            )
+
+        async def exposures(client: httpx.AsyncClient) -> httpx.Response:
+            pair = next(self.exposures, None)
+            if pair is None:
+                # every pair has been exposed; the rest are duplicates (409s)
+                pair = (self.experiments[0][0], self.user_ids[0])
+            self.exposed.add(pair)
+            experiment_id, user_id = pair
+            return await client.post(
+                f"/v1/experiments/{experiment_id}/exposures",
+                json={"user_id": user_id},
+            )
+
+        return {
+            "eligible_experiments": eligible_experiments,
+            "experiments": experiments,
+            "exposures": exposures,
+        }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    concurrency: int,
+    duration: float,
+) -> dict[str, Any]:
+    latencies: list[int] = []
+    status_codes: Counter[int] = Counter()
+    deadline = time.perf_counter() + duration
+
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            started_at = time.perf_counter_ns()
+            try:
+                response = await scenario(client)
+            except httpx.HTTPError:
+                status_codes[0] += 1  # connection errors & timeouts
+                continue
+            latencies.append(time.perf_counter_ns() - started_at)
+            status_codes[response.status_code] += 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    requests = sum(status_codes.values())
+    latencies_ms = np.array(latencies or [0], dtype=np.float64) / 1e6
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        "requests": requests,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "status_codes": {str(k): v for k, v in sorted(status_codes.items())},
+        "latency_ms": {
+            "mean": round(float(latencies_ms.mean()), 3),
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+            "max": round(float(latencies_ms.max()), 3),
+        },
+    }
+
+
+@asynccontextmanager
+async def serve(port: int) -> AsyncIterator[str]:
+    """Run the api in a subprocess, for the duration of the load test."""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        env=os.environ,
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            for _ in range(100):
+                if process.poll() is not None:
+                    raise RuntimeError("The server exited during startup")
+                try:
+                    await client.get("/v1/experiments", params={"page_size": 1})
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("The server didn't start in time")
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def load_test(base_url: str, args: argparse.Namespace) -> dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        limits=limits,
+        timeout=args.timeout,
+    ) as client:
+        test = LoadTest(client, args)
+        scenarios = test.get_scenarios()
+        results: dict[str, Any] = {
+            "config": {
+                "base_url": base_url,
+                "users": args.users,
+                "assigned_users": args.assigned_users,
+                "stateless_ratio": args.stateless_ratio,
+                "concurrency": args.concurrency,
+                "duration_s": args.duration,
+                "warmup_s": args.warmup,
+            },
+            "runs": [],
+        }
+        try:
+            for experiments in args.experiments:
+                print(f"seeding {experiments} running experiments", file=sys.stderr)
+                await test.seed(experiments)
+                # let every worker's snapshot pick up the new experiments
+                await asyncio.sleep(args.settle)
+
+                run: dict[str, Any] = {
+                    "running_experiments": await test.count_running_experiments()
+                }
+                for name, scenario in scenarios.items():
+                    if name not in args.scenarios:
+                        continue
+                    print(f"  {name}", file=sys.stderr)
+                    if args.warmup > 0:
+                        await run_scenario(
+                            client,
+                            scenario,
+                            args.concurrency,
+                            args.warmup,
+                        )
+                    run[name] = await run_scenario(
+                        client,
+                        scenario,
+                        args.concurrency,
+                        args.duration,
+                    )
+                results["runs"].append(run)
+        finally:
+            if not args.keep:
+                await test.complete()
+        return results
+
+
+async def main_async(args: argparse.Namespace) -> dict[str, Any]:
+    if args.serve:
+        async with serve(args.port) as base_url:
+            return await load_test(base_url, args)
+    return await load_test(args.base_url, args)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="run the api in a subprocess, rather than using --base-url",
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--experiments",
+        type=lambda s: sorted(int(n) for n in s.split(",")),
+        default=[10, 100],
+        help="comma separated numbers of running experiments to test with",
+    )
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument(
+        "--assigned-users",
+        type=int,
+        default=1_000,
+        help="users assigned to every sticky experiment before the test",
+    )
+    parser.add_argument("--stateless-ratio", type=float, default=0.5)
+    parser.add_argument(
+        "--scenarios",
+        type=lambda s: s.split(","),
+        default=["eligible_experiments", "experiments", "exposures"],
+    )
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=5.0,
+        help="seconds to wait after seeding; the snapshot refresh interval",
+    )
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true")
+    parser.add_argument("--output", help="write the results here, not stdout")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks of hot functions, comparable against a saved baseline.
+
+Each case runs for enough iterations to take at least 0.2s, & is repeated;
+the fastest repeat is reported, as it's the least disturbed by whatever
+else the machine is doing. Baselines are only comparable when taken on
+the same machine & python version.
+
+Usage: python -m benchmarks.micro [--filter REGEX] [--repeat N]
+                                  [--save PATH] [--compare PATH]
+                                  [--threshold FRACTION]
+"""
+import argparse
+import json
+import platform
+import re
+import statistics
+import sys
+import timeit
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any
+
+from app import distribution
+from app import metrics
+from app.adapters.database import get_function_name
+from app.api.v1 import responses
+from app.errors import ServiceError
+from app.models import get_all_set_fields
+from app.repositories import assignments
+from app.repositories import experiments
+from app.repositories import exposures
+from app.repositories import holdouts
+from app.repositories import layers
+from app.repositories import metric_aggregates
+from benchmarks import payloads
+
+USER_ID = "5f0c8b9e-3f1a-4c2d-9e7b-1a2b3c4d5e6f"
+
+
+def get_cases() -> dict[str, Callable[[], object]]:
+    small_experiment = payloads.make_experiment(num_variants=2)
+    experiment = payloads.make_experiment()
+    evaluator = distribution.compile_experiment(experiment)
+    experiment_row = experiments.serialize(experiment)
+    experiment_update = payloads.make_experiment_update()
+    experiments_page = [payloads.make_experiment() for _ in range(50)]
+    bucketings = payloads.make_bucketings(50)
+
+    cases: dict[str, Callable[[], object]] = {
+        "distribution.normalize_value": lambda: distribution.normalize_value(
+            f"{experiment.bucketing_salt}:{USER_ID}"
+        ),
+        "distribution.get_user_variant[2 variants]": lambda: (
+            distribution.get_user_variant(small_experiment, USER_ID)
+        ),
+        "distribution.get_user_variant[20 variants]": lambda: (
+            distribution.get_user_variant(experiment, USER_ID)
+        ),
+        "distribution.BucketingEvaluator[20 variants]": lambda: (
+            evaluator.get_user_variant(USER_ID)
+        ),
+        "repositories.experiments.serialize": lambda: experiments.serialize(experiment),
+        "repositories.experiments.deserialize": lambda: experiments.deserialize(
+            experiment_row
+        ),
+        "models.get_all_set_fields[experiment update]": lambda: (
+            get_all_set_fields(experiment_update)
+        ),
+        "responses.success[50 experiments]": lambda: responses.success(
+            experiments_page
+        ),
+        "responses.success[50 bucketings]": lambda: responses.success(bucketings),
+        # instrumentation on every query & request
+        "database.get_function_name": lambda: get_function_name(sys._getframe()),
+        "metrics.observe_query": lambda: metrics.observe_query(
+            "app.repositories.experiments.fetch_one", "SELECT 1", 0.001
+        ),
+        "metrics.count_service_error": lambda: metrics.count_service_error(
+            ServiceError.EXPERIMENTS_NOT_FOUND
+        ),
+    }
+
+    # the smaller models' repositories
+    for repository, model in (
+        (assignments, payloads.make_assignment()),
+        (exposures, payloads.make_exposure()),
+        (layers, payloads.make_layer()),
+        (holdouts, payloads.make_holdout()),
+        (metric_aggregates, payloads.make_metric_aggregates()),
+    ):
+        name = repository.__name__.removeprefix("app.")
+        row = repository.serialize(model)
+        cases[f"{name}.serialize"] = lambda r=repository, m=model: r.serialize(m)
+        cases[f"{name}.deserialize"] = lambda r=repository, d=row: r.deserialize(d)
+
+    return cases
+
+
+def time_case(case: Callable[[], object], repeat: int) -> dict[str, Any]:
+    timer = timeit.Timer(case)
+    number, _ = timer.autorange()
+    ns_per_op = [t / number * 1e9 for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "ns_per_op": min(ns_per_op),
+        "median_ns_per_op": statistics.median(ns_per_op),
+        "iterations": number,
+    }
+
+
+def format_duration(ns: float) -> str:
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f} ms"
+    elif ns >= 1e3:
+        return f"{ns / 1e3:.2f} us"
+    else:
+        return f"{ns:.0f} ns"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", help="only run cases matching this regex")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="save the results as a baseline")
+    parser.add_argument("--compare", help="compare the results to a baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="the slowdown, as a fraction, to report as a regression",
+    )
+    args = parser.parse_args()
+
+    baseline: dict[str, Any] = {}
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)["cases"]
+
+    results: dict[str, dict[str, Any]] = {}
+    regressions = []
+    for name, case in get_cases().items():
+        if args.filter is not None and not re.search(args.filter, name):
+            continue
+
+        results[name] = result = time_case(case, args.repeat)
+        line = f"{name:<48} {format_duration(result['ns_per_op']):>10}"
+        if name in baseline:
+            before = baseline[name]["ns_per_op"]
+            change = result["ns_per_op"] / before - 1
+            line += f" {format_duration(before):>10} {change:+8.1%}"
+            if change > args.threshold:
+                line += "  regressed"
+                regressions.append(name)
+            elif change < -args.threshold:
+                line += "  improved"
+        print(line)
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "created_at": datetime.now().isoformat(),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "cases": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed by over {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,212 @@
+"""Realistic models for benchmarks to operate on.
+
+Sizes are on the heavier end of what's seen in production: many variants
+with payloads, hypotheses with many metrics & filters, & targeting.
+"""
+import random
+import secrets
+import uuid
+from datetime import datetime
+
+from app.models.assignments import Assignment
+from app.models.experiments import Direction
+from app.models.experiments import EvaluationMode
+from app.models.experiments import EventSegmentationMetric
+from app.models.experiments import Experiment
+from app.models.experiments import ExperimentStatus
+from app.models.experiments import ExperimentType
+from app.models.experiments import ExperimentUpdate
+from app.models.experiments import Hypothesis
+from app.models.experiments import MetricEffect
+from app.models.experiments import MetricType
+from app.models.experiments import PropertyFilter
+from app.models.experiments import PropertyFilterOperator
+from app.models.experiments import Segment
+from app.models.experiments import UserExperimentBucketing
+from app.models.experiments import Variant
+from app.models.exposures import Exposure
+from app.models.holdouts import Holdout
+from app.models.holdouts import HoldoutStatus
+from app.models.layers import Layer
+from app.models.layers import TrafficSlice
+from app.models.results import MetricAggregates
+from app.models.results import SufficientStatistics
+
+
+def make_variants(num_variants: int) -> list[Variant]:
+    return [
+        Variant(
+            name=f"variant_{i}",
+            description=f"Variant {i} of the checkout flow redesign",
+            payload={
+                "button_color": f"#{i:06x}",
+                "copy": {"title": f"Checkout {i}", "cta": "Buy now"},
+                "steps": list(range(i % 5 + 1)),
+            },
+        )
+        for i in range(num_variants)
+    ]
+
+
+def make_hypothesis(num_metric_effects: int) -> Hypothesis:
+    rng = random.Random(num_metric_effects)
+    return Hypothesis(
+        metric_effects=[
+            MetricEffect(
+                metric=EventSegmentationMetric(
+                    name=f"metric_{i}",
+                    type=MetricType.PROPERTY_SUM,
+                    event=f"event_{i % 7}",
+                    property="amount",
+                    property_filters=[
+                        PropertyFilter(
+                            property="country",
+                            operator=PropertyFilterOperator.EQUALS,
+                            value=rng.choice(["de", "gb", "jp", "us"]),
+                        ),
+                        PropertyFilter(
+                            property="amount",
+                            operator=PropertyFilterOperator.GREATER_THAN,
+                            value=str(rng.randint(1, 100)),
+                        ),
+                    ],
+                ),
+                direction=rng.choice(list(Direction)),
+                minimum_goal=rng.random() * 5,
+            )
+            for i in range(num_metric_effects)
+        ]
+    )
+
+
+def make_segments(num_segments: int) -> list[Segment]:
+    return [
+        Segment(
+            name=f"segment_{i}",
+            filters=[
+                PropertyFilter(
+                    property="platform",
+                    operator=PropertyFilterOperator.EQUALS,
+                    value=["ios", "android", "web"][i % 3],
+                ),
+                PropertyFilter(
+                    property="age",
+                    operator=PropertyFilterOperator.GREATER_THAN_OR_EQUAL,
+                    value=str(18 + i),
+                ),
+            ],
+        )
+        for i in range(num_segments)
+    ]
+
+
+def make_experiment(
+    num_variants: int = 20,
+    num_metric_effects: int = 25,
+    num_segments: int = 5,
+) -> Experiment:
+    return Experiment(
+        experiment_id=uuid.uuid4(),
+        name="Checkout flow redesign",
+        key=f"checkout_flow_redesign_{secrets.token_hex(4)}",
+        type=ExperimentType.HYPOTHESIS_TESTING,
+        description="Compares redesigns of the checkout flow " * 10,
+        hypothesis=make_hypothesis(num_metric_effects),
+        exposure_event="checkout_viewed",
+        variants=make_variants(num_variants),
+        variant_allocation={
+            f"variant_{i}": 1 / num_variants for i in range(num_variants)
+        },
+        user_segments=make_segments(num_segments),
+        bucketing_salt=secrets.token_hex(4),
+        evaluation_mode=EvaluationMode.STICKY,
+        layer_id=uuid.uuid4(),
+        traffic_slice=TrafficSlice(start=0, end=5_000),
+        status=ExperimentStatus.RUNNING,
+        created_at=datetime.now(),
+        updated_at=datetime.now(),
+    )
+
+
+def make_experiment_update(num_variants: int = 20) -> ExperimentUpdate:
+    return ExperimentUpdate(
+        description="An updated description",
+        hypothesis=make_hypothesis(25),
+        exposure_event="checkout_viewed",
+        variants=make_variants(num_variants),
+        variant_allocation={
+            f"variant_{i}": 1 / num_variants for i in range(num_variants)
+        },
+        user_segments=make_segments(5),
+        status=ExperimentStatus.RUNNING,
+    )
+
+
+def make_assignment() -> Assignment:
+    return Assignment(
+        experiment_id=uuid.uuid4(),
+        user_id=str(uuid.uuid4()),
+        variant_name="variant_3",
+        created_at=datetime.now(),
+    )
+
+
+def make_exposure() -> Exposure:
+    return Exposure(
+        experiment_id=uuid.uuid4(),
+        user_id=str(uuid.uuid4()),
+        variant_name="variant_3",
+        created_at=datetime.now(),
+    )
+
+
+def make_layer() -> Layer:
+    return Layer(
+        layer_id=uuid.uuid4(),
+        name="Checkout",
+        key=f"checkout_{secrets.token_hex(4)}",
+        bucketing_salt=secrets.token_hex(4),
+        created_at=datetime.now(),
+        updated_at=datetime.now(),
+    )
+
+
+def make_holdout() -> Holdout:
+    return Holdout(
+        holdout_id=uuid.uuid4(),
+        name="Global holdout",
+        key=f"global_{secrets.token_hex(4)}",
+        bucketing_salt=secrets.token_hex(4),
+        traffic=500,
+        status=HoldoutStatus.RUNNING,
+        created_at=datetime.now(),
+        updated_at=datetime.now(),
+    )
+
+
+def make_metric_aggregates(num_variants: int = 20) -> MetricAggregates:
+    return MetricAggregates(
+        experiment_id=uuid.uuid4(),
+        metric_hash=secrets.token_hex(32),
+        exposure_watermark=1_234_567,
+        event_watermark=98_765_432,
+        variants={
+            f"variant_{i}": SufficientStatistics(
+                users=10_000 + i,
+                sum=123_456.7,
+                sum_of_squares=9_876_543.2,
+                denominator_sum=20_000.0,
+                denominator_sum_of_squares=45_000.0,
+                cross_sum=250_000.5,
+            )
+            for i in range(num_variants)
+        },
+        updated_at=datetime.now(),
+    )
+
+
+def make_bucketings(num_experiments: int = 50) -> list[UserExperimentBucketing]:
+    return [
+        UserExperimentBucketing(experiment_id=uuid.uuid4(), variant_name="control")
+        for _ in range(num_experiments)
+    ]
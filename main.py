@@ -1,13 +1,27 @@
 #!/usr/bin/env python3
-from databases import Database
+import asyncio
+import functools
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app import exception_handling
+from app import jobs
 from app import logging
+from app import metrics
+from app import profiling
 from app import settings
+from app import tracing
 from app.adapters import postgres
+from app.adapters.database import Database
+from app.api.metrics import router as metrics_router
 from app.api.v1.experiments import router as experiments_router
+from app.context import BackgroundTaskContext
+from app.event_store import EventStore
+from app.exposure_writer import ExposureWriter
+from app.repositories import exposures
+from app.snapshots import ExperimentsSnapshotCache
+from app.usecases import experiments
 
 logging.configure_logging()
 exception_handling.hook_exception_handlers()
@@ -23,30 +37,82 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.PROFILING_TOKEN or settings.PROFILING_SAMPLE_RATE > 0:
+    # within the tracing middleware, so profiles include the request's queries
+    app.add_middleware(
+        profiling.ProfilingMiddleware,
+        output_dir=settings.PROFILING_OUTPUT_DIR,
+        token=settings.PROFILING_TOKEN,
+        sample_rate=settings.PROFILING_SAMPLE_RATE,
+    )
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(tracing.QueryTracingMiddleware)
 
 
 @app.on_event("startup")
 async def startup() -> None:
     app.state.database = Database(
-        url=postgres.create_dsn(
+        dsn=postgres.create_dsn(
             dialect="postgresql",
             user=settings.DB_USER,
             host=settings.DB_HOST,
             port=settings.DB_PORT,
             database=settings.DB_NAME,
             password=settings.DB_PASS,
-            driver="asyncpg",
-        )
+        ),
+        min_size=settings.DB_POOL_MIN_SIZE,
+        max_size=settings.DB_POOL_MAX_SIZE,
+        statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+        query_observers=[metrics.observe_query, tracing.observe_query],
     )
     await app.state.database.connect()
+    metrics.track_database_pool(app.state.database)
+
+    ctx = BackgroundTaskContext(app)
+    app.state.experiments_snapshot = ExperimentsSnapshotCache()
+    await experiments.refresh_running_experiments_snapshot(ctx)
+    app.state.experiments_snapshot_task = asyncio.create_task(
+        jobs.refresh_experiments_snapshot_periodically(
+            ctx,
+            interval=settings.EXPERIMENTS_SNAPSHOT_REFRESH_INTERVAL,
+        )
+    )
+
+    if settings.EXPOSURES_WRITE_BEHIND_ENABLED:
+        app.state.exposure_writer = ExposureWriter(
+            flush=functools.partial(exposures.copy_many, ctx),
+            max_batch_size=settings.EXPOSURES_FLUSH_BATCH_SIZE,
+            flush_interval=settings.EXPOSURES_FLUSH_INTERVAL,
+            max_pending=settings.EXPOSURES_MAX_PENDING,
+        )
+        app.state.exposure_writer.start()
+    else:
+        app.state.exposure_writer = None
+
+    if settings.EVENT_STORE_ENABLED:
+        app.state.event_store = EventStore(settings.EVENT_STORE_PATH)
+        app.state.event_store_compaction_task = asyncio.create_task(
+            jobs.compact_event_store_periodically(
+                ctx,
+                interval=settings.EVENT_STORE_COMPACTION_INTERVAL,
+            )
+        )
+    else:
+        app.state.event_store = None
 
 
 @app.on_event("shutdown")
 async def shutdown() -> None:
+    app.state.experiments_snapshot_task.cancel()
+    if app.state.exposure_writer is not None:
+        await app.state.exposure_writer.close()
+    if app.state.event_store is not None:
+        app.state.event_store_compaction_task.cancel()
     await app.state.database.disconnect()
 
 
 app.include_router(experiments_router)
+app.include_router(metrics_router)
 
 
 if __name__ == "__main__":
@@ -9,13 +9,11 @@ CREATE TABLE experiments (
     exposure_event TEXT NULL,
     variants JSONB NOT NULL,
     variant_allocation JSONB NOT NULL,
-    -- user_segments JSONB NOT NULL,
+    user_segments JSONB NOT NULL DEFAULT '[]',
     bucketing_salt TEXT NOT NULL,
-    -- TODO: add support for these to the application
-    -- sticky_bucketing BOOLEAN NOT NULL,
-    -- evaluation_mode TEXT NOT NULL,
-    -- mutual_exclusion_groups JSONB NOT NULL,
-    -- holdout_groups JSONB NOT NULL,
+    evaluation_mode TEXT NOT NULL DEFAULT 'sticky',
+    layer_id TEXT NULL,
+    traffic_slice JSONB NULL,
     status TEXT NOT NULL,
     created_at TIMESTAMP NOT NULL DEFAULT NOW(),
     updated_at TIMESTAMP NOT NULL DEFAULT NOW()
@@ -23,27 +21,101 @@ CREATE TABLE experiments (
 CREATE UNIQUE INDEX experiments_experiment_id_idx ON experiments (experiment_id);
 CREATE UNIQUE INDEX experiments_key_idx ON experiments (key);
 CREATE INDEX experiments_exposure_event_idx ON experiments (exposure_event);
+CREATE INDEX experiments_status_rec_id_idx ON experiments (status, rec_id);
+CREATE INDEX experiments_layer_id_idx ON experiments (layer_id);
+CREATE INDEX experiments_updated_at_idx ON experiments (updated_at);
 
-CREATE TABLE exposures (
+-- mutually exclusive experiments; each running experiment in a layer owns a
+-- disjoint slice of its buckets
+CREATE TABLE layers (
     rec_id SERIAL PRIMARY KEY,
+    layer_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    bucketing_salt TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE UNIQUE INDEX layers_layer_id_idx ON layers (layer_id);
+CREATE UNIQUE INDEX layers_key_idx ON layers (key);
+
+-- users in a running holdout's traffic are excluded from all experiments
+CREATE TABLE holdouts (
+    rec_id SERIAL PRIMARY KEY,
+    holdout_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    bucketing_salt TEXT NOT NULL,
+    traffic INT NOT NULL, -- buckets, out of 10000
+    status TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE UNIQUE INDEX holdouts_holdout_id_idx ON holdouts (holdout_id);
+CREATE UNIQUE INDEX holdouts_key_idx ON holdouts (key);
+CREATE INDEX holdouts_status_idx ON holdouts (status);
+
+-- assignments & exposures are partitioned by experiment. each experiment's
+-- partitions are created when it starts running, & detached into the
+-- archive schema when it's archived. rows of experiments without a
+-- partition land in the default partition.
+CREATE SCHEMA archive;
+
+CREATE TABLE exposures (
+    rec_id SERIAL,
     experiment_id TEXT NOT NULL,
     user_id TEXT NOT NULL,
     variant_name TEXT NOT NULL,
-    created_at TIMESTAMP NOT NULL DEFAULT NOW()
-);
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (experiment_id, rec_id)
+) PARTITION BY LIST (experiment_id);
 CREATE UNIQUE INDEX exposures_experiment_id_user_id_idx ON exposures (experiment_id, user_id);
-CREATE INDEX exposures_experiment_id_idx ON exposures (experiment_id);
 CREATE INDEX exposures_user_id_idx ON exposures (user_id);
 CREATE INDEX exposures_variant_name_idx ON exposures (variant_name);
+CREATE TABLE exposures_default PARTITION OF exposures DEFAULT;
 
-CREATE TABLE assignments (
+-- maintained alongside every write to exposures
+CREATE TABLE exposure_counts (
     rec_id SERIAL PRIMARY KEY,
     experiment_id TEXT NOT NULL,
-    user_id TEXT NOT NULL,
     variant_name TEXT NOT NULL,
-    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    bucket_date DATE NOT NULL, -- utc
+    count BIGINT NOT NULL
 );
+CREATE UNIQUE INDEX exposure_counts_experiment_id_variant_name_bucket_date_idx ON exposure_counts (experiment_id, variant_name, bucket_date);
+
+CREATE TABLE assignments (
+    rec_id SERIAL,
+    experiment_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    variant_name TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (experiment_id, rec_id)
+) PARTITION BY LIST (experiment_id);
 CREATE UNIQUE INDEX assignments_experiment_id_user_id_idx ON assignments (experiment_id, user_id);
-CREATE INDEX assignments_experiment_id_idx ON assignments (experiment_id);
 CREATE INDEX assignments_user_id_idx ON assignments (user_id);
 CREATE INDEX assignments_variant_name_idx ON assignments (variant_name);
+CREATE TABLE assignments_default PARTITION OF assignments DEFAULT;
+
+CREATE TABLE metric_events (
+    rec_id BIGSERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    properties JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE INDEX metric_events_event_rec_id_idx ON metric_events (event, rec_id);
+CREATE INDEX metric_events_user_id_event_created_at_idx ON metric_events (user_id, event, created_at);
+
+-- sufficient statistics per variant, as of the watermarks (rec_ids) of the
+-- exposures & metric events they include
+CREATE TABLE metric_aggregates (
+    rec_id SERIAL PRIMARY KEY,
+    experiment_id TEXT NOT NULL,
+    metric_hash TEXT NOT NULL,
+    exposure_watermark BIGINT NOT NULL,
+    event_watermark BIGINT NOT NULL,
+    variants JSONB NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE UNIQUE INDEX metric_aggregates_experiment_id_metric_hash_idx ON metric_aggregates (experiment_id, metric_hash);
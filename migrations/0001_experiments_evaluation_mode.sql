@@ -0,0 +1 @@
+ALTER TABLE experiments ADD COLUMN evaluation_mode TEXT NOT NULL DEFAULT 'sticky';
@@ -0,0 +1 @@
+CREATE INDEX CONCURRENTLY experiments_status_rec_id_idx ON experiments (status, rec_id);
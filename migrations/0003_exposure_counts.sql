@@ -0,0 +1,16 @@
+CREATE TABLE exposure_counts (
+    rec_id SERIAL PRIMARY KEY,
+    experiment_id TEXT NOT NULL,
+    variant_name TEXT NOT NULL,
+    bucket_date DATE NOT NULL, -- utc
+    count BIGINT NOT NULL
+);
+CREATE UNIQUE INDEX exposure_counts_experiment_id_variant_name_bucket_date_idx ON exposure_counts (experiment_id, variant_name, bucket_date);
+
+-- backfill from the existing exposures. pause exposure writes while this
+-- runs & until the code which maintains the counts is deployed, otherwise
+-- exposures written in between will be missing from the counts.
+INSERT INTO exposure_counts (experiment_id, variant_name, bucket_date, count)
+     SELECT experiment_id, variant_name, CAST(created_at AS DATE), COUNT(*)
+       FROM exposures
+   GROUP BY 1, 2, 3;
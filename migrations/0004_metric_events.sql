@@ -0,0 +1,22 @@
+CREATE TABLE metric_events (
+    rec_id BIGSERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    properties JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE INDEX metric_events_event_rec_id_idx ON metric_events (event, rec_id);
+CREATE INDEX metric_events_user_id_event_created_at_idx ON metric_events (user_id, event, created_at);
+
+-- sufficient statistics per variant, as of the watermarks (rec_ids) of the
+-- exposures & metric events they include
+CREATE TABLE metric_aggregates (
+    rec_id SERIAL PRIMARY KEY,
+    experiment_id TEXT NOT NULL,
+    metric_hash TEXT NOT NULL,
+    exposure_watermark BIGINT NOT NULL,
+    event_watermark BIGINT NOT NULL,
+    variants JSONB NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE UNIQUE INDEX metric_aggregates_experiment_id_metric_hash_idx ON metric_aggregates (experiment_id, metric_hash);
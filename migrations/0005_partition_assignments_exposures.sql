@@ -0,0 +1,91 @@
+-- partition assignments & exposures by experiment. the tables are rebuilt,
+-- so pause writes to them while this runs.
+BEGIN;
+
+CREATE SCHEMA archive;
+
+ALTER TABLE exposures RENAME TO exposures_unpartitioned;
+ALTER INDEX exposures_pkey RENAME TO exposures_unpartitioned_pkey;
+ALTER INDEX exposures_experiment_id_user_id_idx RENAME TO exposures_unpartitioned_experiment_id_user_id_idx;
+ALTER INDEX exposures_experiment_id_idx RENAME TO exposures_unpartitioned_experiment_id_idx;
+ALTER INDEX exposures_user_id_idx RENAME TO exposures_unpartitioned_user_id_idx;
+ALTER INDEX exposures_variant_name_idx RENAME TO exposures_unpartitioned_variant_name_idx;
+
+ALTER TABLE assignments RENAME TO assignments_unpartitioned;
+ALTER INDEX assignments_pkey RENAME TO assignments_unpartitioned_pkey;
+ALTER INDEX assignments_experiment_id_user_id_idx RENAME TO assignments_unpartitioned_experiment_id_user_id_idx;
+ALTER INDEX assignments_experiment_id_idx RENAME TO assignments_unpartitioned_experiment_id_idx;
+ALTER INDEX assignments_user_id_idx RENAME TO assignments_unpartitioned_user_id_idx;
+ALTER INDEX assignments_variant_name_idx RENAME TO assignments_unpartitioned_variant_name_idx;
+
+-- the existing sequences are reused, so rec_ids (& with them the
+-- watermarks of computed results) carry on from where they were
+CREATE TABLE exposures (
+    rec_id INT NOT NULL DEFAULT nextval('exposures_rec_id_seq'),
+    experiment_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    variant_name TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (experiment_id, rec_id)
+) PARTITION BY LIST (experiment_id);
+ALTER SEQUENCE exposures_rec_id_seq OWNED BY exposures.rec_id;
+CREATE UNIQUE INDEX exposures_experiment_id_user_id_idx ON exposures (experiment_id, user_id);
+CREATE INDEX exposures_user_id_idx ON exposures (user_id);
+CREATE INDEX exposures_variant_name_idx ON exposures (variant_name);
+CREATE TABLE exposures_default PARTITION OF exposures DEFAULT;
+
+CREATE TABLE assignments (
+    rec_id INT NOT NULL DEFAULT nextval('assignments_rec_id_seq'),
+    experiment_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    variant_name TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (experiment_id, rec_id)
+) PARTITION BY LIST (experiment_id);
+ALTER SEQUENCE assignments_rec_id_seq OWNED BY assignments.rec_id;
+CREATE UNIQUE INDEX assignments_experiment_id_user_id_idx ON assignments (experiment_id, user_id);
+CREATE INDEX assignments_user_id_idx ON assignments (user_id);
+CREATE INDEX assignments_variant_name_idx ON assignments (variant_name);
+CREATE TABLE assignments_default PARTITION OF assignments DEFAULT;
+
+-- partitions for every experiment which has been running; others get
+-- theirs when they're started
+DO $$
+DECLARE
+    experiment_id TEXT;
+BEGIN
+    FOR experiment_id IN
+        SELECT e.experiment_id
+          FROM experiments e
+         WHERE e.status <> 'draft'
+            OR EXISTS (SELECT 1 FROM assignments_unpartitioned a WHERE a.experiment_id = e.experiment_id)
+            OR EXISTS (SELECT 1 FROM exposures_unpartitioned x WHERE x.experiment_id = e.experiment_id)
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF exposures FOR VALUES IN (%L)',
+            'exposures_' || replace(experiment_id, '-', ''),
+            experiment_id
+        );
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF assignments FOR VALUES IN (%L)',
+            'assignments_' || replace(experiment_id, '-', ''),
+            experiment_id
+        );
+    END LOOP;
+END
+$$;
+
+INSERT INTO exposures (rec_id, experiment_id, user_id, variant_name, created_at)
+     SELECT rec_id, experiment_id, user_id, variant_name, created_at
+       FROM exposures_unpartitioned;
+INSERT INTO assignments (rec_id, experiment_id, user_id, variant_name, created_at)
+     SELECT rec_id, experiment_id, user_id, variant_name, created_at
+       FROM assignments_unpartitioned;
+
+DROP TABLE exposures_unpartitioned;
+DROP TABLE assignments_unpartitioned;
+
+ANALYZE exposures;
+ANALYZE assignments;
+
+COMMIT;
@@ -0,0 +1,30 @@
+ALTER TABLE experiments ADD COLUMN layer_id TEXT NULL;
+ALTER TABLE experiments ADD COLUMN traffic_slice JSONB NULL;
+CREATE INDEX experiments_layer_id_idx ON experiments (layer_id);
+
+CREATE TABLE layers (
+    rec_id SERIAL PRIMARY KEY,
+    layer_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    bucketing_salt TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE UNIQUE INDEX layers_layer_id_idx ON layers (layer_id);
+CREATE UNIQUE INDEX layers_key_idx ON layers (key);
+
+CREATE TABLE holdouts (
+    rec_id SERIAL PRIMARY KEY,
+    holdout_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    bucketing_salt TEXT NOT NULL,
+    traffic INT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE UNIQUE INDEX holdouts_holdout_id_idx ON holdouts (holdout_id);
+CREATE UNIQUE INDEX holdouts_key_idx ON holdouts (key);
+CREATE INDEX holdouts_status_idx ON holdouts (status);
@@ -0,0 +1 @@
+ALTER TABLE experiments ADD COLUMN user_segments JSONB NOT NULL DEFAULT '[]';
@@ -0,0 +1 @@
+CREATE INDEX CONCURRENTLY experiments_updated_at_idx ON experiments (updated_at);